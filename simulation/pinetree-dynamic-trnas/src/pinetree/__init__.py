@@ -1 +1,2 @@
 from .core import *
+from .counts import read_counts
@@ -1,15 +1,273 @@
+#include <cmath>
+#include <sstream>
+#include <stdexcept>
+
 #include "choices.hpp"
 
-void Random::seed(int seed) {
-  gen_.seed(seed);
+namespace {
+uint64_t SplitMix64(uint64_t &x) {
+  uint64_t z = (x += 0x9e3779b97f4a7c15ULL);
+  z = (z ^ (z >> 30)) * 0xbf58476d1ce4e5b9ULL;
+  z = (z ^ (z >> 27)) * 0x94d049bb133111ebULL;
+  return z ^ (z >> 31);
+}
+
+uint64_t RotateLeft(uint64_t x, int k) { return (x << k) | (x >> (64 - k)); }
+
+/**
+ * Full 64 x 64 -> 128 bit multiplication.
+ */
+void Multiply64(uint64_t a, uint64_t b, uint64_t &hi, uint64_t &lo) {
+  const uint64_t mask = 0xffffffffULL;
+  uint64_t p0 = (a & mask) * (b & mask);
+  uint64_t p1 = (a & mask) * (b >> 32);
+  uint64_t p2 = (a >> 32) * (b & mask);
+  uint64_t p3 = (a >> 32) * (b >> 32);
+  uint64_t middle = (p0 >> 32) + (p1 & mask) + (p2 & mask);
+  lo = (p0 & mask) | (middle << 32);
+  hi = p3 + (p1 >> 32) + (p2 >> 32) + (middle >> 32);
+}
+
+/**
+ * Convert 64 random bits to a double uniformly distributed in [0, 1).
+ */
+double ToDouble(uint64_t x) { return (x >> 11) * (1.0 / 9007199254740992.0); }
+
+const uint64_t kPcgMultiplierHi = 2549297995355413924ULL;
+const uint64_t kPcgMultiplierLo = 4865540595714422341ULL;
+}
+
+void Random::Xoshiro256PlusPlus::seed(uint64_t seed) {
+  for (int i = 0; i < 4; i++) {
+    s_[i] = SplitMix64(seed);
+  }
+}
+
+uint64_t Random::Xoshiro256PlusPlus::operator()() {
+  uint64_t result = RotateLeft(s_[0] + s_[3], 23) + s_[0];
+  uint64_t t = s_[1] << 17;
+  s_[2] ^= s_[0];
+  s_[3] ^= s_[1];
+  s_[1] ^= s_[2];
+  s_[0] ^= s_[3];
+  s_[2] ^= t;
+  s_[3] = RotateLeft(s_[3], 45);
+  return result;
+}
+
+void Random::Xoshiro256PlusPlus::jump() {
+  static const uint64_t kJump[] = {0x180ec6d33cfd0abaULL, 0xd5a61266f0c9392cULL,
+                                   0xa9582618e03fc9aaULL, 0x39abdc4529b1661cULL};
+  uint64_t s[4] = {0, 0, 0, 0};
+  for (int i = 0; i < 4; i++) {
+    for (int b = 0; b < 64; b++) {
+      if (kJump[i] & (uint64_t(1) << b)) {
+        for (int j = 0; j < 4; j++) {
+          s[j] ^= s_[j];
+        }
+      }
+      (*this)();
+    }
+  }
+  for (int j = 0; j < 4; j++) {
+    s_[j] = s[j];
+  }
+}
+
+namespace Random {
+std::ostream &operator<<(std::ostream &out, const Xoshiro256PlusPlus &engine) {
+  return out << engine.s_[0] << ' ' << engine.s_[1] << ' ' << engine.s_[2]
+             << ' ' << engine.s_[3];
+}
+
+std::istream &operator>>(std::istream &in, Xoshiro256PlusPlus &engine) {
+  return in >> engine.s_[0] >> engine.s_[1] >> engine.s_[2] >> engine.s_[3];
+}
+
+std::ostream &operator<<(std::ostream &out, const Pcg64 &engine) {
+  return out << engine.state_hi_ << ' ' << engine.state_lo_ << ' '
+             << engine.inc_hi_ << ' ' << engine.inc_lo_;
+}
+
+std::istream &operator>>(std::istream &in, Pcg64 &engine) {
+  return in >> engine.state_hi_ >> engine.state_lo_ >> engine.inc_hi_ >>
+         engine.inc_lo_;
+}
+}  // namespace Random
+
+void Random::Pcg64::seed(uint64_t seed, uint64_t sequence) {
+  uint64_t init_hi = SplitMix64(seed);
+  uint64_t init_lo = SplitMix64(seed);
+  state_hi_ = 0;
+  state_lo_ = 0;
+  inc_hi_ = sequence >> 63;
+  inc_lo_ = (sequence << 1) | 1;
+  Step();
+  uint64_t lo = state_lo_ + init_lo;
+  state_hi_ += init_hi + (lo < state_lo_);
+  state_lo_ = lo;
+  Step();
+}
+
+void Random::Pcg64::Step() {
+  // state = state * multiplier + increment (mod 2^128)
+  uint64_t hi, lo;
+  Multiply64(state_lo_, kPcgMultiplierLo, hi, lo);
+  hi += state_hi_ * kPcgMultiplierLo + state_lo_ * kPcgMultiplierHi;
+  uint64_t sum = lo + inc_lo_;
+  state_hi_ = hi + inc_hi_ + (sum < lo);
+  state_lo_ = sum;
+}
+
+uint64_t Random::Pcg64::operator()() {
+  Step();
+  uint64_t xored = state_hi_ ^ state_lo_;
+  int rot = state_hi_ >> 58;
+  return (xored >> rot) | (xored << ((64 - rot) & 63));
+}
+
+void Random::Generator::engine(const std::string &engine) {
+  if (engine == "mt19937") {
+    engine_ = Engine::kMt19937;
+  } else if (engine == "xoshiro256++") {
+    engine_ = Engine::kXoshiro256PlusPlus;
+  } else if (engine == "pcg64") {
+    engine_ = Engine::kPcg64;
+  } else {
+    throw std::invalid_argument("Unknown random number generator '" + engine +
+                                "'. Use 'mt19937', 'xoshiro256++', or "
+                                "'pcg64'.");
+  }
+  engine_name_ = engine;
+  seeded_ = false;
+}
+
+void Random::Generator::seed(int seed, int stream) {
+  if (stream < 0) {
+    throw std::invalid_argument("Random number stream cannot be negative.");
+  }
+  // Treat seeds as unsigned 32-bit values, as std::mt19937 does
+  uint64_t seed64 = static_cast<uint32_t>(seed);
+  switch (engine_) {
+    case Engine::kMt19937:
+      if (stream == 0) {
+        gen_.seed(seed);
+      } else {
+        std::seed_seq sequence{seed, stream};
+        gen_.seed(sequence);
+      }
+      dis_.reset();
+      break;
+    case Engine::kXoshiro256PlusPlus:
+      xoshiro_.seed(seed64);
+      for (int i = 0; i < stream; i++) {
+        xoshiro_.jump();
+      }
+      break;
+    case Engine::kPcg64:
+      pcg_.seed(seed64, stream);
+      break;
+  }
   seeded_ = true;
 }
 
-double Random::random() {
+std::string Random::Generator::state() const {
+  std::ostringstream out;
+  out << engine_name_ << ' ' << seeded_ << ' ';
+  switch (engine_) {
+    case Engine::kXoshiro256PlusPlus:
+      out << xoshiro_;
+      break;
+    case Engine::kPcg64:
+      out << pcg_;
+      break;
+    default:
+      out << gen_ << ' ' << dis_;
+  }
+  return out.str();
+}
+
+void Random::Generator::state(const std::string &state) {
+  std::istringstream in(state);
+  std::string engine_name;
+  in >> engine_name;
+  if (engine_name != engine_name_) {
+    throw std::invalid_argument("Random number generator state is for engine '" +
+                                engine_name + "', but this generator uses '" +
+                                engine_name_ + "'.");
+  }
+  bool seeded = false;
+  in >> seeded;
+  switch (engine_) {
+    case Engine::kXoshiro256PlusPlus:
+      in >> xoshiro_;
+      break;
+    case Engine::kPcg64:
+      in >> pcg_;
+      break;
+    default:
+      in >> gen_ >> dis_;
+  }
+  if (!in) {
+    throw std::invalid_argument("Invalid random number generator state.");
+  }
+  seeded_ = seeded;
+}
+
+double Random::Generator::random() {
   if (!seeded_) {
     std::random_device rd;
-    gen_.seed(rd());
-    seeded_ = true;
+    seed(rd());
+  }
+  switch (engine_) {
+    case Engine::kXoshiro256PlusPlus:
+      return ToDouble(xoshiro_());
+    case Engine::kPcg64:
+      return ToDouble(pcg_());
+    default:
+      return dis_(gen_);
   }
-  return dis_(gen_);
-}
\ No newline at end of file
+}
+
+int Random::Generator::Poisson(double mean) {
+  if (mean <= 0) {
+    return 0;
+  }
+  if (mean < 10) {
+    // Inversion by sequential search
+    double p = std::exp(-mean);
+    double cumulative = p;
+    double u = random();
+    int k = 0;
+    while (u > cumulative && p > 0) {
+      k++;
+      p *= mean / k;
+      cumulative += p;
+    }
+    return k;
+  }
+  // PTRS (Hoermann 1993, "The transformed rejection method for generating
+  // Poisson random variables")
+  double slam = std::sqrt(mean);
+  double loglam = std::log(mean);
+  double b = 0.931 + 2.53 * slam;
+  double a = -0.059 + 0.02483 * b;
+  double invalpha = 1.1239 + 1.1328 / (b - 3.4);
+  double vr = 0.9277 - 3.6224 / (b - 2);
+  while (true) {
+    double u = random() - 0.5;
+    double v = random();
+    double us = 0.5 - std::fabs(u);
+    double k = std::floor((2 * a / us + b) * u + mean + 0.43);
+    if (us >= 0.07 && v <= vr) {
+      return k;
+    }
+    if (k < 0 || (us < 0.013 && v > us)) {
+      continue;
+    }
+    if (std::log(v) + std::log(invalpha) - std::log(a / (us * us) + b) <=
+        -mean + k * loglam - std::lgamma(k + 1)) {
+      return k;
+    }
+  }
+}
@@ -2,43 +2,148 @@
 #define SRC_CHOICES_HPP_
 
 #include <algorithm>
+#include <cstdint>
+#include <iostream>
 #include <numeric>
 #include <random>
+#include <string>
+#include <vector>
 
 namespace Random {
-static bool seeded_ = false;
-static std::mt19937 gen_;
-static std::uniform_real_distribution<> dis_(0, 1);
-void seed(int seed);
-double random();
-template <typename T>
-int WeightedChoiceIndex(const std::vector<T> &population,
-                        const std::vector<double> &weights) {
-  double random_num = random();
-  // Calculate cumulative sums for weights
-  std::vector<double> cum_weights(weights.size());
-  std::partial_sum(weights.begin(), weights.end(), cum_weights.begin());
-  // Bisect cumulative weights vector
-  std::vector<double>::iterator upper;
-  upper = std::upper_bound(cum_weights.begin(), cum_weights.end(),
-                           random_num * cum_weights.back());
-  // Calculate index and return list item at index
-  int index = (upper - cum_weights.begin());
-  return index;
-}
-template <typename T>
-T WeightedChoice(const std::vector<T> &population,
-                 const std::vector<double> &weights) {
-  int index = WeightedChoiceIndex(population, weights);
-  return population[index];
-}
+/**
+ * xoshiro256++ generator (Blackman and Vigna). Fast, with a period of
+ * 2^256 - 1 and a jump function for creating non-overlapping streams.
+ */
+class Xoshiro256PlusPlus {
+ public:
+  /**
+   * Initialize the 256-bit state from a 64-bit seed using splitmix64.
+   */
+  void seed(uint64_t seed);
+  /**
+   * Advance the state by 2^128 draws.
+   */
+  void jump();
+  uint64_t operator()();
+  /**
+   * Write or read the state as text, like the standard library engines.
+   */
+  friend std::ostream &operator<<(std::ostream &out,
+                                  const Xoshiro256PlusPlus &engine);
+  friend std::istream &operator>>(std::istream &in,
+                                  Xoshiro256PlusPlus &engine);
 
-template <typename T> T WeightedChoice(const std::vector<T> &population) {
-  // Grab random number from python's random module
-  double random_num = random();
-  int index = random_num * population.size();
-  return population[index];
-}
+ private:
+  uint64_t s_[4] = {0, 0, 0, 0};
+};
+
+/**
+ * PCG64 generator (O'Neill's PCG XSL RR 128/64). The 128-bit state arithmetic
+ * is written out with 64-bit integers so that it compiles everywhere.
+ */
+class Pcg64 {
+ public:
+  /**
+   * Initialize the generator, following pcg_setseq_128_srandom_r. Each value
+   * of sequence selects a different, independent stream.
+   *
+   * @param seed 64-bit seed
+   * @param sequence stream selector
+   */
+  void seed(uint64_t seed, uint64_t sequence);
+  uint64_t operator()();
+  friend std::ostream &operator<<(std::ostream &out, const Pcg64 &engine);
+  friend std::istream &operator>>(std::istream &in, Pcg64 &engine);
+
+ private:
+  uint64_t state_hi_ = 0;
+  uint64_t state_lo_ = 0;
+  uint64_t inc_hi_ = 0;
+  uint64_t inc_lo_ = 1;
+  void Step();
+};
+
+/**
+ * Random number generator. Each Model owns its own Generator so that several
+ * models can be simulated independently (and concurrently) in one process.
+ */
+class Generator {
+ public:
+  /**
+   * Select the underlying pseudo-random engine: "mt19937" (default),
+   * "xoshiro256++", or "pcg64". Selecting an engine discards any seed.
+   */
+  void engine(const std::string &engine);
+  const std::string &engine() const { return engine_name_; }
+  /**
+   * Seed the generator. If a generator is used before it has been seeded, it
+   * is seeded from std::random_device.
+   *
+   * Different streams of the same seed are independent of each other, so
+   * that replicate simulations can be numbered 0, 1, 2, ... and reproduced
+   * regardless of how they are scheduled. Stream 0 of the mt19937 engine is
+   * identical to seeding std::mt19937 directly.
+   *
+   * @param seed seed for the random number generator
+   * @param stream index of independent stream
+   */
+  void seed(int seed, int stream = 0);
+  /**
+   * Complete state of the generator as text, so that a saved generator
+   * continues with the same random numbers. Restoring a state saved with a
+   * different engine throws std::invalid_argument.
+   */
+  std::string state() const;
+  void state(const std::string &state);
+  /**
+   * Draw a random number uniformly distributed in [0, 1).
+   */
+  double random();
+  /**
+   * Draw a Poisson-distributed random integer. Uses inversion for small means
+   * and Hoermann's transformed rejection method (PTRS) for large means, so
+   * that it works with every engine.
+   *
+   * @param mean mean (and variance) of the distribution
+   */
+  int Poisson(double mean);
+  template <typename T>
+  int WeightedChoiceIndex(const std::vector<T> &population,
+                          const std::vector<double> &weights) {
+    double random_num = random();
+    // Calculate cumulative sums for weights
+    std::vector<double> cum_weights(weights.size());
+    std::partial_sum(weights.begin(), weights.end(), cum_weights.begin());
+    // Bisect cumulative weights vector
+    std::vector<double>::iterator upper;
+    upper = std::upper_bound(cum_weights.begin(), cum_weights.end(),
+                             random_num * cum_weights.back());
+    // Calculate index and return list item at index
+    int index = (upper - cum_weights.begin());
+    return index;
+  }
+  template <typename T>
+  T WeightedChoice(const std::vector<T> &population,
+                   const std::vector<double> &weights) {
+    int index = WeightedChoiceIndex(population, weights);
+    return population[index];
+  }
+  template <typename T> T WeightedChoice(const std::vector<T> &population) {
+    double random_num = random();
+    int index = random_num * population.size();
+    return population[index];
+  }
+
+ private:
+  enum class Engine { kMt19937, kXoshiro256PlusPlus, kPcg64 };
+  Engine engine_ = Engine::kMt19937;
+  std::string engine_name_ = "mt19937";
+  bool seeded_ = false;
+  std::mt19937 gen_;
+  std::uniform_real_distribution<> dis_{0, 1};
+  Xoshiro256PlusPlus xoshiro_;
+  Pcg64 pcg_;
+};
 }
 
-#endif // SRC_CHOICES_HPP_
\ No newline at end of file
+#endif // SRC_CHOICES_HPP_
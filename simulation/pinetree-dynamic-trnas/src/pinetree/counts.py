@@ -0,0 +1,61 @@
+"""Read species counts written by ``Model.simulate``."""
+
+COLUMNS = ["time", "species", "protein", "transcript", "ribo_density",
+           "collisions"]
+
+
+def read_counts(path, dense=True):
+    """Read a counts file into a pandas DataFrame.
+
+    Text (``.tsv``) and NumPy (``.npz``) output are both returned in the
+    layout of the text output: one row per species and output time, sorted by
+    time and then by species name. The format is detected from the contents
+    of the file, not its name.
+
+    Args:
+        path (str): Output file written by ``Model.simulate``.
+        dense (bool): If ``True`` (default), rows that sparse output left out
+            because counts did not change are filled in from the previous
+            row of the same species. If ``False``, sparse output is returned
+            as stored.
+
+    Returns:
+        pandas.DataFrame: Columns ``time``, ``species``, ``protein``,
+        ``transcript``, ``ribo_density``, and ``collisions``.
+    """
+    import numpy as np
+    import pandas as pd
+
+    if not _is_archive(path):
+        return pd.read_csv(path, sep="\t")
+    with np.load(path) as data:
+        columns = {name: data[name] for name in COLUMNS if name != "species"}
+        columns["species"] = data["species_names"][data["species"]]
+        output_time = data["output_time"]
+        sparse = bool(data["sparse"][0])
+    if sparse and dense:
+        columns = _fill_forward(columns, output_time)
+    return pd.DataFrame({name: columns[name] for name in COLUMNS})
+
+
+def _is_archive(path):
+    """Does the file start like a zip archive (i.e. ``.npz`` output)?"""
+    with open(path, "rb") as stream:
+        return stream.read(4) == b"PK\x03\x04"
+
+
+def _fill_forward(columns, output_time):
+    """Expand sparse columns to every output time after a species appears."""
+    import numpy as np
+
+    names, rows = np.unique(columns["species"], return_inverse=True)
+    steps = np.searchsorted(output_time, columns["time"])
+    # Index of the most recent stored row of each species at each output time
+    latest = np.full((len(output_time), len(names)), -1)
+    latest[steps, rows] = np.arange(len(steps))
+    latest = np.maximum.accumulate(latest, axis=0)
+    step, species = np.nonzero(latest >= 0)
+    source = latest[step, species]
+    dense = {name: values[source] for name, values in columns.items()}
+    dense["time"] = output_time[step]
+    return dense
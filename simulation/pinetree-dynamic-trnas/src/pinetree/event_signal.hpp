@@ -6,73 +6,85 @@
 #ifndef SIGNAL_HPP
 #define SIGNAL_HPP
 
-#include <functional>
-#include <map>
-#include <memory>
+#include <algorithm>
+#include <vector>
 
 // A signal object may call multiple slots with the
 // same signature. You can connect functions to the signal
 // which will be called when the emit() method on the
 // signal object is invoked. Any argument passed to emit()
 // will be passed to the given functions.
+//
+// Signals fire for every change of a species count, so slots are plain
+// function pointers kept in a vector rather than std::functions in a map.
+// Declare arguments as const references (e.g.
+// Signal<const std::shared_ptr<Reaction> &>) so that emitting does not copy
+// them.
 
 template <typename... Args> class Signal {
 
 public:
+  // function called with the instance it was connected with
+  typedef void (*Function)(void *, Args...);
+
   Signal() : current_id_(0) {}
 
   // copy creates new signal
   Signal(Signal const &other) : current_id_(0) {}
 
-  // connects a member function to this Signal
-  template <typename T> int ConnectMember(T *inst, void (T::*func)(Args...)) {
-    return Connect([=](Args... args) { (inst->*func)(args...); });
-  }
-
-  // connects a const member function to this Signal
-  template <typename T>
-  int ConnectMember(T *inst, void (T::*func)(Args...) const) {
-    return Connect([=](Args... args) { (inst->*func)(args...); });
+  // connects a member function to this Signal, e.g.
+  //   signal.ConnectMember<Gillespie, &Gillespie::UpdatePropensity>(&g);
+  // The member function is a template argument, so the slot calls it
+  // directly.
+  template <typename T, void (T::*func)(Args...)>
+  int ConnectMember(T *inst) const {
+    return Connect(inst, &CallMember<T, func>);
   }
 
-  // smart pointer support
-  template <typename T>
-  int ConnectMember(std::shared_ptr<T> inst, void (T::*func)(Args...)) {
-    return Connect([=](Args... args) { std::mem_fn(func)(inst, args...); });
-  }
-
-  // smart pointer support
-  template <typename T>
-  int ConnectMember(std::shared_ptr<T> inst, void (T::*func)(Args...) const) {
-    return Connect([=](Args... args) { std::mem_fn(func)(inst, args...); });
-  }
-
-  // connects a std::function to the signal. The returned
+  // connects a function to the signal. The returned
   // value can be used to disconnect the function again
-  int Connect(std::function<void(Args...)> const &slot) const {
-    slots_.insert(std::make_pair(++current_id_, slot));
+  int Connect(void *inst, Function func) const {
+    slots_.push_back(Slot{++current_id_, inst, func});
     return current_id_;
   }
 
   // disconnects a previously connected function
-  void Disconnect(int id) const { slots_.erase(id); }
+  void Disconnect(int id) const {
+    slots_.erase(std::remove_if(slots_.begin(), slots_.end(),
+                                [id](const Slot &slot) { return slot.id == id; }),
+                 slots_.end());
+  }
 
   // disconnects all previously connected functions
   void DisconnectAll() const { slots_.clear(); }
 
-  // calls all connected functions
+  // calls all connected functions, in the order they were connected
   void Emit(Args... p) {
-    for (auto it : slots_) {
-      it.second(p...);
+    for (const auto &slot : slots_) {
+      slot.func(slot.inst, p...);
     }
   }
 
   // assignment creates new Signal
-  Signal &operator=(Signal const &other) { DisconnectAll(); }
+  Signal &operator=(Signal const &other) {
+    DisconnectAll();
+    return *this;
+  }
 
 private:
-  mutable std::map<int, std::function<void(Args...)>> slots_;
+  struct Slot {
+    int id;
+    void *inst;
+    Function func;
+  };
+
+  template <typename T, void (T::*func)(Args...)>
+  static void CallMember(void *inst, Args... args) {
+    (static_cast<T *>(inst)->*func)(args...);
+  }
+
+  mutable std::vector<Slot> slots_;
   mutable int current_id_;
 };
 
-#endif /* SIGNAL_HPP */
\ No newline at end of file
+#endif /* SIGNAL_HPP */
@@ -5,26 +5,44 @@
 #include <vector>
 
 #include "feature.hpp"
-#include "tracker.hpp"
 
 FixedElement::FixedElement(const std::string &name, int start, int stop,
                            const std::map<std::string, double> &interactions)
-    : name_(name),
+    : layout_(std::make_shared<Layout>()),
       start_(start),
       stop_(stop),
-      interactions_(interactions),
       covered_(0),
-      old_covered_(0),
-      reading_frame_(-1) {
+      old_covered_(0) {
+  layout_->name = name;
+  layout_->interactions = interactions;
   if (start_ < 0 || stop_ < 0) {
     throw std::invalid_argument(
-        "Fixed element '" + name_ +
+        "Fixed element '" + name +
         "' has a negative start and/or stop coordinate.");
   }
 }
 
 FixedElement::~FixedElement(){};
 
+FixedElement::Layout &FixedElement::MutableLayout() {
+  if (layout_.use_count() > 1) {
+    layout_ = std::make_shared<Layout>(*layout_);
+  }
+  return *layout_;
+}
+
+void FixedElement::SaveState(StateWriter &out) const {
+  out.Write(covered_);
+  out.Write(old_covered_);
+  out.Write(first_exposure_);
+}
+
+void FixedElement::LoadState(StateReader &in) {
+  covered_ = in.Read<int>();
+  old_covered_ = in.Read<int>();
+  first_exposure_ = in.Read<bool>();
+}
+
 BindingSite::BindingSite(const std::string &name, int start, int stop,
                          const std::map<std::string, double> &interactions)
     : FixedElement(name, start, stop, interactions) {
@@ -32,20 +50,30 @@ BindingSite::BindingSite(const std::string &name, int start, int stop,
   for (auto const &item : interactions) {
     if (item.second < 0) {
       throw std::invalid_argument(
-          "Binding site '" + name_ +
+          "Binding site '" + name +
           "' must have non-negative interaction rate constants.");
     }
   }
 }
 
 bool BindingSite::CheckInteraction(const std::string &name) {
-  return interactions_.count(name);
+  return interactions().count(name);
 }
 
 BindingSite::Ptr BindingSite::Clone() const {
   return std::make_shared<BindingSite>(*this);
 }
 
+void BindingSite::SaveState(StateWriter &out) const {
+  FixedElement::SaveState(out);
+  out.Write(degraded_);
+}
+
+void BindingSite::LoadState(StateReader &in) {
+  FixedElement::LoadState(in);
+  degraded_ = in.Read<bool>();
+}
+
 void BindingSite::Degrade() {
   if (covered_ == 0) {
     std::runtime_error(
@@ -63,18 +91,18 @@ ReleaseSite::ReleaseSite(const std::string &name, int start, int stop,
   for (auto const &item : interactions) {
     if (item.second < 0 || item.second > 1) {
       throw std::invalid_argument(
-          "Release site '" + name_ +
+          "Release site '" + name +
           "' must have efficiency values between 0.0 and 1.0.");
     }
   }
 }
 
 bool ReleaseSite::CheckInteraction(const std::string &name, int reading_frame) {
-  if (interactions_.count(name) == 1) {
-    if (reading_frame_ == -1) {
+  if (interactions().count(name) == 1) {
+    if (layout_->reading_frame == -1) {
       return true;
     }
-    if (reading_frame == reading_frame_) {
+    if (reading_frame == layout_->reading_frame) {
       return true;
     }
   }
@@ -85,10 +113,29 @@ ReleaseSite::Ptr ReleaseSite::Clone() const {
   return std::make_shared<ReleaseSite>(*this);
 }
 
+void ReleaseSite::SaveState(StateWriter &out) const {
+  FixedElement::SaveState(out);
+  out.Write(readthrough_);
+}
+
+void ReleaseSite::LoadState(StateReader &in) {
+  FixedElement::LoadState(in);
+  readthrough_ = in.Read<bool>();
+}
+
 MobileElement::MobileElement(const std::string &name, int footprint, double speed)
     : name_(name), footprint_(footprint), speed_(speed), reading_frame_(-1) {
   start_ = 0;
   stop_ = start_ + footprint_;
+  if (name_ == "__ribosome") {
+    kind_ = Kind::kRibosome;
+  } else if (name_ == "__rnase") {
+    kind_ = Kind::kRnase;
+  } else if (name_ == "__mask") {
+    kind_ = Kind::kMask;
+  } else {
+    kind_ = Kind::kPolymerase;
+  }
   if (footprint_ < 0) {
     throw std::invalid_argument("Mobile element '" + name_ +
                                 "' has a negative footprint size.");
@@ -107,25 +154,14 @@ Polymerase::Polymerase(const std::string &name, int footprint, double speed)
 }
 
 void Polymerase::Move() {
-
-  if (name_ == "__ribosome" && !SpeciesTracker::Instance().codon_map().empty()) {
-    start_ += 3;
-    stop_ += 3;
-  } else {
-    start_++;
-    stop_++;
-  }
+  start_ += step_;
+  stop_ += step_;
 }
 
 void Polymerase::MoveBack() {
   if (start_ > 0) {
-    if (name_ == "__ribosome" && !SpeciesTracker::Instance().codon_map().empty()) {
-    start_ -= 3;
-    stop_ -= 3;
-    } else {
-      start_--;
-      stop_--;
-    }
+    start_ -= step_;
+    stop_ -= step_;
   } else {
     throw std::runtime_error(
         "Attempting to assign negative start position to Polymerase object '" +
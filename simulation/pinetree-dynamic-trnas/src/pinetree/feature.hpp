@@ -4,10 +4,13 @@
 #define SRC_FEATURE_HPP_
 
 #include <iostream>
+#include <map>
+#include <memory>
 #include <string>
 #include <vector>
 
 #include "event_signal.hpp"
+#include "state.hpp"
 
 /**
  * Abstract class from which all fixed elements on a polymer inherit. These
@@ -67,21 +70,55 @@ class FixedElement : public std::enable_shared_from_this<FixedElement> {
   /**
    * Getters and setters
    */
-  const std::string &gene() const { return gene_; }
-  void gene(const std::string &gene) { gene_ = gene; }
-  std::string const &name() const { return name_; }
+  const std::string &gene() const { return layout_->gene; }
+  void gene(const std::string &gene) { MutableLayout().gene = gene; }
+  std::string const &name() const { return layout_->name; }
   int start() const { return start_; }
   int stop() const { return stop_; }
-  int reading_frame() const { return reading_frame_; }
-  void reading_frame(int reading_frame) { reading_frame_ = reading_frame; }
+  int reading_frame() const { return layout_->reading_frame; }
+  void reading_frame(int reading_frame) {
+    MutableLayout().reading_frame = reading_frame;
+  }
   bool first_exposure() const { return first_exposure_; }
   void first_exposure(bool first_exposure) { first_exposure_ = first_exposure; }
+  /**
+   * Write or restore the covering state of this element (see
+   * Model::SaveState()).
+   */
+  virtual void SaveState(StateWriter &out) const;
+  virtual void LoadState(StateReader &in);
 
  protected:
   /**
-   * Name of this feature.
-   */
-  std::string name_;
+   * Properties of an element that do not change during a simulation. Copies
+   * of an element (e.g. on every transcript produced from a genome) share
+   * one layout, which is copied before it is modified.
+   */
+  struct Layout {
+    /**
+     * Name of this feature.
+     */
+    std::string name;
+    /**
+     * Vector of names of other features/polymerases that this feature
+     * interacts with.
+     */
+    std::map<std::string, double> interactions;
+    /**
+     * Name of gene associated with this FixedElement. This is the value that
+     * will get reported to the species tracker.
+     */
+    std::string gene;
+    /**
+     * Reading frame for FixedElement.
+     */
+    int reading_frame = -1;
+  };
+  std::shared_ptr<Layout> layout_;
+  Layout &MutableLayout();
+  const std::map<std::string, double> &interactions() const {
+    return layout_->interactions;
+  }
   /**
    * The start site of the feature. Usually the most upstream site position.
    */
@@ -90,16 +127,6 @@ class FixedElement : public std::enable_shared_from_this<FixedElement> {
    * The stop site of the feature. Usually the most downstream site position.
    */
   int stop_;
-  /**
-   * Vector of names of other features/polymerases that this feature interacts
-   * with.
-   */
-  std::map<std::string, double> interactions_;
-  /**
-   * Name of gene associated with this FixedElement. This is the value that
-   * will get reported to the species tracker.
-   */
-  std::string gene_;
   /**
    * Count of how many features are currently covering this element.
    */
@@ -108,10 +135,6 @@ class FixedElement : public std::enable_shared_from_this<FixedElement> {
    * Used to cache old covering count to then test for changes in state.
    */
   int old_covered_;
-  /**
-   * Reading frame for FixedElement.
-   */
-  int reading_frame_;
   /**
    * Has the site been exposed before?
    */
@@ -145,10 +168,10 @@ class BindingSite : public FixedElement {
   typedef std::shared_ptr<BindingSite> Ptr;
   typedef std::vector<std::shared_ptr<BindingSite>> VecPtr;
   /**
-   * Create a deep copy of BindingSite. Used by Polymer when creating
-   * transcripts from a transcript template.
+   * Create a copy of BindingSite with its own covering state. Used by Polymer
+   * when creating transcripts from a transcript template.
    *
-   * @return std::shared_ptr<BindingSite> pointer to deep copy of BindingSite
+   * @return std::shared_ptr<BindingSite> pointer to copy of BindingSite
    */
   BindingSite::Ptr Clone() const;
   /**
@@ -164,6 +187,8 @@ class BindingSite : public FixedElement {
    */
   void Degrade();
   bool degraded() { return degraded_; }
+  void SaveState(StateWriter &out) const override;
+  void LoadState(StateReader &in) override;
 
  private:
   /**
@@ -197,10 +222,10 @@ class ReleaseSite : public FixedElement {
   typedef std::shared_ptr<ReleaseSite> Ptr;
   typedef std::vector<std::shared_ptr<ReleaseSite>> VecPtr;
   /**
-   * Create a deep copy of ReleaseSite. Used by Polymer when creating
-   * transcripts from a transcript template.
+   * Create a copy of ReleaseSite with its own covering state. Used by Polymer
+   * when creating transcripts from a transcript template.
    *
-   * @return std::shared_ptr<BindingSite> pointer to deep copy of BindingSite
+   * @return std::shared_ptr<ReleaseSite> pointer to copy of ReleaseSite
    */
   ReleaseSite::Ptr Clone() const;
   /**
@@ -219,8 +244,11 @@ class ReleaseSite : public FixedElement {
   bool readthrough() const { return readthrough_; }
   void readthrough(bool readthrough) { readthrough_ = readthrough; }
   double efficiency(const std::string &pol_name) {
-    return interactions_[pol_name];
+    auto it = interactions().find(pol_name);
+    return (it == interactions().end()) ? 0.0 : it->second;
   }
+  void SaveState(StateWriter &out) const override;
+  void LoadState(StateReader &in) override;
 
  private:
   /**
@@ -253,6 +281,12 @@ class MobileElement : public std::enable_shared_from_this<MobileElement> {
    */
   typedef std::shared_ptr<MobileElement> Ptr;
   typedef std::vector<std::shared_ptr<MobileElement>> VecPtr;
+  /**
+   * Kinds of mobile elements that polymers treat differently, determined from
+   * the name ("__ribosome", "__rnase", or "__mask"; anything else is an RNA
+   * polymerase) so that polymers do not compare names on every move.
+   */
+  enum class Kind { kPolymerase, kRibosome, kRnase, kMask };
   /**
    * Move one position forward.
    */
@@ -265,10 +299,21 @@ class MobileElement : public std::enable_shared_from_this<MobileElement> {
    * Getters and setters.
    */
   std::string const &name() const { return name_; }
+  Kind kind() const { return kind_; }
+  /**
+   * ID of the species this element was bound from (see
+   * SpeciesTracker::Intern()), or -1 if it is not known.
+   */
+  int species_id() const { return species_id_; }
+  void species_id(int species_id) { species_id_ = species_id; }
   int start() const { return start_; }
   int stop() const { return stop_; }
   void start(int start) { start_ = start; }
   void stop(int stop) { stop_ = stop; }
+  /**
+   * Masks and RNases change their footprint as they move.
+   */
+  void footprint(int footprint) { footprint_ = footprint; }
   double speed() const { return speed_; }
   int footprint() const { return footprint_; }
   int reading_frame() const { return reading_frame_; }
@@ -281,6 +326,8 @@ class MobileElement : public std::enable_shared_from_this<MobileElement> {
    * Name of this feature.
    */
   std::string name_;
+  Kind kind_;
+  int species_id_ = -1;
 
   /**
    * The start site of the feature. Usually the most upstream site position.
@@ -340,6 +387,15 @@ class Polymerase : public MobileElement {
    * Move one positioin back.
    */
   void MoveBack();
+  /**
+   * Number of positions moved by Move() and MoveBack(). Ribosomes move one
+   * codon (3 positions) at a time in simulations with dynamic tRNAs.
+   */
+  int step() const { return step_; }
+  void step(int step) { step_ = step; }
+
+ private:
+  int step_ = 1;
 };
 
 /**
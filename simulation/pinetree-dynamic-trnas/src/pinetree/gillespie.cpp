@@ -1,15 +1,29 @@
+#include <algorithm>
+#include <cmath>
+#include <limits>
+#include <stdexcept>
+
 #include "gillespie.hpp"
 #include "choices.hpp"
 #include "tracker.hpp"
 
 void Gillespie::LinkReaction(Reaction::Ptr reaction) {
-  auto it = std::find(reactions_.begin(), reactions_.end(), reaction);
-  if (it == reactions_.end()) {
+  if (!Contains(reaction)) {
     reaction->index(reactions_.size());
     double new_prop = reaction->CalculatePropensity();
     alpha_list_.push_back(new_prop);
     alpha_sum_ += new_prop;
     reactions_.push_back(reaction);
+    if (use_tree_) {
+      tree_.Push(new_prop);
+    }
+    if (queue_ready_) {
+      queue_.Push(DrawTime(new_prop));
+    }
+    auto species_reaction = std::dynamic_pointer_cast<SpeciesReaction>(reaction);
+    if (species_reaction) {
+      species_reactions_.push_back(species_reaction);
+    }
   }
 }
 
@@ -18,29 +32,55 @@ void Gillespie::DeleteReaction(int index) {
     throw std::range_error(
         "Gillespie: Reaction index out of range for reaction deletion.");
   }
-  // Update alpha sum
-  alpha_sum_ -= reactions_[index]->CalculatePropensity();
-  // Remove from alpha list
-  alpha_list_.erase(alpha_list_.begin() + index);
-  // Remove from reactions list
-  reactions_.erase(reactions_.begin() + index);
+  // Remove the reaction's propensity from the alpha sum. (Its
+  // CalculatePropensity() no longer reports the propensity once it is flagged
+  // for removal, which used to leave it in the sum forever.)
+  alpha_sum_ -= alpha_list_[index];
+  // Only species reactions are listed in species_reactions_; deleted polymer
+  // wrappers skip the search
+  if (std::dynamic_pointer_cast<SpeciesReaction>(reactions_[index])) {
+    auto it = std::find(species_reactions_.begin(), species_reactions_.end(),
+                        reactions_[index]);
+    if (it != species_reactions_.end()) {
+      species_reactions_.erase(it);
+    }
+  }
+  // Move the last reaction into the freed slot and shrink both lists by one,
+  // so that removal is O(1) and only one reaction index changes
+  int last = reactions_.size() - 1;
+  if (index != last) {
+    reactions_[index] = reactions_[last];
+    alpha_list_[index] = alpha_list_[last];
+    reactions_[index]->index(index);
+    if (use_tree_) {
+      tree_.Set(index, alpha_list_[index]);
+    }
+    if (queue_ready_) {
+      queue_.Set(index, queue_.get(last));
+    }
+  }
+  reactions_.pop_back();
+  alpha_list_.pop_back();
+  if (use_tree_) {
+    tree_.Pop();
+  }
+  if (queue_ready_) {
+    queue_.Pop();
+  }
 }
 
-void Gillespie::UpdatePropensity(Reaction::Ptr reaction) {
-  // if (index >= reactions_.size() || index >= alpha_list_.size() || index < 0)
-  // {
-  //  throw std::range_error(
-  //      "Gillespie: Reaction index out of range for propensity update.");
-  // }
-  // double new_prop = reactions_[index]->CalculatePropensity();
-  // double diff = new_prop - alpha_list_[index];
-  // alpha_sum_ += diff;
-  // alpha_list_[index] = new_prop;
+void Gillespie::UpdatePropensity(const Reaction::Ptr &reaction) {
   double alpha_diff = reaction->CalculatePropensity();
-  auto it = std::find(reactions_.begin(), reactions_.end(), reaction);
-  if (it != reactions_.end()) {
-    auto index = std::distance(reactions_.begin(), it);
+  if (Contains(reaction)) {
+    int index = reaction->index();
+    double old_alpha = alpha_list_[index];
     alpha_list_[index] += alpha_diff;
+    if (use_tree_) {
+      tree_.Set(index, alpha_list_[index]);
+    }
+    if (queue_ready_) {
+      RescaleTime(index, old_alpha);
+    }
   } else {
     // Don't throw an error unless everything has been initialized
     if (initialized_ == true) {
@@ -51,6 +91,56 @@ void Gillespie::UpdatePropensity(Reaction::Ptr reaction) {
   alpha_sum_ += alpha_diff;
 }
 
+bool Gillespie::Contains(const Reaction::Ptr &reaction) const {
+  int index = reaction->index();
+  return index >= 0 && index < reactions_.size() &&
+         reactions_[index] == reaction;
+}
+
+void Gillespie::CheckConsistency() const {
+  if (alpha_list_.size() != reactions_.size()) {
+    throw std::logic_error(
+        "Gillespie: propensity list and reaction list differ in size.");
+  }
+  // The running total may differ from the propensity list by rounding only
+  double sum = 0;
+  double magnitude = 1;
+  for (double alpha : alpha_list_) {
+    sum += alpha;
+    magnitude += std::fabs(alpha);
+  }
+  if (std::fabs(alpha_sum_ - sum) > 1e-6 * magnitude) {
+    throw std::logic_error("Gillespie: running propensity sum " +
+                           std::to_string(alpha_sum_) +
+                           " does not match propensity list sum " +
+                           std::to_string(sum) + ".");
+  }
+  for (int i = 0; i < reactions_.size(); i++) {
+    if (reactions_[i]->index() != i) {
+      throw std::logic_error("Gillespie: reaction at position " +
+                             std::to_string(i) + " has stored index " +
+                             std::to_string(reactions_[i]->index()) + ".");
+    }
+  }
+  if (use_tree_) {
+    if (tree_.size() != alpha_list_.size()) {
+      throw std::logic_error(
+          "Gillespie: sum tree and propensity list differ in size.");
+    }
+    for (int i = 0; i < alpha_list_.size(); i++) {
+      if (tree_.get(i) != alpha_list_[i]) {
+        throw std::logic_error(
+            "Gillespie: sum tree is out of date at position " +
+            std::to_string(i) + ".");
+      }
+    }
+  }
+  if (queue_ready_ && queue_.size() != reactions_.size()) {
+    throw std::logic_error(
+        "Gillespie: reaction queue and reaction list differ in size.");
+  }
+}
+
 double Gillespie::IndexUpdatePropensity(Reaction::Ptr reaction, int index) {
   double alpha_diff = reaction->CalculatePropensity();
   alpha_list_[index] += alpha_diff;
@@ -59,7 +149,17 @@ double Gillespie::IndexUpdatePropensity(Reaction::Ptr reaction, int index) {
   return alpha_diff;
 }
 
-void Gillespie::Iterate() {
+void Gillespie::Iterate(double horizon) {
+  if (use_tau_leap_) {
+    IterateTauLeap(horizon);
+  } else if (use_next_reaction_) {
+    IterateNextReaction();
+  } else {
+    IterateDirect();
+  }
+}
+
+void Gillespie::IterateDirect() {
   // Make sure propensities have been initialized
   // std::cout << "begin iteration" << std::endl;
   if (initialized_ == false) {
@@ -71,7 +171,7 @@ void Gillespie::Iterate() {
     throw std::runtime_error(
         "Gillespie: Propensity of system is 0. No reactions will execute.");
   }
-  double random_num = Random::random();
+  double random_num = tracker_->rng().random();
   // Calculate tau, i.e. time until next reaction
   double tau = (1.0 / alpha_sum_) * std::log(1.0 / random_num);
   if (!std::isnormal(tau)) {
@@ -79,28 +179,326 @@ void Gillespie::Iterate() {
   }
   time_ += tau;
   // Randomly select next reaction to execute, weighted by propensities
-  auto next_reaction = Random::WeightedChoiceIndex(reactions_, alpha_list_);
+  auto next_reaction = ChooseReaction();
   reactions_[next_reaction]->Execute();
   // std::cout << std::to_string(alpha_list_[next_reaction]) << std::endl;
-  // if (!SpeciesTracker::Instance().codon_map().empty()) {
-  if (reactions_[next_reaction]->is_tRNA() || SpeciesTracker::Instance().check_force_update()) {
+  FinishIteration(next_reaction);
+  iteration_++;
+}
+
+void Gillespie::FinishIteration(int executed_index) {
+  auto &tracker = *tracker_;
+  if (tracker.check_force_update()) {
     // Parallelize the loop using OpenMP
     // #pragma omp parallel for reduction(+:alpha_sum_)
     for (int i = 0; i < reactions_.size(); i++) {
+      double old_alpha = alpha_list_[i];
       double alpha_diff = IndexUpdatePropensity(reactions_[i], i);
       alpha_sum_ += alpha_diff;
+      if (queue_ready_) {
+        RescaleTime(i, old_alpha);
+      }
     }
-    SpeciesTracker::Instance().unflag_force_update();
-  } else {
-    UpdatePropensity(reactions_[next_reaction]);
+    if (use_tree_) {
+      tree_.Rebuild(alpha_list_);
+    }
+    tracker.unflag_force_update();
+    tracker.ClearStale();
+  } else if (!tracker.stale_reactions().empty()) {
+    // A charged tRNA pool changed, so refresh only the polymers with
+    // ribosomes reading that tRNA (plus the reaction that just executed).
+    UpdateStalePropensities(executed_index);
+  } else if (executed_index >= 0) {
+    UpdatePropensity(reactions_[executed_index]);
   }
-  if (reactions_[next_reaction]->remove() == true) {
+  if (executed_index >= 0 && reactions_[executed_index]->remove() == true) {
     // std::cout << std::to_string(alpha_list_[next_reaction]) << std::endl;
-    DeleteReaction(next_reaction);
+    DeleteReaction(executed_index);
+  }
+#ifndef NDEBUG
+  CheckConsistency();
+#endif
+}
+
+void Gillespie::IterateNextReaction() {
+  if (initialized_ == false) {
+    Initialize();
+  }
+  if (queue_ready_ == false) {
+    queue_.Clear();
+    for (double alpha : alpha_list_) {
+      queue_.Push(DrawTime(alpha));
+    }
+    queue_ready_ = true;
+  }
+  if (reactions_.empty() || !std::isfinite(queue_.get(queue_.top()))) {
+    throw std::runtime_error(
+        "Gillespie: Propensity of system is 0. No reactions will execute.");
+  }
+  int next_reaction = queue_.top();
+  time_ = queue_.get(next_reaction);
+  auto reaction = reactions_[next_reaction];
+  reaction->Execute();
+  FinishIteration(next_reaction);
+  // The reaction that fired always needs a new waiting time
+  if (Contains(reaction)) {
+    int index = reaction->index();
+    queue_.Set(index, DrawTime(alpha_list_[index]));
+  }
+  iteration_++;
+}
+
+double Gillespie::DrawTime(double alpha) {
+  if (alpha <= 0) {
+    return std::numeric_limits<double>::infinity();
+  }
+  return time_ + (1.0 / alpha) * std::log(1.0 / tracker_->rng().random());
+}
+
+void Gillespie::RescaleTime(int index, double old_alpha) {
+  double new_alpha = alpha_list_[index];
+  if (new_alpha == old_alpha) {
+    return;
+  }
+  double next_time = queue_.get(index);
+  if (new_alpha <= 0) {
+    next_time = std::numeric_limits<double>::infinity();
+  } else if (old_alpha <= 0 || !std::isfinite(next_time)) {
+    next_time = DrawTime(new_alpha);
+  } else {
+    next_time = time_ + (old_alpha / new_alpha) * (next_time - time_);
+  }
+  queue_.Set(index, next_time);
+}
+
+void Gillespie::IterateTauLeap(double horizon) {
+  // Leaps smaller than this many expected reactions are not worth the
+  // overhead, so take an exact step instead (Cao et al. 2006)
+  const double kMinLeapEvents = 10;
+  if (initialized_ == false) {
+    Initialize();
+  }
+  if (alpha_sum_ <= 0) {
+    throw std::runtime_error(
+        "Gillespie: Propensity of system is 0. No reactions will execute.");
+  }
+  double leap_sum = SelectLeapReactions();
+  if (leap_reactions_.empty()) {
+    IterateDirect();
+    return;
+  }
+  double tau_leap = LeapSize();
+  if (horizon > time_) {
+    tau_leap = std::min(tau_leap, horizon - time_);
+  }
+  if (!std::isfinite(tau_leap) || tau_leap * alpha_sum_ < kMinLeapEvents) {
+    IterateDirect();
+    return;
+  }
+  // Time until the next reaction that is executed exactly
+  double exact_sum = alpha_sum_ - leap_sum;
+  double tau_exact = std::numeric_limits<double>::infinity();
+  if (exact_sum > alpha_sum_ * 1e-12) {
+    tau_exact = (1.0 / exact_sum) * std::log(1.0 / tracker_->rng().random());
+  }
+  // Halve the leap until no species count would become negative
+  double tau = std::min(tau_leap, tau_exact);
+  while (!SampleFirings(tau)) {
+    tau_leap /= 2;
+    tau = std::min(tau_leap, tau_exact);
+  }
+  if (!std::isnormal(tau)) {
+    throw std::underflow_error("Underflow error.");
+  }
+  time_ += tau;
+  for (int i = 0; i < leap_reactions_.size(); i++) {
+    if (leap_firings_[i] > 0) {
+      leap_reactions_[i]->Execute(leap_firings_[i]);
+    }
+  }
+  FinishIteration(-1);
+  if (tau_exact <= tau_leap) {
+    // Execute one of the remaining reactions. Leaping reactions are masked
+    // out of the selection, which uses propensities after the leap.
+    leap_alpha_.clear();
+    for (const auto &reaction : leap_reactions_) {
+      int index = reaction->index();
+      leap_alpha_.push_back(alpha_list_[index]);
+      alpha_list_[index] = 0;
+      if (use_tree_) {
+        tree_.Set(index, 0);
+      }
+    }
+    double remaining = 0;
+    if (use_tree_) {
+      remaining = tree_.total();
+    } else {
+      for (double alpha : alpha_list_) {
+        remaining += alpha;
+      }
+    }
+    int next_reaction = (remaining > 0) ? ChooseReaction() : -1;
+    for (int i = 0; i < leap_reactions_.size(); i++) {
+      int index = leap_reactions_[i]->index();
+      alpha_list_[index] = leap_alpha_[i];
+      if (use_tree_) {
+        tree_.Set(index, alpha_list_[index]);
+      }
+    }
+    if (next_reaction >= 0) {
+      reactions_[next_reaction]->Execute();
+      FinishIteration(next_reaction);
+    }
   }
   iteration_++;
 }
 
+double Gillespie::SelectLeapReactions() {
+  // Reactions that could exhaust a reactant within this many firings are
+  // executed exactly instead (Cao, Gillespie, and Petzold 2005)
+  const int kCriticalFirings = 10;
+  auto &tracker = *tracker_;
+  leap_reactions_.clear();
+  double leap_sum = 0;
+  for (const auto &reaction : species_reactions_) {
+    double alpha = alpha_list_[reaction->index()];
+    if (alpha <= 0) {
+      continue;
+    }
+    const auto &reactants = reaction->reactant_ids();
+    bool critical = false;
+    for (int i = 0; i < reactants.size(); i++) {
+      int needed = kCriticalFirings;
+      if (reactants.size() == 2 && reactants[0] == reactants[1]) {
+        needed *= 2;
+      }
+      if (tracker.species(reactants[i]) < needed) {
+        critical = true;
+      }
+    }
+    if (!critical) {
+      leap_reactions_.push_back(reaction);
+      leap_sum += alpha;
+    }
+  }
+  return leap_sum;
+}
+
+double Gillespie::LeapSize() {
+  auto &tracker = *tracker_;
+  if (leap_mean_.size() < tracker.species_count()) {
+    leap_mean_.resize(tracker.species_count(), 0);
+    leap_variance_.resize(tracker.species_count(), 0);
+    leap_order_.resize(tracker.species_count(), 0);
+    leap_change_.resize(tracker.species_count(), 0);
+  }
+  leap_species_.clear();
+  // Expected change and variance of each reactant species over a unit time
+  for (const auto &reaction : leap_reactions_) {
+    const auto &reactants = reaction->reactant_ids();
+    bool dimer = reactants.size() == 2 && reactants[0] == reactants[1];
+    for (int id : reactants) {
+      if (leap_order_[id] == 0) {
+        leap_species_.push_back(id);
+      }
+      double order = reactants.size();
+      if (dimer) {
+        order = 2 + 1.0 / (tracker.species(id) - 1);
+      }
+      leap_order_[id] = std::max(leap_order_[id], order);
+    }
+  }
+  for (const auto &reaction : leap_reactions_) {
+    double alpha = alpha_list_[reaction->index()];
+    for (int id : reaction->reactant_ids()) {
+      leap_mean_[id] -= alpha;
+      leap_variance_[id] += alpha;
+    }
+    for (int id : reaction->product_ids()) {
+      if (leap_order_[id] != 0) {
+        leap_mean_[id] += alpha;
+        leap_variance_[id] += alpha;
+      }
+    }
+  }
+  double tau = std::numeric_limits<double>::infinity();
+  for (int id : leap_species_) {
+    double bound =
+        std::max(epsilon_ * tracker.species(id) / leap_order_[id], 1.0);
+    if (leap_mean_[id] != 0) {
+      tau = std::min(tau, bound / std::fabs(leap_mean_[id]));
+    }
+    if (leap_variance_[id] > 0) {
+      tau = std::min(tau, bound * bound / leap_variance_[id]);
+    }
+    leap_mean_[id] = 0;
+    leap_variance_[id] = 0;
+    leap_order_[id] = 0;
+  }
+  return tau;
+}
+
+bool Gillespie::SampleFirings(double tau) {
+  auto &tracker = *tracker_;
+  auto &rng = tracker.rng();
+  leap_firings_.resize(leap_reactions_.size());
+  leap_species_.clear();
+  for (int i = 0; i < leap_reactions_.size(); i++) {
+    const auto &reaction = leap_reactions_[i];
+    int firings = rng.Poisson(alpha_list_[reaction->index()] * tau);
+    leap_firings_[i] = firings;
+    for (int id : reaction->reactant_ids()) {
+      leap_species_.push_back(id);
+      leap_change_[id] -= firings;
+    }
+    for (int id : reaction->product_ids()) {
+      leap_species_.push_back(id);
+      leap_change_[id] += firings;
+    }
+  }
+  bool valid = true;
+  for (int id : leap_species_) {
+    if (tracker.species(id) + leap_change_[id] < 0) {
+      valid = false;
+    }
+  }
+  for (int id : leap_species_) {
+    leap_change_[id] = 0;
+  }
+  return valid;
+}
+
+void Gillespie::UpdateStalePropensities(int executed_index) {
+  auto &tracker = *tracker_;
+  auto &indices = stale_indices_;
+  indices.clear();
+  if (executed_index >= 0) {
+    indices.push_back(executed_index);
+  }
+  for (const auto &reaction : tracker.stale_reactions()) {
+    // Skip reactions that have already been removed from the queue
+    if (Contains(reaction)) {
+      indices.push_back(reaction->index());
+    }
+  }
+  tracker.ClearStale();
+  // Update in reaction order so that propensity sums accumulate in the same
+  // order as a full update over all reactions would.
+  std::sort(indices.begin(), indices.end());
+  indices.erase(std::unique(indices.begin(), indices.end()), indices.end());
+  for (int index : indices) {
+    double old_alpha = alpha_list_[index];
+    double alpha_diff = IndexUpdatePropensity(reactions_[index], index);
+    alpha_sum_ += alpha_diff;
+    if (use_tree_) {
+      tree_.Set(index, alpha_list_[index]);
+    }
+    if (queue_ready_) {
+      RescaleTime(index, old_alpha);
+    }
+  }
+}
+
 void Gillespie::Initialize() {
   // Check that propensities have not already been initialized.
   if (initialized_ == true) {
@@ -118,3 +516,117 @@ void Gillespie::Initialize() {
   // }
   initialized_ = true;
 }
+
+void Gillespie::SaveState(StateWriter &out) const {
+  out.Write(initialized_);
+  out.Write(time_);
+  out.Write(iteration_);
+  out.Write(alpha_sum_);
+  out.Write(alpha_list_);
+  out.Write<int64_t>(reactions_.size());
+  for (const auto &reaction : reactions_) {
+    out.WriteReaction(reaction);
+    reaction->SaveState(out);
+  }
+  // The layout of the sum tree affects how its sums are rounded
+  out.Write(use_tree_ ? tree_.capacity() : 0);
+  std::vector<double> firing_times;
+  if (queue_ready_) {
+    for (int i = 0; i < queue_.size(); i++) {
+      firing_times.push_back(queue_.get(i));
+    }
+  }
+  out.Write(queue_ready_);
+  out.Write(firing_times);
+}
+
+void Gillespie::LoadState(StateReader &in) {
+  bool initialized = in.Read<bool>();
+  double time = in.Read<double>();
+  int iteration = in.Read<int>();
+  double alpha_sum = in.Read<double>();
+  auto alpha_list = in.ReadVector<double>();
+  Reaction::VecPtr reactions;
+  int64_t count = in.ReadSize();
+  for (int64_t i = 0; i < count; i++) {
+    auto reaction = in.ReadReaction();
+    if (!reaction || alpha_list.size() != count) {
+      throw std::runtime_error(
+          "Saved simulation state is truncated or corrupt.");
+    }
+    reaction->LoadState(in);
+    reactions.push_back(reaction);
+  }
+  int capacity = in.Read<int>();
+  bool queue_ready = in.Read<bool>();
+  auto firing_times = in.ReadVector<double>();
+  if (queue_ready && firing_times.size() != reactions.size()) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
+  }
+  initialized_ = initialized;
+  time_ = time;
+  iteration_ = iteration;
+  alpha_sum_ = alpha_sum;
+  alpha_list_ = alpha_list;
+  reactions_ = reactions;
+  for (int i = 0; i < reactions_.size(); i++) {
+    reactions_[i]->index(i);
+  }
+  // Species reactions are never removed from the queue, so
+  // species_reactions_ is still in the order in which they were linked
+  if (use_tree_) {
+    tree_.Rebuild(alpha_list_, capacity);
+  }
+  queue_.Clear();
+  queue_ready_ = queue_ready;
+  for (double firing_time : firing_times) {
+    queue_.Push(firing_time);
+  }
+}
+
+void Gillespie::selection(const std::string &selection) {
+  if (selection == "linear") {
+    use_tree_ = false;
+  } else if (selection == "tree") {
+    use_tree_ = true;
+    tree_.Rebuild(alpha_list_);
+  } else {
+    throw std::invalid_argument("Unknown reaction selection method '" +
+                                selection +
+                                "'. Valid options are 'linear' and 'tree'.");
+  }
+  selection_ = selection;
+}
+
+void Gillespie::method(const std::string &method) {
+  if (method != "direct" && method != "tau_leap" &&
+      method != "next_reaction") {
+    throw std::invalid_argument("Unknown simulation method '" + method +
+                                "'. Valid options are 'direct', "
+                                "'tau_leap', and 'next_reaction'.");
+  }
+  use_tau_leap_ = (method == "tau_leap");
+  use_next_reaction_ = (method == "next_reaction");
+  if (!use_next_reaction_) {
+    queue_ready_ = false;
+    queue_.Clear();
+  }
+  method_ = method;
+}
+
+void Gillespie::epsilon(double epsilon) {
+  if (epsilon <= 0 || epsilon >= 1) {
+    throw std::invalid_argument(
+        "Tau-leaping epsilon must be between 0 and 1.");
+  }
+  epsilon_ = epsilon;
+}
+
+int Gillespie::ChooseReaction() {
+  if (use_tree_) {
+    // Draw exactly one random number, as WeightedChoiceIndex does, so that
+    // both methods consume the random number stream identically.
+    return tree_.Find(tracker_->rng().random() * tree_.total());
+  }
+  return tracker_->rng().WeightedChoiceIndex(reactions_, alpha_list_);
+}
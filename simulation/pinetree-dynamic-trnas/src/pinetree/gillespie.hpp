@@ -1,11 +1,17 @@
 #ifndef SRC_GILLESPIE_HPP  // header guard
 #define SRC_GILLESPIE_HPP
 
+#include <limits>
+#include <string>
 #include <vector>
 // #include <omp.h>
 
+#include "propensity_tree.hpp"
+#include "reaction_queue.hpp"
 #include "reaction.hpp"
 
+class SpeciesTracker;
+
 class Gillespie {
  public:
   /**
@@ -13,24 +19,82 @@ class Gillespie {
    */
   void LinkReaction(Reaction::Ptr reaction);
   /**
-   * Remove Reaction object from reaction queue.
+   * Remove Reaction object from reaction queue. The last reaction in the queue
+   * takes the place (and index) of the removed reaction.
    */
   void DeleteReaction(int index);
   /**
-   * Update propensity of a reaction.
+   * Update propensity of a reaction, located by its stored index.
    */
-  void UpdatePropensity(Reaction::Ptr reaction);
+  void UpdatePropensity(const Reaction::Ptr &reaction);
   double IndexUpdatePropensity(Reaction::Ptr reaction, int index);
   /**
-   * Execute one iteration of the gillespie algorithm.
+   * Execute one iteration of the gillespie algorithm. With the "tau_leap"
+   * method, one iteration may advance many species reactions at once (see
+   * method()).
+   *
+   * @param horizon time that a leap may not advance past (e.g. the next
+   *  output time); exact steps are not affected
    */
-  void Iterate();
+  void Iterate(double horizon = std::numeric_limits<double>::infinity());
   /**
    * Getters and setters.
    */
   double time() { return time_; }
+  /**
+   * Select the data structure used to choose the next reaction. Either
+   * "linear" (bisect cumulative sums over all propensities, O(n) per
+   * iteration) or "tree" (binary sum tree, O(log n) per iteration).
+   */
+  void selection(const std::string &selection);
+  const std::string &selection() const { return selection_; }
+  /**
+   * Select the simulation method. "direct" (default) executes one reaction
+   * per iteration. "tau_leap" advances species-level reactions that are far
+   * from exhausting their reactants by Poisson-distributed numbers of
+   * firings (Cao, Gillespie, and Petzold 2006), while polymer reactions,
+   * binding reactions, and species reactions close to exhaustion are still
+   * executed one at a time. "next_reaction" uses the next reaction method
+   * (Gibson and Bruck 2000): every reaction keeps a putative firing time in
+   * an indexed priority queue, so each iteration draws a single random
+   * number and only reactions whose propensity changed are touched.
+   */
+  void method(const std::string &method);
+  const std::string &method() const { return method_; }
+  /**
+   * Error control parameter for tau-leaping: the largest expected relative
+   * change of any reactant count in one leap. Must be between 0 and 1.
+   */
+  void epsilon(double epsilon);
+  double epsilon() const { return epsilon_; }
+  /**
+   * Verify that every reaction's stored index matches its position in the
+   * reaction queue, that the running propensity sum matches the propensity
+   * list, and that the sum tree and next reaction queue (if used) mirror the
+   * propensity list. Throws std::logic_error on the first inconsistency. Called after
+   * every iteration in builds without NDEBUG.
+   */
+  void CheckConsistency() const;
+  /**
+   * Set the SpeciesTracker (and hence random number generator) of the model
+   * that owns this Gillespie object.
+   */
+  void tracker(SpeciesTracker *tracker) { tracker_ = tracker; }
+  const Reaction::VecPtr &reactions() const { return reactions_; }
+  /**
+   * Write or restore the simulation time, the reaction queue and all
+   * propensities, and the putative firing times of the next reaction method
+   * (see Model::SaveState()). Restoring replaces the reaction queue with the
+   * saved reactions.
+   */
+  void SaveState(StateWriter &out) const;
+  void LoadState(StateReader &in);
 
  private:
+  /**
+   * SpeciesTracker of the model that owns this Gillespie object.
+   */
+  SpeciesTracker *tracker_ = nullptr;
   /**
    * True if Initialize() has been called.
    */
@@ -55,6 +119,120 @@ class Gillespie {
    * Vector of all reactions.
    */
   Reaction::VecPtr reactions_;
+  /**
+   * Name of reaction selection method (see selection()).
+   */
+  std::string selection_ = "linear";
+  /**
+   * Sum tree mirroring alpha_list_, only maintained if selection_ is "tree".
+   */
+  PropensityTree tree_;
+  bool use_tree_ = false;
+  /**
+   * Does reaction currently occupy the queue position given by its index?
+   */
+  bool Contains(const Reaction::Ptr &reaction) const;
+  /**
+   * Name of simulation method (see method()).
+   */
+  std::string method_ = "direct";
+  bool use_tau_leap_ = false;
+  bool use_next_reaction_ = false;
+  double epsilon_ = 0.03;
+  /**
+   * Putative firing time of each reaction for the next reaction method, in
+   * the same order as reactions_. Only maintained once queue_ready_ is set.
+   */
+  ReactionQueue queue_;
+  bool queue_ready_ = false;
+  /**
+   * All species reactions in the reaction queue, i.e. candidates for leaping.
+   */
+  std::vector<SpeciesReaction::Ptr> species_reactions_;
+  /**
+   * Species reactions leaping in the current iteration and their number of
+   * firings. Kept between iterations to avoid reallocation.
+   */
+  std::vector<SpeciesReaction::Ptr> leap_reactions_;
+  std::vector<int> leap_firings_;
+  std::vector<double> leap_alpha_;
+  /**
+   * Per-species scratch space for choosing the leap size, indexed by
+   * SpeciesTracker ID, and the IDs that are currently in use.
+   */
+  std::vector<double> leap_mean_;
+  std::vector<double> leap_variance_;
+  std::vector<double> leap_order_;
+  std::vector<int> leap_change_;
+  std::vector<int> leap_species_;
+  /**
+   * Indices of the reactions refreshed by UpdateStalePropensities(). Kept
+   * between iterations to avoid reallocation.
+   */
+  std::vector<int> stale_indices_;
+  /**
+   * Randomly select the index of the next reaction, weighted by propensity.
+   */
+  int ChooseReaction();
+  /**
+   * Refresh propensities after reactions have executed and remove the
+   * executed reaction from the queue if it is finished.
+   *
+   * @param executed_index index of the reaction that was executed, or -1 if
+   *  only species reactions were leaped
+   */
+  void FinishIteration(int executed_index);
+  /**
+   * One iteration of the direct method.
+   */
+  void IterateDirect();
+  /**
+   * One iteration of the next reaction method.
+   */
+  void IterateNextReaction();
+  /**
+   * Draw a putative firing time for a reaction with the given propensity.
+   */
+  double DrawTime(double alpha);
+  /**
+   * Adjust the putative firing time of a reaction after its propensity has
+   * changed, reusing the remaining waiting time (Gibson and Bruck 2000).
+   *
+   * @param index index of reaction
+   * @param old_alpha propensity of reaction before the change
+   */
+  void RescaleTime(int index, double old_alpha);
+  /**
+   * One iteration of the tau-leaping hybrid method (see method()).
+   */
+  void IterateTauLeap(double horizon);
+  /**
+   * Collect the species reactions that may leap in this iteration into
+   * leap_reactions_, and return the sum of their propensities.
+   */
+  double SelectLeapReactions();
+  /**
+   * Choose the leap size so that the expected change in every reactant count
+   * stays within epsilon_ of that count.
+   */
+  double LeapSize();
+  /**
+   * Draw the number of firings of each leaping reaction over a time interval.
+   *
+   * @param tau length of interval
+   *
+   * @return false if the firings would make any species count negative
+   */
+  bool SampleFirings(double tau);
+  /**
+   * Refresh the propensities of reactions that SpeciesTracker has flagged as
+   * stale (i.e. polymers with ribosomes reading a tRNA whose count changed),
+   * along with the reaction that was just executed.
+   *
+   * @param executed_index index of the reaction that was just executed, or
+   *  -1 if there is none
+   */
+  void UpdateStalePropensities(int executed_index);
   /**
    * Compute all propensities after all reactions have been added.
    */
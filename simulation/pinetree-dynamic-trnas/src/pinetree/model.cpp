@@ -1,41 +1,276 @@
+#include <algorithm>
+#include <chrono>
 #include <cmath>
 #include <fstream>
 #include <iostream>
+#include <sstream>
 
 #include "choices.hpp"
 #include "model.hpp"
 #include "polymer.hpp"
 #include "tracker.hpp"
 
-Model::Model(double cell_volume) : cell_volume_(cell_volume) {
-  auto &tracker = SpeciesTracker::Instance();
-  tracker.Clear();
-  gillespie_ = Gillespie();
-  tracker.propensity_signal_.ConnectMember(&gillespie_,
-                                           &Gillespie::UpdatePropensity);
+Model::Model(double cell_volume, const std::string &selection,
+             const std::string &rng)
+    : cell_volume_(cell_volume) {
+  gillespie_.selection(selection);
+  tracker_.rng().engine(rng);
+  gillespie_.tracker(&tracker_);
+  tracker_.propensity_signal_
+      .ConnectMember<Gillespie, &Gillespie::UpdatePropensity>(&gillespie_);
 }
 
-void Model::seed(int seed) { Random::seed(seed); }
+namespace {
+const std::string kMismatch = "Saved state does not match this model";
+}  // namespace
+
+void Model::SaveState(const std::string &path) {
+  std::ofstream file(path, std::ios::binary);
+  if (!file) {
+    throw std::runtime_error("Could not open state file '" + path + "'.");
+  }
+  SaveState(file);
+}
+
+void Model::SaveState(std::ostream &stream) {
+  Initialize();
+  StateWriter out(stream);
+  out.Section("model");
+  out.Write(next_output_);
+  out.Write<int64_t>(genomes_.size());
+  out.Write<int64_t>(transcripts_.size());
+  out.Write<int64_t>(initial_transcripts_);
+  out.Write<int64_t>(reactions_.size());
+  // Species are interned as they first appear, so a model that has not been
+  // simulated yet knows fewer of them
+  out.Section("species");
+  out.Write<int64_t>(tracker_.species_count());
+  for (int i = 0; i < tracker_.species_count(); i++) {
+    out.Write(tracker_.species_name(i));
+  }
+  // Transcripts produced by genomes so far are rebuilt from their genome
+  Polymer::VecPtr polymers(genomes_.begin(), genomes_.end());
+  polymers.insert(polymers.end(), transcripts_.begin(), transcripts_.end());
+  Transcript::VecPtr produced;
+  for (const auto &reaction : gillespie_.reactions()) {
+    auto wrapper = std::dynamic_pointer_cast<PolymerWrapper>(reaction);
+    if (wrapper) {
+      auto transcript = std::dynamic_pointer_cast<Transcript>(wrapper->polymer());
+      if (transcript && transcript->genome()) {
+        produced.push_back(transcript);
+      }
+    }
+  }
+  out.Section("transcripts");
+  out.Write<int64_t>(produced.size());
+  for (const auto &transcript : produced) {
+    auto genome =
+        std::find(genomes_.begin(), genomes_.end(), transcript->genome());
+    out.Write<int32_t>(genome - genomes_.begin());
+    out.Write(transcript->start());
+    polymers.push_back(transcript);
+  }
+  for (const auto &polymer : polymers) {
+    out.AddPolymer(polymer);
+  }
+  out.Section("polymers");
+  for (const auto &polymer : polymers) {
+    polymer->SaveState(out);
+  }
+  out.Section("tracker");
+  tracker_.SaveState(out);
+  // Removed polymers have no wrapper, but still take up an ID
+  for (const auto &reaction : reactions_) {
+    out.AddReaction(reaction);
+  }
+  for (const auto &polymer : polymers) {
+    out.AddReaction(polymer->wrapper());
+  }
+  out.Section("gillespie");
+  gillespie_.SaveState(out);
+  out.Close();
+}
+
+void Model::LoadState(const std::string &path) {
+  std::ifstream file(path, std::ios::binary);
+  if (!file) {
+    throw std::runtime_error("Could not open state file '" + path + "'.");
+  }
+  LoadState(file);
+}
+
+void Model::LoadState(std::istream &stream) {
+  if (gillespie_.time() > 0) {
+    throw std::runtime_error(
+        "A saved state can only be loaded into a model that has not been "
+        "simulated yet.");
+  }
+  StateReader in(stream);
+  in.Section("model");
+  double next_output = in.Read<double>();
+  Initialize();
+  int64_t genomes = in.ReadSize();
+  int64_t transcripts = in.ReadSize();
+  int64_t initial_transcripts = in.ReadSize();
+  int64_t reactions = in.ReadSize();
+  // Transcripts registered after initialization create their binding
+  // reactions later, so the order of reactions differs
+  if (genomes != genomes_.size() || transcripts != transcripts_.size() ||
+      initial_transcripts != initial_transcripts_ ||
+      reactions != reactions_.size()) {
+    throw std::invalid_argument(
+        kMismatch + " (genomes, transcripts, or reactions differ).");
+  }
+  in.Section("species");
+  int64_t species = in.ReadSize();
+  for (int i = 0; i < species; i++) {
+    if (tracker_.Intern(in.ReadString()) != i) {
+      throw std::invalid_argument(kMismatch + " (species differ).");
+    }
+  }
+  in.Section("transcripts");
+  Polymer::VecPtr polymers(genomes_.begin(), genomes_.end());
+  polymers.insert(polymers.end(), transcripts_.begin(), transcripts_.end());
+  int64_t produced = in.ReadSize();
+  for (int64_t i = 0; i < produced; i++) {
+    int genome = in.Read<int32_t>();
+    int start = in.Read<int>();
+    if (genome < 0 || genome >= genomes_.size()) {
+      throw std::runtime_error(
+          "Saved simulation state is truncated or corrupt.");
+    }
+    auto transcript =
+        genomes_[genome]->BuildTranscript(start, genomes_[genome]->stop());
+    RegisterProducedTranscript(transcript);
+    polymers.push_back(transcript);
+  }
+  if (tracker_.species_count() != species) {
+    throw std::invalid_argument(kMismatch + " (species differ).");
+  }
+  for (const auto &polymer : polymers) {
+    in.AddPolymer(polymer);
+  }
+  // Restoring polymers and the tracker overwrites any counts that were
+  // changed while the transcripts above were registered
+  in.Section("polymers");
+  for (const auto &polymer : polymers) {
+    polymer->LoadState(in);
+  }
+  in.Section("tracker");
+  tracker_.LoadState(in);
+  for (const auto &reaction : reactions_) {
+    in.AddReaction(reaction);
+  }
+  for (const auto &polymer : polymers) {
+    in.AddReaction(polymer->wrapper());
+  }
+  in.Section("gillespie");
+  gillespie_.LoadState(in);
+  in.Close();
+  next_output_ = next_output;
+}
+
+std::shared_ptr<Model> Model::Clone() {
+  auto copy = std::make_shared<Model>(cell_volume_, gillespie_.selection(),
+                                      tracker_.rng().engine());
+  // Species first seen while simulating (e.g. before a transcript was
+  // registered) keep their IDs in the copy
+  for (int i = 0; i < tracker_.species_count(); i++) {
+    copy->tracker_.Intern(tracker_.species_name(i));
+  }
+  for (const auto &step : build_steps_) {
+    step(*copy);
+  }
+  if (initialized_) {
+    std::stringstream state;
+    SaveState(state);
+    copy->LoadState(state);
+  } else {
+    // Only the seed has to be copied before the model is simulated
+    copy->tracker_.rng().state(tracker_.rng().state());
+  }
+  return copy;
+}
+
+void Model::seed(int seed, int stream) {
+  tracker_.rng().seed(seed, stream);
+}
 
 void Model::Simulate(int time_limit, double time_step,
-                     const std::string &output = "counts.tsv") {
-  auto &tracker = SpeciesTracker::Instance();
+                     const std::string &output, const std::string &method,
+                     double epsilon, const std::string &output_format,
+                     bool sparse) {
+  auto writer = CountsWriter::Create(output_format, output, sparse);
+  Simulate(time_limit, time_step, *writer, method, epsilon);
+}
+
+namespace {
+/**
+ * Check whether a simulation should stop early.
+ *
+ * @return reason for stopping, or an empty string to continue
+ */
+std::string StopReason(const RunControl &control,
+                       std::chrono::steady_clock::time_point start) {
+  if (control.token && control.token->cancelled()) {
+    return "cancelled";
+  }
+  std::chrono::duration<double> elapsed =
+      std::chrono::steady_clock::now() - start;
+  if (elapsed.count() > control.time_budget) {
+    return "exceeded its wall-clock budget";
+  }
+  if (control.interrupted && control.interrupted()) {
+    return "interrupted";
+  }
+  return "";
+}
+}  // namespace
+
+void Model::Simulate(int time_limit, double time_step, CountsWriter &writer,
+                     const std::string &method, double epsilon,
+                     const RunControl &control) {
+  if (control.check_interval < 1) {
+    throw std::invalid_argument("Check interval must be at least 1.");
+  }
+  auto start = std::chrono::steady_clock::now();
+  gillespie_.method(method);
+  gillespie_.epsilon(epsilon);
   Initialize();
-  // Set up file output streams
-  std::ofstream countfile(output, std::ios::trunc);
-  // Output header
-  countfile << "time\tspecies\tprotein\ttranscript\tribo_density\tcollisions\n";
-  double out_time = 0.0;
-  while (gillespie_.time() < time_limit) {
-    if ((out_time - gillespie_.time()) < 0.001) {
-      countfile << tracker.GatherCounts(gillespie_.time());
-      countfile.flush();
-      tracker.ResetCollision();
-      out_time += time_step;
+  int iterations = 0;
+  // Counts are recorded at the first iteration within this long before each
+  // output time
+  const double kOutputTolerance = 0.001;
+  try {
+    while (gillespie_.time() < time_limit) {
+      if ((next_output_ - gillespie_.time()) < kOutputTolerance) {
+        writer.Write(gillespie_.time(), tracker_);
+        tracker_.ResetCollision();
+        next_output_ += time_step;
+      }
+      // Leaps stop inside the tolerance window so no output time is skipped
+      gillespie_.Iterate(next_output_ - kOutputTolerance / 2);
+      if (++iterations == control.check_interval) {
+        iterations = 0;
+        std::string reason = StopReason(control, start);
+        if (!reason.empty()) {
+          throw SimulationInterrupted("Simulation " + reason +
+                                      " at simulated time " +
+                                      std::to_string(gillespie_.time()) + ".");
+        }
+      }
+    }
+  } catch (...) {
+    // Keep the output up to the time of the error (e.g. a model that runs
+    // out of reactants); writers such as NpzWriter only produce a file when
+    // closed. An error while closing must not hide the original one.
+    try {
+      writer.Close(tracker_);
+    } catch (...) {
     }
-    gillespie_.Iterate();
+    throw;
   }
-  countfile.close();
+  writer.Close(tracker_);
   std::cout << "Simulation successful. Ignore any warnings that follow." << std::endl;
 }
 
@@ -46,46 +281,54 @@ void Model::AddtRNA(std::map<std::string, std::map<std::string, std::map<std::st
    * 2. Define reactions for tRNA charging (eventually this could be an aggregate reaction)
    * 3. Actual codon map also should be added to the species tracker
    */
-  auto &tracker = SpeciesTracker::Instance();
+  build_steps_.push_back([codons, rate_constant](Model &model) mutable {
+    model.AddtRNA(codons, rate_constant);
+  });
   std::map<std::string, std::vector<std::string>> codon_map;
   for (auto const& codon : codons) {
     codon_map[codon.first] = std::vector<std::string>();
     for (auto const& anticodon : codon.second) {
-      tracker.Increment(anticodon.first + "_charged", anticodon.second.find("charged")->second);
-      tracker.Increment(anticodon.first + "_uncharged", anticodon.second.find("uncharged")->second);
+      tracker_.Increment(anticodon.first + "_charged", anticodon.second.find("charged")->second);
+      tracker_.Increment(anticodon.first + "_uncharged", anticodon.second.find("uncharged")->second);
       AddtRNAReaction(rate_constant, {anticodon.first + "_uncharged"}, {anticodon.first + "_charged"});
       codon_map[codon.first].push_back(anticodon.first);
     }
   }
-  tracker.codon_map(codon_map);
+  tracker_.codon_map(codon_map);
 }
 
 void Model::AddtRNA(std::map<std::string, std::vector<std::string>> &codon_map, 
                     std::map<std::string, std::pair<int, int>> &counts, 
                     std::map<std::string, double> &rate_constants) {
-  auto &tracker = SpeciesTracker::Instance();
+  build_steps_.push_back(
+      [codon_map, counts, rate_constants](Model &model) mutable {
+        model.AddtRNA(codon_map, counts, rate_constants);
+      });
   for (auto const& trna : counts) {
     // Add initial charged tRNA species
-    tracker.Increment(trna.first + "_charged", trna.second.first);
+    tracker_.Increment(trna.first + "_charged", trna.second.first);
     // Add initial uncharged tRNA species
-    tracker.Increment(trna.first + "_uncharged", trna.second.second);
+    tracker_.Increment(trna.first + "_uncharged", trna.second.second);
     double rate_constant = rate_constants.find(trna.first)->second;
     AddtRNAReaction(rate_constant, {trna.first + "_uncharged"}, {trna.first + "_charged"});
   }
-  tracker.codon_map(codon_map);
+  tracker_.codon_map(codon_map);
 }
 
 void Model::AddReaction(double rate_constant,
                         const std::vector<std::string> &reactants,
                         const std::vector<std::string> &products) {
+  build_steps_.push_back([rate_constant, reactants, products](Model &model) {
+    model.AddReaction(rate_constant, reactants, products);
+  });
   auto rxn = std::make_shared<SpeciesReaction>(rate_constant, cell_volume_,
-                                               reactants, products);
-  auto &tracker = SpeciesTracker::Instance();
+                                               reactants, products, &tracker_);
+  reactions_.push_back(rxn);
   for (const auto &reactant : reactants) {
-    tracker.Add(reactant, rxn);
+    tracker_.Add(reactant, rxn);
   }
   for (const auto &product : products) {
-    tracker.Add(product, rxn);
+    tracker_.Add(product, rxn);
   }
   gillespie_.LinkReaction(rxn);
 }
@@ -94,14 +337,14 @@ void Model::AddtRNAReaction(double rate_constant,
                         const std::vector<std::string> &reactants,
                         const std::vector<std::string> &products) {
   auto rxn = std::make_shared<SpeciesReaction>(rate_constant, cell_volume_,
-                                               reactants, products);
+                                               reactants, products, &tracker_);
   rxn->mark_tRNA(); // this reaction impacts tRNA pools
-  auto &tracker = SpeciesTracker::Instance();
+  reactions_.push_back(rxn);
   for (const auto &reactant : reactants) {
-    tracker.Add(reactant, rxn);
+    tracker_.Add(reactant, rxn);
   }
   for (const auto &product : products) {
-    tracker.Add(product, rxn);
+    tracker_.Add(product, rxn);
   }
   gillespie_.LinkReaction(rxn);
 }
@@ -112,28 +355,35 @@ void Model::AddSpecies(const std::string &name, int copy_number) {
         "Names prefixed with '__' (double underscore) are reserved for "
         "internal use.");
   }
-  auto &tracker = SpeciesTracker::Instance();
-  tracker.Increment(name, copy_number);
+  build_steps_.push_back([name, copy_number](Model &model) {
+    model.AddSpecies(name, copy_number);
+  });
+  tracker_.Increment(name, copy_number);
 }
 
 void Model::AddPolymerase(const std::string &name, int footprint,
                           double speed, int copy_number) {
+  build_steps_.push_back([name, footprint, speed, copy_number](Model &model) {
+    model.AddPolymerase(name, footprint, speed, copy_number);
+  });
   auto pol = Polymerase(name, footprint, speed);
   polymerases_.push_back(pol);
-  auto &tracker = SpeciesTracker::Instance();
-  tracker.Increment(name, copy_number);
-  tracker.InitializeCollision(name);
+  tracker_.Increment(name, copy_number);
+  tracker_.InitializeCollision(name);
 }
 
 void Model::AddRibosome(int footprint, double speed, int copy_number) {
+  build_steps_.push_back([footprint, speed, copy_number](Model &model) {
+    model.AddRibosome(footprint, speed, copy_number);
+  });
   auto pol = Polymerase("__ribosome", footprint, speed);
   polymerases_.push_back(pol);
-  auto &tracker = SpeciesTracker::Instance();
-  tracker.Increment("__ribosome", copy_number);
-  tracker.InitializeCollision("__ribosome");
+  tracker_.Increment("__ribosome", copy_number);
+  tracker_.InitializeCollision("__ribosome");
 }
 
 void Model::RegisterPolymer(Polymer::Ptr polymer) {
+  polymer->tracker(&tracker_);
   // Encapsulate polymer in PolymerWrapper reaction and add to reaction list
   auto wrapper = std::make_shared<PolymerWrapper>(polymer);
   polymer->wrapper(wrapper);
@@ -141,28 +391,106 @@ void Model::RegisterPolymer(Polymer::Ptr polymer) {
 }
 
 void Model::RegisterGenome(Genome::Ptr genome) {
+  build_steps_.push_back([genome](Model &model) {
+    model.RegisterGenome(genome->Clone());
+  });
   RegisterPolymer(genome);
-  genome->termination_signal_.ConnectMember(
-      &SpeciesTracker::Instance(), &SpeciesTracker::TerminateTranscription);
-  genome->transcript_signal_.ConnectMember(this, &Model::RegisterTranscript);
+  genome->termination_signal_
+      .ConnectMember<SpeciesTracker, &SpeciesTracker::TerminateTranscription>(
+          &tracker_);
+  genome->transcript_signal_
+      .ConnectMember<Model, &Model::RegisterProducedTranscript>(this);
   genomes_.push_back(genome);
 }
 
 void Model::RegisterTranscript(Transcript::Ptr transcript) {
+  build_steps_.push_back([transcript](Model &model) {
+    model.RegisterTranscript(transcript->Clone());
+  });
+  AddTranscript(transcript);
+}
+
+void Model::RegisterTranscripts(Transcript::Ptr transcript, int copies) {
+  if (copies < 0) {
+    throw std::invalid_argument("Number of transcript copies is negative.");
+  }
+  // Later changes to the template must not affect clones of this model
+  auto snapshot = transcript->Clone();
+  build_steps_.push_back([snapshot, copies](Model &model) {
+    model.RegisterTranscripts(snapshot, copies);
+  });
+  transcripts_.reserve(transcripts_.size() + copies);
+  for (int i = 0; i < copies; i++) {
+    AddTranscript(snapshot->Clone());
+  }
+}
+
+void Model::AddTranscript(Transcript::Ptr transcript) {
+  auto seq = transcript->sequence();
+  if (seq) {
+    auto it = sequences_.find(seq->nucleotides());
+    if (it == sequences_.end()) {
+      it = sequences_.emplace(seq->nucleotides(), seq).first;
+    }
+    transcript->sequence(it->second);
+  }
+  auto &index = site_indexes_[SiteIndex::Positions(
+      transcript->start(), transcript->stop(),
+      transcript->GetBindingIntervals(), transcript->GetReleaseIntervals())];
+  if (index) {
+    transcript->site_index(index);
+  } else {
+    index = transcript->site_index();
+  }
+  RegisterProducedTranscript(transcript);
+  transcripts_.push_back(transcript);
+  if (initialized_) {
+    AddTranscriptBindings(transcript);
+  }
+}
+
+void Model::RegisterProducedTranscript(const Transcript::Ptr &transcript) {
   RegisterPolymer(transcript);
-  transcript->termination_signal_.ConnectMember(
-      &SpeciesTracker::Instance(), &SpeciesTracker::TerminateTranslation);
-  if (initialized_ == false) {
-    transcripts_.push_back(transcript);
+  transcript->termination_signal_
+      .ConnectMember<SpeciesTracker, &SpeciesTracker::TerminateTranslation>(
+          &tracker_);
+}
+
+void Model::AddTranscriptBindings(Transcript::Ptr transcript) {
+  for (auto rbs_name : transcript->bindings()) {
+    for (auto pol : polymerases_) {
+      if (rbs_name.second.count(pol.name()) != 0) {
+        double rate_constant = rbs_name.second[pol.name()];
+        Polymerase pol_template = Polymerase(pol);
+        auto reaction = std::make_shared<BindPolymerase>(
+            rate_constant, cell_volume_, rbs_name.first, pol_template,
+            &tracker_);
+        tracker_.Add(rbs_name.first, reaction);
+        tracker_.Add(pol.name(), reaction);
+        reactions_.push_back(reaction);
+        gillespie_.LinkReaction(reaction);
+      }
+    }
   }
 }
 
 void Model::Initialize() {
+  if (initialized_) {
+    return;
+  }
   if (genomes_.size() == 0 && transcripts_.size() == 0) {
     std::cerr << "Warning: There are no Genome objects registered with "
                  "Model. Did you forget to register a Genome?"
               << std::endl;
   }
+  // Ribosomes move one codon at a time when simulating dynamic tRNAs
+  if (!tracker_.codon_map().empty()) {
+    for (auto &pol : polymerases_) {
+      if (pol.kind() == MobileElement::Kind::kRibosome) {
+        pol.step(3);
+      }
+    }
+  }
   // Create Bind reactions for each promoter-polymerase pair
   for (Genome::Ptr genome : genomes_) {
     for (auto promoter_name : genome->bindings()) {
@@ -171,10 +499,11 @@ void Model::Initialize() {
           double rate_constant = promoter_name.second[pol.name()];
           Polymerase pol_template = Polymerase(pol);
           auto reaction = std::make_shared<BindPolymerase>(
-              rate_constant, cell_volume_, promoter_name.first, pol_template);
-          auto &tracker = SpeciesTracker::Instance();
-          tracker.Add(promoter_name.first, reaction);
-          tracker.Add(pol.name(), reaction);
+              rate_constant, cell_volume_, promoter_name.first, pol_template,
+              &tracker_);
+          tracker_.Add(promoter_name.first, reaction);
+          tracker_.Add(pol.name(), reaction);
+          reactions_.push_back(reaction);
           gillespie_.LinkReaction(reaction);
         }
       }
@@ -185,9 +514,9 @@ void Model::Initialize() {
           Rnase(genome->rnase_footprint(), genome->rnase_speed());
       auto reaction_ext = std::make_shared<BindRnase>(
           genome->transcript_degradation_rate_ext(), cell_volume_,
-          rnase_template_ext, "__rnase_site_ext");
-      auto &tracker = SpeciesTracker::Instance();
-      tracker.Add("__rnase_site_ext", reaction_ext);
+          rnase_template_ext, "__rnase_site_ext", &tracker_);
+      tracker_.Add("__rnase_site_ext", reaction_ext);
+      reactions_.push_back(reaction_ext);
       gillespie_.LinkReaction(reaction_ext);
     }
     
@@ -199,9 +528,9 @@ void Model::Initialize() {
           Rnase(genome->rnase_footprint(), genome->rnase_speed());
       auto reaction = std::make_shared<BindRnase>(
           genome->transcript_degradation_rate(), cell_volume_, rnase_template,
-          "__rnase_site");
-      auto &tracker = SpeciesTracker::Instance();
-      tracker.Add("__rnase_site", reaction);
+          "__rnase_site", &tracker_);
+      tracker_.Add("__rnase_site", reaction);
+      reactions_.push_back(reaction);
       gillespie_.LinkReaction(reaction);
     } 
     
@@ -211,9 +540,10 @@ void Model::Initialize() {
         auto rnase_template =
           Rnase(genome->rnase_footprint(), genome->rnase_speed());
         auto reaction = std::make_shared<BindRnase>(
-          rnase_site.second, cell_volume_, rnase_template, rnase_site.first);
-        auto &tracker = SpeciesTracker::Instance();
-        tracker.Add(rnase_site.first, reaction);
+          rnase_site.second, cell_volume_, rnase_template, rnase_site.first,
+          &tracker_);
+        tracker_.Add(rnase_site.first, reaction);
+        reactions_.push_back(reaction);
         gillespie_.LinkReaction(reaction);
       }
     }
@@ -221,22 +551,10 @@ void Model::Initialize() {
   
   // Initialize transcripts that have been defined independently of genome
   for (Transcript::Ptr transcript : transcripts_) {
-    for (auto rbs_name : transcript->bindings()) {
-      for (auto pol : polymerases_) {
-        if (rbs_name.second.count(pol.name()) != 0) {
-          double rate_constant = rbs_name.second[pol.name()];
-          Polymerase pol_template = Polymerase(pol);
-          auto reaction = std::make_shared<BindPolymerase>(
-              rate_constant, cell_volume_, rbs_name.first, pol_template);
-          auto &tracker = SpeciesTracker::Instance();
-          tracker.Add(rbs_name.first, reaction);
-          tracker.Add(pol.name(), reaction);
-          gillespie_.LinkReaction(reaction);
-        }
-      }
-    }
+    AddTranscriptBindings(transcript);
   }
-
+  initial_transcripts_ = transcripts_.size();
+  build_steps_.push_back([](Model &model) { model.Initialize(); });
   initialized_ = true;
 }
 
@@ -3,11 +3,63 @@
 #ifndef SRC_SIMULATION_HPP  // header guard
 #define SRC_SIMULATION_HPP
 
+#include <atomic>
+#include <functional>
+#include <iostream>
+#include <limits>
+#include <map>
 #include <memory>
+#include <stdexcept>
+#include <vector>
 
 #include "gillespie.hpp"
+#include "output.hpp"
 #include "polymer.hpp"
 #include "reaction.hpp"
+#include "tracker.hpp"
+
+/**
+ * Lets a simulation running in one thread be stopped from another.
+ */
+class CancellationToken {
+ public:
+  typedef std::shared_ptr<CancellationToken> Ptr;
+  void Cancel() { cancelled_ = true; }
+  void Reset() { cancelled_ = false; }
+  bool cancelled() const { return cancelled_; }
+
+ private:
+  std::atomic<bool> cancelled_{false};
+};
+
+/**
+ * Thrown when a simulation stops before reaching its time limit. Output up to
+ * the time of interruption has been written.
+ */
+class SimulationInterrupted : public std::runtime_error {
+ public:
+  using std::runtime_error::runtime_error;
+};
+
+/**
+ * Conditions that stop a simulation early, checked every check_interval
+ * iterations.
+ */
+struct RunControl {
+  /**
+   * Stop once this token is cancelled (optional).
+   */
+  CancellationToken::Ptr token;
+  /**
+   * Stop after this many seconds of wall-clock time.
+   */
+  double time_budget = std::numeric_limits<double>::infinity();
+  /**
+   * Stop if this returns true, e.g. because a signal arrived (optional).
+   */
+  std::function<bool()> interrupted;
+  int check_interval = 1000;
+};
 
 /**
  * Coordinate polymers and species-level reactions.
@@ -16,18 +68,78 @@ class Model : public std::enable_shared_from_this<Model> {
  public:
   /**
    * Construct a simulation
+   *
+   * @param cell_volume volume of the simulated system in liters
+   * @param selection method used to select the next reaction ("linear" or
+   *  "tree", see Gillespie::selection())
+   * @param rng pseudo-random engine ("mt19937", "xoshiro256++", or "pcg64",
+   *  see Random::Generator::engine())
    */
-  Model(double cell_volume);
+  Model(double cell_volume, const std::string &selection = "linear",
+        const std::string &rng = "mt19937");
   /**
    * Run the simulation until the given time point and write output to a file.
    *
    * @param prefix for output files
+   * @param method simulation method ("direct", "tau_leap", or
+   *  "next_reaction", see Gillespie::method())
+   * @param epsilon error control parameter for tau-leaping
+   * @param output_format "tsv" or "npz" (see CountsWriter)
+   * @param sparse only record species whose counts changed (npz only)
+   */
+  void Simulate(int time_limit, double time_step, const std::string &output,
+                const std::string &method = "direct", double epsilon = 0.03,
+                const std::string &output_format = "tsv", bool sparse = false);
+  /**
+   * Run the simulation until the given time point and pass counts at each
+   * time step to a writer (e.g. an ArrayWriter to keep them in memory).
+   * The writer is closed however the simulation ends, so counts up to an
+   * interruption or error are kept.
+   *
+   * @param writer receives species counts at each output time
+   * @param method simulation method (see Gillespie::method())
+   * @param epsilon error control parameter for tau-leaping
+   * @param control conditions that stop the simulation early by throwing
+   *  SimulationInterrupted
+   */
+  void Simulate(int time_limit, double time_step, CountsWriter &writer,
+                const std::string &method = "direct", double epsilon = 0.03,
+                const RunControl &control = RunControl());
+  /**
+   * Save the complete state of the simulation, so that it can be continued
+   * later (e.g. after the process was stopped) or used as the starting point
+   * of other simulations.
+   *
+   * @param path file to write
+   */
+  void SaveState(const std::string &path);
+  /**
+   * Continue from a saved simulation state. The model must have been built
+   * in the same way as the saved model (with the same species, reactions,
+   * genomes, and transcripts, added in the same order) and must not have been
+   * simulated yet. Throws std::invalid_argument if the saved state does not
+   * match the model, in which case the model should be discarded.
+   *
+   * @param path file written by SaveState()
    */
-  void Simulate(int time_limit, double time_step, const std::string &output);
+  void LoadState(const std::string &path);
+  void SaveState(std::ostream &out);
+  void LoadState(std::istream &in);
+  /**
+   * Copy this model, including the state of the simulation. The copy is
+   * built by repeating the calls that built this model, so it is independent
+   * of this model and of the Genome and Transcript objects registered with
+   * it. Simulating the copy continues exactly like simulating this model
+   * would.
+   */
+  std::shared_ptr<Model> Clone();
   /**
    * Set a seed for random number generator.
+   *
+   * @param seed seed for the random number generator
+   * @param stream index of an independent random number stream for this seed
    */
-  void seed(int seed);
+  void seed(int seed, int stream = 0);
   /**
    * Run the simulation with dynamic tRNAs. 
    * 
@@ -82,9 +194,6 @@ class Model : public std::enable_shared_from_this<Model> {
   void AddReaction(double rate_constant,
                    const std::vector<std::string> &reactants,
                    const std::vector<std::string> &products);
-  void AddtRNAReaction(double rate_constant,
-                   const std::vector<std::string> &reactants,
-                   const std::vector<std::string> &products);
   /**
    * Add a genome to the list of reactions.
    *
@@ -92,11 +201,28 @@ class Model : public std::enable_shared_from_this<Model> {
    */
   void RegisterGenome(Genome::Ptr genome);
   /**
-   * Add a transcript to the list of reactions.
+   * Add a transcript to the list of reactions. Transcripts may also be
+   * registered after the model has been simulated, e.g. to add variants to a
+   * model that has reached steady state.
    *
    * @param pointer to Transcript object
    */
   void RegisterTranscript(Transcript::Ptr transcript);
+  /**
+   * Register several identical copies of a transcript. Gives the same
+   * simulation as calling RegisterTranscript() with a fresh copy of the
+   * transcript that many times, but the copies share one sequence and gene
+   * layout. The transcript passed in is only used as a template and is not
+   * itself registered.
+   *
+   * @param transcript pointer to template Transcript object
+   * @param copies number of copies to register
+   */
+  void RegisterTranscripts(Transcript::Ptr transcript, int copies);
+  /**
+   * Create binding reactions. Called by Simulate(); does nothing if the model
+   * has already been initialized.
+   */
   void Initialize();
   /**
    * Record when a polymerase reaches a terminator so that we can track total
@@ -107,6 +233,11 @@ class Model : public std::enable_shared_from_this<Model> {
   void CountTermination(const std::string &name);
 
  private:
+  /**
+   * Species counts, lookup tables, and random number generator of this model.
+   * Declared before gillespie_ so that it outlives all reactions.
+   */
+  SpeciesTracker tracker_;
   /**
    * Gillespie object
    */
@@ -131,6 +262,34 @@ class Model : public std::enable_shared_from_this<Model> {
    * Has this model been initialized?
    */
   bool initialized_ = false;
+  /**
+   * Species and binding reactions, in the order in which they were created.
+   * Used to refer to reactions in saved states.
+   */
+  Reaction::VecPtr reactions_;
+  /**
+   * Time of the next output, so that simulating again continues the output
+   * schedule of the previous simulation.
+   */
+  double next_output_ = 0.0;
+  /**
+   * Distinct sequences of registered transcripts, so that copies of a
+   * transcript built separately share one sequence.
+   */
+  std::map<std::string, std::shared_ptr<const Sequence>> sequences_;
+  /**
+   * Distinct site indexes of registered transcripts, by site positions (see
+   * SiteIndex::Positions()).
+   */
+  std::map<std::vector<int>, std::shared_ptr<const SiteIndex>> site_indexes_;
+  /**
+   * Number of transcripts registered before the model was initialized.
+   */
+  int initial_transcripts_ = 0;
+  /**
+   * Calls that built this model, in order, repeated by Clone() on the copy.
+   */
+  std::vector<std::function<void(Model &)>> build_steps_;
   /**
    * Map of terminations.
    */
@@ -141,6 +300,22 @@ class Model : public std::enable_shared_from_this<Model> {
    * @param polymer pointer to Polymer object
    */
   void RegisterPolymer(Polymer::Ptr polymer);
+  /**
+   * Add a transcript produced by a genome to the list of reactions.
+   */
+  void RegisterProducedTranscript(const Transcript::Ptr &transcript);
+  /**
+   * Register a transcript without recording a build step (see Clone()).
+   */
+  void AddTranscript(Transcript::Ptr transcript);
+  /**
+   * Create reactions for ribosomes binding to a transcript that was not
+   * produced by a genome.
+   */
+  void AddTranscriptBindings(Transcript::Ptr transcript);
+  void AddtRNAReaction(double rate_constant,
+                       const std::vector<std::string> &reactants,
+                       const std::vector<std::string> &products);
 };
 
 #endif  // header guard
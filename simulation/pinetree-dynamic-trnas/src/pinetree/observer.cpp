@@ -0,0 +1,148 @@
+#include <cmath>
+#include <stdexcept>
+
+#include "observer.hpp"
+
+namespace {
+const double kNaN = std::numeric_limits<double>::quiet_NaN();
+}
+
+Observer::Observer(const std::vector<std::string> &species,
+                   const std::string &quantity)
+    : quantity_name_(quantity), requested_(species) {
+  if (quantity == "protein") {
+    quantity_ = Quantity::kProtein;
+  } else if (quantity == "transcript") {
+    quantity_ = Quantity::kTranscript;
+  } else if (quantity == "ribo_density") {
+    quantity_ = Quantity::kRiboDensity;
+  } else if (quantity == "collisions") {
+    quantity_ = Quantity::kCollisions;
+  } else {
+    throw std::invalid_argument(
+        "Unknown quantity '" + quantity +
+        "'. Use 'protein', 'transcript', 'ribo_density', or 'collisions'.");
+  }
+  names_ = requested_;
+}
+
+void Observer::Start(SpeciesTracker &tracker) {
+  names_ = requested_;
+  ids_.clear();
+  slot_of_.clear();
+  for (const auto &name : names_) {
+    ids_.push_back(tracker.Intern(name));
+  }
+  Resize(0);
+  Resize(names_.size());
+  started_ = true;
+}
+
+double Observer::Value(const SpeciesCounts &counts) const {
+  switch (quantity_) {
+    case Quantity::kTranscript:
+      return counts.transcript;
+    case Quantity::kRiboDensity:
+      return counts.ribo_density;
+    case Quantity::kCollisions:
+      return counts.collisions;
+    default:
+      return counts.protein;
+  }
+}
+
+void Observer::Write(double time_stamp, SpeciesTracker &tracker) {
+  if (!started_) {
+    Start(tracker);
+  }
+  if (!requested_.empty()) {
+    for (int slot = 0; slot < ids_.size(); slot++) {
+      Observe(time_stamp, slot, Value(tracker.counts(ids_[slot])));
+    }
+    return;
+  }
+  // Observe every reported species, adding species as they appear
+  tracker.GatherCounts(counts_);
+  for (const auto &counts : counts_) {
+    if (counts.species >= slot_of_.size()) {
+      slot_of_.resize(counts.species + 1, -1);
+    }
+    int &slot = slot_of_[counts.species];
+    if (slot < 0) {
+      slot = names_.size();
+      names_.push_back(tracker.species_name(counts.species));
+      ids_.push_back(counts.species);
+      Resize(names_.size());
+    }
+    Observe(time_stamp, slot, Value(counts));
+  }
+}
+
+RunningStats::RunningStats(const std::vector<std::string> &species,
+                           const std::string &quantity, double start,
+                           double stop)
+    : Observer(species, quantity), start_(start), stop_(stop) {
+  if (stop < start) {
+    throw std::invalid_argument("RunningStats: stop must not precede start.");
+  }
+  Resize(species.size());
+}
+
+void RunningStats::Observe(double time_stamp, int slot, double value) {
+  if (time_stamp < start_ || time_stamp > stop_) {
+    return;
+  }
+  count_[slot]++;
+  double delta = value - mean_[slot];
+  mean_[slot] += delta / count_[slot];
+  m2_[slot] += delta * (value - mean_[slot]);
+}
+
+void RunningStats::Resize(int slots) {
+  count_.resize(slots, 0);
+  mean_.resize(slots, 0);
+  m2_.resize(slots, 0);
+}
+
+std::map<std::string, double> RunningStats::variance() const {
+  std::vector<double> variance(count_.size(), kNaN);
+  for (int i = 0; i < count_.size(); i++) {
+    if (count_[i] > 1) {
+      variance[i] = m2_[i] / (count_[i] - 1);
+    }
+  }
+  return ByName(variance);
+}
+
+void LastValue::Observe(double time_stamp, int slot, double value) {
+  values_[slot] = value;
+}
+
+void LastValue::Resize(int slots) { values_.resize(slots, kNaN); }
+
+ThresholdCrossing::ThresholdCrossing(const std::vector<std::string> &species,
+                                     double threshold,
+                                     const std::string &quantity,
+                                     const std::string &direction)
+    : Observer(species, quantity), threshold_(threshold) {
+  if (direction == "rising") {
+    rising_ = true;
+  } else if (direction == "falling") {
+    rising_ = false;
+  } else {
+    throw std::invalid_argument("Unknown direction '" + direction +
+                                "'. Use 'rising' or 'falling'.");
+  }
+  Resize(species.size());
+}
+
+void ThresholdCrossing::Observe(double time_stamp, int slot, double value) {
+  if (!std::isnan(times_[slot])) {
+    return;
+  }
+  if (rising_ ? value >= threshold_ : value <= threshold_) {
+    times_[slot] = time_stamp;
+  }
+}
+
+void ThresholdCrossing::Resize(int slots) { times_.resize(slots, kNaN); }
@@ -0,0 +1,160 @@
+#ifndef SRC_OBSERVER_HPP  // header guard
+#define SRC_OBSERVER_HPP
+
+#include <limits>
+#include <map>
+#include <memory>
+#include <string>
+#include <vector>
+
+#include "output.hpp"
+
+/**
+ * Reduces the counts of selected species to summary statistics while the
+ * simulation runs, so that trajectories do not need to be written out. An
+ * observer sees each species' value at every output time. Statistics are
+ * reset when the observer is used in a new simulation.
+ */
+class Observer : public CountsWriter {
+ public:
+  typedef std::shared_ptr<Observer> Ptr;
+  /**
+   * @param species names of species to observe; if empty, every species
+   *  reported in the output is observed
+   * @param quantity observed column of the output: "protein", "transcript",
+   *  "ribo_density", or "collisions"
+   */
+  Observer(const std::vector<std::string> &species,
+           const std::string &quantity);
+  void Write(double time_stamp, SpeciesTracker &tracker) override;
+  void Close(SpeciesTracker &tracker) override { started_ = false; }
+  /**
+   * Getters and setters.
+   */
+  const std::vector<std::string> &species() const { return names_; }
+  const std::string &quantity() const { return quantity_name_; }
+
+ protected:
+  /**
+   * Record the value of an observed species at an output time.
+   *
+   * @param time_stamp current simulation time
+   * @param slot position of species in species()
+   * @param value observed quantity of species
+   */
+  virtual void Observe(double time_stamp, int slot, double value) = 0;
+  /**
+   * Resize per-species statistics to the number of observed species. A size
+   * of 0 discards all statistics.
+   */
+  virtual void Resize(int slots) = 0;
+  /**
+   * Map species names to per-species statistics.
+   */
+  template <typename T>
+  std::map<std::string, T> ByName(const std::vector<T> &values) const {
+    std::map<std::string, T> out;
+    for (int i = 0; i < names_.size(); i++) {
+      out[names_[i]] = values[i];
+    }
+    return out;
+  }
+
+ private:
+  enum class Quantity { kProtein, kTranscript, kRiboDensity, kCollisions };
+  Quantity quantity_;
+  std::string quantity_name_;
+  /**
+   * Species to observe as given by the user (empty for all species), and
+   * names and IDs of the species observed in the current simulation.
+   */
+  std::vector<std::string> requested_;
+  std::vector<std::string> names_;
+  std::vector<int> ids_;
+  /**
+   * Slot of each species ID, or -1 if not observed yet. Only used when
+   * observing all species.
+   */
+  std::vector<int> slot_of_;
+  std::vector<SpeciesCounts> counts_;
+  bool started_ = false;
+  void Start(SpeciesTracker &tracker);
+  double Value(const SpeciesCounts &counts) const;
+};
+
+/**
+ * Running mean and (sample) variance of each species over the output times
+ * within a time window, computed with Welford's algorithm.
+ */
+class RunningStats : public Observer {
+ public:
+  /**
+   * @param start first simulation time included in the statistics
+   * @param stop last simulation time included in the statistics
+   */
+  RunningStats(const std::vector<std::string> &species,
+               const std::string &quantity = "protein", double start = 0,
+               double stop = std::numeric_limits<double>::infinity());
+  std::map<std::string, double> mean() const { return ByName(mean_); }
+  std::map<std::string, double> variance() const;
+  std::map<std::string, int> count() const { return ByName(count_); }
+
+ protected:
+  void Observe(double time_stamp, int slot, double value) override;
+  void Resize(int slots) override;
+
+ private:
+  double start_;
+  double stop_;
+  std::vector<int> count_;
+  std::vector<double> mean_;
+  std::vector<double> m2_;
+};
+
+/**
+ * Value of each species at the last output time.
+ */
+class LastValue : public Observer {
+ public:
+  LastValue(const std::vector<std::string> &species,
+            const std::string &quantity = "protein")
+      : Observer(species, quantity) {
+    Resize(species.size());
+  }
+  std::map<std::string, double> values() const { return ByName(values_); }
+
+ protected:
+  void Observe(double time_stamp, int slot, double value) override;
+  void Resize(int slots) override;
+
+ private:
+  std::vector<double> values_;
+};
+
+/**
+ * First output time at which each species reaches a threshold. Species that
+ * never reach the threshold have a time of NaN.
+ */
+class ThresholdCrossing : public Observer {
+ public:
+  /**
+   * @param threshold value to reach
+   * @param direction "rising" (reach a value >= threshold) or "falling"
+   *  (reach a value <= threshold)
+   */
+  ThresholdCrossing(const std::vector<std::string> &species, double threshold,
+                    const std::string &quantity = "protein",
+                    const std::string &direction = "rising");
+  std::map<std::string, double> times() const { return ByName(times_); }
+
+ protected:
+  void Observe(double time_stamp, int slot, double value) override;
+  void Resize(int slots) override;
+
+ private:
+  double threshold_;
+  bool rising_;
+  std::vector<double> times_;
+};
+
+#endif  // header guard
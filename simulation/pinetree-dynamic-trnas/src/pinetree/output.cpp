@@ -0,0 +1,454 @@
+#include <algorithm>
+#include <cmath>
+#include <stdexcept>
+
+#include "output.hpp"
+
+namespace {
+/**
+ * Bytes of the column arrays per row of .npz output.
+ */
+const uint64_t kNpzRowSize = 2 * sizeof(double) + 4 * sizeof(int32_t);
+/**
+ * Largest size of the column arrays in an .npz file. Zip archives without
+ * ZIP64 records are limited to 4 GiB; the rest is left for headers and
+ * species names.
+ */
+const uint64_t kNpzMaxData = 0xffffffffULL - (64ULL << 20);
+
+/**
+ * Lookup table for the CRC-32 checksum used by zip archives.
+ */
+struct Crc32Table {
+  uint32_t values[256];
+  Crc32Table() {
+    for (uint32_t i = 0; i < 256; i++) {
+      uint32_t c = i;
+      for (int k = 0; k < 8; k++) {
+        c = (c & 1) ? 0xedb88320U ^ (c >> 1) : c >> 1;
+      }
+      values[i] = c;
+    }
+  }
+};
+
+uint32_t UpdateCrc32(uint32_t crc, const char *data, size_t size) {
+  static const Crc32Table table;
+  crc = ~crc;
+  for (size_t i = 0; i < size; i++) {
+    crc = table.values[(crc ^ static_cast<uint8_t>(data[i])) & 0xff] ^
+          (crc >> 8);
+  }
+  return ~crc;
+}
+
+/**
+ * Append little-endian integers, as used in zip headers.
+ */
+void PutLE(std::string &out, uint32_t value, int bytes) {
+  for (int i = 0; i < bytes; i++) {
+    out.push_back(static_cast<char>((value >> (8 * i)) & 0xff));
+  }
+}
+
+/**
+ * Byte order character for NumPy type descriptions on this platform.
+ */
+char ByteOrder() {
+  const uint16_t probe = 1;
+  return *reinterpret_cast<const char *>(&probe) == 1 ? '<' : '>';
+}
+
+/**
+ * Header of a one-dimensional .npy array (format version 1.0).
+ *
+ * @param descr NumPy type description, e.g. "<f8"
+ * @param length number of elements
+ */
+std::string NpyHeader(const std::string &descr, long length) {
+  std::string dict = "{'descr': '" + descr +
+                     "', 'fortran_order': False, 'shape': (" +
+                     std::to_string(length) + ",), }";
+  // Pad with spaces so that the array data starts on a 64-byte boundary
+  const size_t kPreamble = 10;
+  size_t total = kPreamble + dict.size() + 1;
+  dict.append((64 - total % 64) % 64, ' ');
+  dict.push_back('\n');
+  std::string header("\x93NUMPY\x01\x00", 8);
+  PutLE(header, dict.size(), 2);
+  return header + dict;
+}
+
+/**
+ * Decode UTF-8 into code points, as stored by NumPy unicode arrays.
+ */
+std::vector<uint32_t> DecodeUtf8(const std::string &text) {
+  std::vector<uint32_t> points;
+  size_t i = 0;
+  while (i < text.size()) {
+    uint8_t c = text[i];
+    int extra = c >= 0xf0 ? 3 : c >= 0xe0 ? 2 : c >= 0xc0 ? 1 : 0;
+    uint32_t point = extra == 0 ? c : c & (0x3f >> extra);
+    for (int k = 1; k <= extra && i + k < text.size(); k++) {
+      point = (point << 6) | (static_cast<uint8_t>(text[i + k]) & 0x3f);
+    }
+    points.push_back(point);
+    i += extra + 1;
+  }
+  return points;
+}
+
+/**
+ * Minimal writer for uncompressed ("stored") zip archives, which is all that
+ * numpy.load() needs to read an .npz file.
+ */
+class ZipWriter {
+ public:
+  explicit ZipWriter(const std::string &path)
+      : file_(path, std::ios::binary | std::ios::trunc) {
+    if (!file_) {
+      throw std::runtime_error("Could not open output file '" + path + "'.");
+    }
+  }
+  /**
+   * Start a new entry of a known size. Data is added with Append() and the
+   * checksum is filled in by EndEntry().
+   */
+  void BeginEntry(const std::string &name, uint64_t size) {
+    if (size > 0xffffffffULL || offset_ > 0xffffffffULL) {
+      throw std::runtime_error(
+          "Output is too large for an .npz file; use output_format='tsv'.");
+    }
+    Entry entry = {name, static_cast<uint32_t>(size), 0, offset_};
+    entries_.push_back(entry);
+    std::string header;
+    PutLE(header, 0x04034b50, 4);  // local file header signature
+    PutLE(header, 20, 2);          // version needed to extract
+    PutLE(header, 0, 2);           // flags
+    PutLE(header, 0, 2);           // compression method (stored)
+    PutLE(header, 0, 2);           // modification time
+    PutLE(header, 0x21, 2);        // modification date (1980-01-01)
+    PutLE(header, 0, 4);           // crc-32, filled in by EndEntry()
+    PutLE(header, size, 4);        // compressed size
+    PutLE(header, size, 4);        // uncompressed size
+    PutLE(header, name.size(), 2);
+    PutLE(header, 0, 2);  // extra field length
+    header += name;
+    Raw(header.data(), header.size());
+    crc_ = 0;
+  }
+  void Append(const char *data, size_t size) {
+    crc_ = UpdateCrc32(crc_, data, size);
+    Raw(data, size);
+  }
+  void EndEntry() {
+    Entry &entry = entries_.back();
+    entry.crc = crc_;
+    std::string crc;
+    PutLE(crc, crc_, 4);
+    file_.seekp(entry.offset + 14);
+    file_.write(crc.data(), crc.size());
+    file_.seekp(offset_);
+  }
+  /**
+   * Write the central directory and close the archive.
+   */
+  void Close() {
+    std::string directory;
+    for (const auto &entry : entries_) {
+      PutLE(directory, 0x02014b50, 4);  // central directory signature
+      PutLE(directory, 20, 2);          // version made by
+      PutLE(directory, 20, 2);          // version needed to extract
+      PutLE(directory, 0, 2);           // flags
+      PutLE(directory, 0, 2);           // compression method
+      PutLE(directory, 0, 2);           // modification time
+      PutLE(directory, 0x21, 2);        // modification date
+      PutLE(directory, entry.crc, 4);
+      PutLE(directory, entry.size, 4);
+      PutLE(directory, entry.size, 4);
+      PutLE(directory, entry.name.size(), 2);
+      PutLE(directory, 0, 2);  // extra field length
+      PutLE(directory, 0, 2);  // comment length
+      PutLE(directory, 0, 2);  // disk number
+      PutLE(directory, 0, 2);  // internal attributes
+      PutLE(directory, 0, 4);  // external attributes
+      PutLE(directory, entry.offset, 4);
+      directory += entry.name;
+    }
+    uint64_t directory_offset = offset_;
+    uint32_t directory_size = directory.size();
+    if (directory_offset > 0xffffffffULL) {
+      throw std::runtime_error(
+          "Output is too large for an .npz file; use output_format='tsv'.");
+    }
+    PutLE(directory, 0x06054b50, 4);  // end of central directory signature
+    PutLE(directory, 0, 2);           // disk number
+    PutLE(directory, 0, 2);           // disk with central directory
+    PutLE(directory, entries_.size(), 2);
+    PutLE(directory, entries_.size(), 2);
+    PutLE(directory, directory_size, 4);
+    PutLE(directory, directory_offset, 4);
+    PutLE(directory, 0, 2);  // comment length
+    Raw(directory.data(), directory.size());
+    file_.close();
+  }
+
+ private:
+  struct Entry {
+    std::string name;
+    uint32_t size;
+    uint32_t crc;
+    uint64_t offset;
+  };
+  std::ofstream file_;
+  std::vector<Entry> entries_;
+  uint64_t offset_ = 0;
+  uint32_t crc_ = 0;
+  void Raw(const char *data, size_t size) {
+    file_.write(data, size);
+    offset_ += size;
+  }
+};
+
+/**
+ * Are all reported counts of two rows equal?
+ */
+bool SameCounts(const SpeciesCounts &a, const SpeciesCounts &b) {
+  return a.protein == b.protein && a.transcript == b.transcript &&
+         a.collisions == b.collisions &&
+         (a.ribo_density == b.ribo_density ||
+          (std::isnan(a.ribo_density) && std::isnan(b.ribo_density)));
+}
+
+template <typename T>
+void SpillColumn(std::FILE *file, std::vector<T> &column) {
+  if (!column.empty() &&
+      std::fwrite(column.data(), sizeof(T), column.size(), file) !=
+          column.size()) {
+    throw std::runtime_error("Could not write temporary output file.");
+  }
+  column.clear();
+}
+
+/**
+ * Add one column to the archive as an .npy entry.
+ */
+void WriteColumn(ZipWriter &zip, const std::string &name,
+                 const std::string &type, size_t item_size, long length,
+                 std::FILE *spill) {
+  std::string header = NpyHeader(ByteOrder() + type, length);
+  zip.BeginEntry(name + ".npy", header.size() + item_size * length);
+  zip.Append(header.data(), header.size());
+  std::rewind(spill);
+  std::vector<char> buffer(1 << 16);
+  size_t read;
+  while ((read = std::fread(buffer.data(), 1, buffer.size(), spill)) > 0) {
+    zip.Append(buffer.data(), read);
+  }
+  zip.EndEntry();
+}
+}  // namespace
+
+CountsWriter::Ptr CountsWriter::Create(const std::string &format,
+                                       const std::string &path, bool sparse) {
+  const std::string npz = ".npz";
+  bool npz_path =
+      path.size() >= npz.size() &&
+      path.compare(path.size() - npz.size(), npz.size(), npz) == 0;
+  if (format == "tsv" || (format.empty() && !npz_path)) {
+    if (sparse) {
+      throw std::invalid_argument(
+          "Sparse output requires output_format='npz'.");
+    }
+    // Text in a file named .npz would be mistaken for an archive
+    if (npz_path) {
+      throw std::invalid_argument("Output file '" + path +
+                                  "' ends in .npz; use output_format='npz'.");
+    }
+    return Ptr(new TsvWriter(path));
+  } else if (format == "npz" || format.empty()) {
+    return Ptr(new NpzWriter(path, sparse));
+  }
+  throw std::invalid_argument("Unknown output format '" + format +
+                              "'. Use 'tsv' or 'npz'.");
+}
+
+void WriterGroup::Write(double time_stamp, SpeciesTracker &tracker) {
+  for (auto writer : writers_) {
+    writer->Write(time_stamp, tracker);
+  }
+}
+
+void WriterGroup::Close(SpeciesTracker &tracker) {
+  for (auto writer : writers_) {
+    writer->Close(tracker);
+  }
+}
+
+TsvWriter::TsvWriter(const std::string &path)
+    : file_(path, std::ios::trunc) {
+  file_ << "time\tspecies\tprotein\ttranscript\tribo_density\tcollisions\n";
+}
+
+void TsvWriter::Write(double time_stamp, SpeciesTracker &tracker) {
+  tracker.GatherCounts(counts_);
+  text_.clear();
+  tracker.FormatCounts(time_stamp, counts_, text_);
+  file_.write(text_.data(), text_.size());
+  file_.flush();
+}
+
+void TsvWriter::Close(SpeciesTracker &tracker) { file_.close(); }
+
+NpzWriter::NpzWriter(const std::string &path, bool sparse, int batch_size)
+    : path_(path), sparse_(sparse), batch_size_(batch_size) {
+  for (int i = 0; i < 6; i++) {
+    std::FILE *file = std::tmpfile();
+    if (file == nullptr) {
+      throw std::runtime_error("Could not create temporary output file.");
+    }
+    spill_.push_back(file);
+  }
+}
+
+NpzWriter::~NpzWriter() {
+  for (auto file : spill_) {
+    std::fclose(file);
+  }
+}
+
+void NpzWriter::Write(double time_stamp, SpeciesTracker &tracker) {
+  size_t buffered = time_.size();
+  tracker.GatherCounts(counts_);
+  // Fail before recording rows that do not fit, rather than in Close() after
+  // the whole simulation. The rows so far still make a valid archive.
+  uint64_t size = (rows_ + counts_.size()) * kNpzRowSize +
+                  (output_time_.size() + 1) * sizeof(double);
+  if (size > kNpzMaxData) {
+    throw std::runtime_error(
+        "Output is too large for an .npz file; use output_format='tsv'.");
+  }
+  output_time_.push_back(time_stamp);
+  for (const auto &row : counts_) {
+    if (sparse_) {
+      if (row.species >= last_.size()) {
+        last_.resize(row.species + 1);
+        recorded_.resize(row.species + 1, false);
+      }
+      if (recorded_[row.species] && SameCounts(last_[row.species], row)) {
+        continue;
+      }
+      last_[row.species] = row;
+      recorded_[row.species] = true;
+    }
+    time_.push_back(time_stamp);
+    species_.push_back(row.species);
+    protein_.push_back(row.protein);
+    transcript_.push_back(row.transcript);
+    ribo_density_.push_back(row.ribo_density);
+    collisions_.push_back(row.collisions);
+  }
+  rows_ += time_.size() - buffered;
+  if (time_.size() >= batch_size_) {
+    Spill();
+  }
+}
+
+void NpzWriter::Spill() {
+  SpillColumn(spill_[0], time_);
+  SpillColumn(spill_[1], species_);
+  SpillColumn(spill_[2], protein_);
+  SpillColumn(spill_[3], transcript_);
+  SpillColumn(spill_[4], ribo_density_);
+  SpillColumn(spill_[5], collisions_);
+}
+
+void NpzWriter::Close(SpeciesTracker &tracker) {
+  Spill();
+  ZipWriter zip(path_);
+  WriteColumn(zip, "time", "f8", sizeof(double), rows_, spill_[0]);
+  WriteColumn(zip, "species", "i4", sizeof(int32_t), rows_, spill_[1]);
+  WriteColumn(zip, "protein", "i4", sizeof(int32_t), rows_, spill_[2]);
+  WriteColumn(zip, "transcript", "i4", sizeof(int32_t), rows_, spill_[3]);
+  WriteColumn(zip, "ribo_density", "f8", sizeof(double), rows_, spill_[4]);
+  WriteColumn(zip, "collisions", "i4", sizeof(int32_t), rows_, spill_[5]);
+  std::string header = NpyHeader(ByteOrder() + std::string("f8"),
+                                 output_time_.size());
+  zip.BeginEntry("output_time.npy",
+                 header.size() + output_time_.size() * sizeof(double));
+  zip.Append(header.data(), header.size());
+  zip.Append(reinterpret_cast<const char *>(output_time_.data()),
+             output_time_.size() * sizeof(double));
+  zip.EndEntry();
+  header = NpyHeader("|b1", 1);
+  char sparse = sparse_ ? 1 : 0;
+  zip.BeginEntry("sparse.npy", header.size() + 1);
+  zip.Append(header.data(), header.size());
+  zip.Append(&sparse, 1);
+  zip.EndEntry();
+  // Species dictionary as a fixed-width unicode array, indexed by ID
+  std::vector<std::vector<uint32_t>> names;
+  size_t width = 1;
+  for (int id = 0; id < tracker.species_count(); id++) {
+    names.push_back(DecodeUtf8(tracker.species_name(id)));
+    width = std::max(width, names.back().size());
+  }
+  std::vector<uint32_t> data(width * names.size(), 0);
+  for (size_t i = 0; i < names.size(); i++) {
+    std::copy(names[i].begin(), names[i].end(), data.begin() + i * width);
+  }
+  header =
+      NpyHeader(ByteOrder() + ("U" + std::to_string(width)), names.size());
+  zip.BeginEntry("species_names.npy",
+                 header.size() + data.size() * sizeof(uint32_t));
+  zip.Append(header.data(), header.size());
+  zip.Append(reinterpret_cast<const char *>(data.data()),
+             data.size() * sizeof(uint32_t));
+  zip.EndEntry();
+  zip.Close();
+}
+
+void ArrayWriter::Write(double time_stamp, SpeciesTracker &tracker) {
+  tracker.GatherCounts(counts_);
+  result_->time.push_back(time_stamp);
+  offsets_.push_back(rows_.size());
+  rows_.insert(rows_.end(), counts_.begin(), counts_.end());
+}
+
+void ArrayWriter::Close(SpeciesTracker &tracker) {
+  // Rows of the result, in order of species name
+  std::vector<int> ids;
+  std::vector<int> row_of(tracker.species_count(), -1);
+  for (const auto &counts : rows_) {
+    if (row_of[counts.species] < 0) {
+      row_of[counts.species] = 0;
+      ids.push_back(counts.species);
+    }
+  }
+  std::sort(ids.begin(), ids.end(), [&tracker](int a, int b) {
+    return tracker.species_name(a) < tracker.species_name(b);
+  });
+  for (int row = 0; row < ids.size(); row++) {
+    row_of[ids[row]] = row;
+    result_->species.push_back(tracker.species_name(ids[row]));
+  }
+  size_t columns = result_->time.size();
+  size_t size = ids.size() * columns;
+  result_->protein.assign(size, 0);
+  result_->transcript.assign(size, 0);
+  result_->ribo_density.assign(size, 0);
+  result_->collisions.assign(size, 0);
+  offsets_.push_back(rows_.size());
+  for (size_t column = 0; column < columns; column++) {
+    for (size_t i = offsets_[column]; i < offsets_[column + 1]; i++) {
+      const auto &counts = rows_[i];
+      size_t index = row_of[counts.species] * columns + column;
+      result_->protein[index] = counts.protein;
+      result_->transcript[index] = counts.transcript;
+      result_->ribo_density[index] = counts.ribo_density;
+      result_->collisions[index] = counts.collisions;
+    }
+  }
+  std::vector<SpeciesCounts>().swap(rows_);
+  std::vector<size_t>().swap(offsets_);
+}
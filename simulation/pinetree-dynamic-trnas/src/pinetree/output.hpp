@@ -0,0 +1,175 @@
+#ifndef SRC_OUTPUT_HPP  // header guard
+#define SRC_OUTPUT_HPP
+
+#include <cstdint>
+#include <cstdio>
+#include <fstream>
+#include <memory>
+#include <string>
+#include <vector>
+
+#include "tracker.hpp"
+
+/**
+ * Writes species counts at each output time of a simulation.
+ */
+class CountsWriter {
+ public:
+  typedef std::unique_ptr<CountsWriter> Ptr;
+  virtual ~CountsWriter() {}
+  /**
+   * Construct a writer for an output format.
+   *
+   * @param format "tsv", "npz", or empty to choose "npz" for paths ending
+   *  in .npz and "tsv" otherwise
+   * @param path name of output file (must not end in .npz for "tsv")
+   * @param sparse only record species whose counts changed since the
+   *  previous output time (npz only, see NpzWriter)
+   */
+  static Ptr Create(const std::string &format, const std::string &path,
+                    bool sparse = false);
+  /**
+   * Record the current counts of all species.
+   *
+   * @param time_stamp current simulation time
+   * @param tracker species tracker of the model being simulated
+   */
+  virtual void Write(double time_stamp, SpeciesTracker &tracker) = 0;
+  /**
+   * Finish writing the output file.
+   */
+  virtual void Close(SpeciesTracker &tracker) = 0;
+};
+
+/**
+ * Passes counts on to several writers, e.g. an output file and observers.
+ * Writers are not owned by the group.
+ */
+class WriterGroup : public CountsWriter {
+ public:
+  void Add(CountsWriter *writer) { writers_.push_back(writer); }
+  void Write(double time_stamp, SpeciesTracker &tracker) override;
+  void Close(SpeciesTracker &tracker) override;
+
+ private:
+  std::vector<CountsWriter *> writers_;
+};
+
+/**
+ * Tab-separated text, one row per species and output time.
+ */
+class TsvWriter : public CountsWriter {
+ public:
+  explicit TsvWriter(const std::string &path);
+  void Write(double time_stamp, SpeciesTracker &tracker) override;
+  void Close(SpeciesTracker &tracker) override;
+
+ private:
+  std::ofstream file_;
+  /**
+   * Counts and text of the current output time, reused between output times.
+   */
+  std::vector<SpeciesCounts> counts_;
+  std::string text_;
+};
+
+/**
+ * Uncompressed NumPy .npz archive with one typed array per column of the TSV
+ * output ("time", "species", "protein", "transcript", "ribo_density", and
+ * "collisions"), plus a "species_names" dictionary that maps the integer IDs
+ * in "species" to names, the list of all output times ("output_time"), and
+ * a flag for sparse output ("sparse"). Rows are buffered in memory and
+ * spilled to temporary files in batches; the archive is assembled in
+ * Close(). Archives are limited to 4 GiB (no ZIP64 records), and Write()
+ * throws once the next output time would not fit.
+ *
+ * Sparse archives only contain a row for a species at an output time if any
+ * of its counts differ from the previous row recorded for that species. The
+ * full table can be recovered by carrying rows forward to later output times
+ * (see pinetree.read_counts()).
+ */
+class NpzWriter : public CountsWriter {
+ public:
+  /**
+   * @param path name of output file
+   * @param sparse only record species whose counts changed
+   * @param batch_size number of rows buffered in memory between spills
+   */
+  explicit NpzWriter(const std::string &path, bool sparse = false,
+                     int batch_size = 65536);
+  ~NpzWriter();
+  NpzWriter(NpzWriter const &) = delete;
+  void operator=(NpzWriter const &) = delete;
+  void Write(double time_stamp, SpeciesTracker &tracker) override;
+  void Close(SpeciesTracker &tracker) override;
+
+ private:
+  std::string path_;
+  bool sparse_;
+  int batch_size_;
+  long rows_ = 0;
+  std::vector<double> output_time_;
+  /**
+   * Last recorded counts of each species ID, for sparse output.
+   */
+  std::vector<SpeciesCounts> last_;
+  std::vector<bool> recorded_;
+  /**
+   * Counts gathered from the tracker, reused between output times.
+   */
+  std::vector<SpeciesCounts> counts_;
+  /**
+   * Buffered rows that have not been spilled yet, one vector per column.
+   */
+  std::vector<double> time_;
+  std::vector<int32_t> species_;
+  std::vector<int32_t> protein_;
+  std::vector<int32_t> transcript_;
+  std::vector<double> ribo_density_;
+  std::vector<int32_t> collisions_;
+  /**
+   * Temporary spill file for each column, in the order of the columns above.
+   */
+  std::vector<std::FILE *> spill_;
+  void Spill();
+};
+
+/**
+ * Species counts of a simulation held in memory. Each count is a matrix with
+ * one row per species (sorted by name, as in the TSV output) and one column
+ * per output time, stored in row-major order. Species that have not appeared
+ * yet at an output time have counts of zero.
+ */
+struct SimulationResult {
+  typedef std::shared_ptr<SimulationResult> Ptr;
+  std::vector<double> time;
+  std::vector<std::string> species;
+  std::vector<int32_t> protein;
+  std::vector<int32_t> transcript;
+  std::vector<double> ribo_density;
+  std::vector<int32_t> collisions;
+};
+
+/**
+ * Collects counts in memory instead of writing a file. The matrices of the
+ * SimulationResult are filled in by Close().
+ */
+class ArrayWriter : public CountsWriter {
+ public:
+  ArrayWriter() : result_(std::make_shared<SimulationResult>()) {}
+  void Write(double time_stamp, SpeciesTracker &tracker) override;
+  void Close(SpeciesTracker &tracker) override;
+  SimulationResult::Ptr result() { return result_; }
+
+ private:
+  SimulationResult::Ptr result_;
+  /**
+   * Counts of all output times, and the position of the first row of each
+   * output time in rows_.
+   */
+  std::vector<SpeciesCounts> rows_;
+  std::vector<size_t> offsets_;
+  std::vector<SpeciesCounts> counts_;
+};
+
+#endif  // header guard
@@ -3,8 +3,37 @@
 #include "choices.hpp"
 #include "tracker.hpp"
 
+#include <algorithm>
 #include <iostream>
 
+const int Sequence::kNoCodon;
+
+Sequence::Sequence(const std::string &nucleotides)
+    : nucleotides_(nucleotides), codons_(nucleotides.size(), kNoCodon) {
+  for (int i = 0; i + 3 <= size(); i++) {
+    codons_[i] = Encode(nucleotides_.substr(i, 3));
+  }
+}
+
+int Sequence::Encode(const std::string &codon) {
+  if (codon.size() != 3) {
+    return kNoCodon;
+  }
+  int code = 0;
+  for (char nucleotide : codon) {
+    int value;
+    switch (nucleotide) {
+      case 'A': value = 0; break;
+      case 'C': value = 1; break;
+      case 'G': value = 2; break;
+      case 'T': value = 3; break;
+      default: return kNoCodon;
+    }
+    code = code * 4 + value;
+  }
+  return code;
+}
+
 MobileElementManager::MobileElementManager() {}
 void MobileElementManager::Insert(MobileElement::Ptr pol,
                                   Polymer::Ptr polymer) {
@@ -13,125 +42,236 @@ void MobileElementManager::Insert(MobileElement::Ptr pol,
   auto pol_polymer = std::make_pair(pol, polymer);
   auto it =
       std::upper_bound(polymerases_.begin(), polymerases_.end(), pol_polymer,
-                       [](std::pair<MobileElement::Ptr, Polymer::Ptr> a,
-                          std::pair<MobileElement::Ptr, Polymer::Ptr> b) {
+                       [](const std::pair<MobileElement::Ptr, Polymer::Ptr> &a,
+                          const std::pair<MobileElement::Ptr, Polymer::Ptr> &b) {
                          return a.first->start() < b.first->start();
                        });
   // Record position for prop_list_
   // NOTE: iterators become invalid as soon as a vector is changed!!
   // Attempting to use an iterator twice will lead to a segfault.
   auto prop_it = (it - polymerases_.begin()) + prop_list_.begin();
+  auto codon_it = (it - polymerases_.begin()) + codon_list_.begin();
   // Add polymerase to this polymer
   polymerases_.insert(it, std::make_pair(pol, polymer));
   
   //Set propensity
   double weight = 1;
-  auto &tracker = SpeciesTracker::Instance();
-  if (pol->name() == "__ribosome" && !tracker.codon_map().empty()) { 
-    weight--;
+  int codon = -1;
+  if (CodonWeighted(pol)) {
+    auto &tracker = *tracker_;
     /**
      * Steps:
      * 1. get pol position, codon from indexing sequence
-     * 2. get anticodon(s) from codon-anticodon map
-     * 3. get the total number of available tRNAs
+     * 2. get the total number of available tRNAs for this codon
+     * 3. add the ribosome to the bucket for this codon
      */
-    std::string codon = seq_.substr(pol->stop(), 3);
-    //std::cout << codon << std::endl;
-    //std::cout << pol->stop() << std::endl;
-    auto anticodons = tracker.codon_map().find(codon);
-    for (auto const& anticodon : anticodons->second) {
-      //std::cout << anticodon << std::endl;
-      weight += tracker.species().find(anticodon + "_charged")->second;
-    }
+    codon = CodonId(pol->stop());
+    weight = tracker.codon_weight(codon);
+    OccupyCodon(codon, pol->speed());
+  } else {
+    // Update total move propensity of this polymer
+    prop_sum_ += weight * pol->speed();
   }
-  // Update total move propensity of this polymer
-  prop_sum_ += weight * pol->speed();
+  codon_list_.insert(codon_it, codon);
   prop_list_.insert(prop_it, weight * pol->speed());
 
   if (prop_list_.size() != polymerases_.size()) {
     throw std::runtime_error("Prop list not correct size.");
   }
   // Keep running count of non-RNAse mobile elements
-  if (pol->name() != "__rnase") {
+  if (pol->kind() != MobileElement::Kind::kRnase) {
     pol_count_ += 1;
   }
 }
 
 void MobileElementManager::Delete(int index) {
-  prop_sum_ -= prop_list_[index];
   // Keep running count of non-RNAse mobile elements
-  if (polymerases_[index].first->name() != "__rnase") {
+  if (polymerases_[index].first->kind() != MobileElement::Kind::kRnase) {
     pol_count_ -= 1;
   }
+  if (codon_list_[index] == -1) {
+    prop_sum_ -= prop_list_[index];
+  } else {
+    VacateCodon(codon_list_[index], polymerases_[index].first->speed());
+  }
   polymerases_.erase(polymerases_.begin() + index);
   prop_list_.erase(prop_list_.begin() + index);
+  codon_list_.erase(codon_list_.begin() + index);
   if (prop_list_.size() != polymerases_.size()) {
     throw std::runtime_error("Prop list not correct size.");
   }
 }
 
 void MobileElementManager::UpdatePropensity(int index) {
-  auto pol = GetPol(index);
+  const auto &pol = GetPol(index);
   int position_index = pol->stop();
-  auto &tracker = SpeciesTracker::Instance();
-  double weight = 1; 
-  if (pol->name() == "__ribosome" && !tracker.codon_map().empty()) {
-    if (position_index >= seq_.size() || position_index < 0) {
-      throw std::runtime_error("Genome sequence not correct size.");
-    }
-    weight--;
-    std::string codon = seq_.substr(pol->stop(), 3);
-    //std::cout << codon << std::endl;
-    // std::vector<std::string> stop_codons = {"TAG", "TAA", "TGA"};
-    // check if occupied codon is a stop codon
-    // if (std::find(stop_codons.begin(), stop_codons.end(), codon) == stop_codons.end()) {
-    auto anticodons = tracker.codon_map().find(codon);
-    for (auto const& anticodon : anticodons->second) {
-      // std::cout << anticodon << std::endl;
-      weight += tracker.species().find(anticodon + "_charged")->second;
+  if (CodonWeighted(pol)) {
+    auto &tracker = *tracker_;
+    int codon = CodonId(position_index);
+    if (codon != codon_list_[index]) {
+      if (codon_list_[index] != -1) {
+        VacateCodon(codon_list_[index], pol->speed());
+      }
+      OccupyCodon(codon, pol->speed());
+      codon_list_[index] = codon;
     }
+    prop_list_[index] = tracker.codon_weight(codon) * pol->speed();
+    return;
   }
-  double new_speed = weight * pol->speed();
+  double new_speed = pol->speed();
   double diff = new_speed - prop_list_[index];
   prop_sum_ += diff;
   prop_list_[index] = new_speed;
 }
 
+int MobileElementManager::CodonId(int position) const {
+  if (!seq_ || position >= seq_->size() || position < 0) {
+    throw std::runtime_error("Genome sequence not correct size.");
+  }
+  int codon = tracker_->codon_id(seq_->codon(position));
+  if (codon == -1) {
+    // Not a codon of A, C, G, and T in the map; look up the name, which
+    // throws if the map does not contain it either
+    codon = tracker_->codon_id(seq_->nucleotides().substr(position, 3));
+  }
+  return codon;
+}
+
+bool MobileElementManager::CodonWeighted(const MobileElement::Ptr &pol) {
+  return tracker_ != nullptr &&
+         pol->kind() == MobileElement::Kind::kRibosome &&
+         !tracker_->codon_map().empty();
+}
+
 void MobileElementManager::UpdateAllPropensities() {
   for (int i = 0; i < polymerases_.size(); i++) {
-    UpdatePropensity(i);
+    if (codon_list_[i] != -1) {
+      prop_list_[i] = tracker_->codon_weight(codon_list_[i]) *
+                      polymerases_[i].first->speed();
+    }
+  }
+}
+
+double MobileElementManager::prop_sum() {
+  double prop_sum = prop_sum_;
+  for (int codon = 0; codon < codon_counts_.size(); codon++) {
+    if (codon_counts_[codon] != 0) {
+      prop_sum += tracker_->codon_weight(codon) * codon_speeds_[codon];
+    }
   }
+  return prop_sum;
 }
 
 void MobileElementManager::DecrementtRNA(int stop) {
-  int position_index = stop;
-  auto &tracker = SpeciesTracker::Instance();
-  if (position_index >= seq_.size() || position_index < 0) {
+  if (!seq_ || stop >= seq_->size() || stop < 0) {
     throw std::runtime_error("Genome sequence not correct size.");
   }
-  std::string codon = seq_.substr(position_index, 3);
-  // std::cout << codon << std::endl;
-  std::vector<std::string> stop_codons = {"TAG", "TAA", "TGA"};
-  // check if occupied codon is a stop codon
-  if (std::find(stop_codons.begin(), stop_codons.end(), codon) == stop_codons.end()) {
-    auto anticodons = tracker.codon_map().find(codon)->second;
-    std::vector<double> weights;
-    for (auto const& anticodon : anticodons) {
-      // std::cout << anticodon << std::endl;
-      int weight = tracker.species().find(anticodon + "_charged")->second;
-      // std::cout << weight << std::endl;
-      weights.push_back(weight * 1.0);
+  // Stop codons do not consume a tRNA
+  if (!Sequence::IsStop(seq_->codon(stop))) {
+    tracker_->ConsumetRNA(CodonId(stop));
+  }
+}
+
+void MobileElementManager::OccupyCodon(int codon, double speed) {
+  if (codon >= codon_counts_.size()) {
+    codon_counts_.resize(codon + 1, 0);
+    codon_speeds_.resize(codon + 1, 0);
+  }
+  codon_counts_[codon]++;
+  codon_speeds_[codon] += speed;
+  auto wrapper = wrapper_.lock();
+  if (codon_counts_[codon] == 1 && wrapper) {
+    tracker_->AddCodonDependency(codon, wrapper);
+  }
+}
+
+void MobileElementManager::VacateCodon(int codon, double speed) {
+  codon_counts_[codon]--;
+  codon_speeds_[codon] -= speed;
+  if (codon_counts_[codon] == 0) {
+    // Reset exactly so that rounding error cannot accumulate in empty buckets
+    codon_speeds_[codon] = 0;
+    auto wrapper = wrapper_.lock();
+    if (wrapper) {
+      tracker_->RemoveCodonDependency(codon, wrapper);
+    }
+  }
+}
+
+void MobileElementManager::SaveState(StateWriter &out) const {
+  out.Write<int64_t>(polymerases_.size());
+  for (int i = 0; i < polymerases_.size(); i++) {
+    const auto &pol = polymerases_[i].first;
+    // Everything bound to a polymer is either a Polymerase or an Rnase
+    auto polymerase = std::dynamic_pointer_cast<Polymerase>(pol);
+    out.Write(polymerase != nullptr);
+    out.Write(pol->name());
+    out.Write(pol->footprint());
+    out.Write(pol->speed());
+    out.Write(pol->start());
+    out.Write(pol->stop());
+    out.Write(pol->reading_frame());
+    out.Write(pol->gene_bound());
+    out.Write(polymerase ? polymerase->step() : 1);
+    out.WritePolymer(polymerases_[i].second);
+    out.Write(prop_list_[i]);
+    out.Write(codon_list_[i]);
+  }
+  out.Write(prop_sum_);
+  out.Write(pol_count_);
+  out.Write(codon_counts_);
+  out.Write(codon_speeds_);
+}
+
+void MobileElementManager::LoadState(StateReader &in) {
+  polymerases_.clear();
+  prop_list_.clear();
+  codon_list_.clear();
+  int64_t count = in.ReadSize();
+  for (int64_t i = 0; i < count; i++) {
+    bool is_polymerase = in.Read<bool>();
+    std::string name = in.ReadString();
+    int footprint = in.Read<int>();
+    double speed = in.Read<double>();
+    MobileElement::Ptr pol;
+    if (is_polymerase) {
+      pol = std::make_shared<Polymerase>(name, footprint, speed);
+    } else {
+      pol = std::make_shared<Rnase>(footprint, speed);
+    }
+    pol->start(in.Read<int>());
+    pol->stop(in.Read<int>());
+    pol->reading_frame(in.Read<int>());
+    pol->gene_bound(in.ReadString());
+    if (is_polymerase && tracker_ != nullptr) {
+      pol->species_id(tracker_->Intern(name));
+    }
+    int step = in.Read<int>();
+    if (is_polymerase) {
+      std::static_pointer_cast<Polymerase>(pol)->step(step);
+    }
+    polymerases_.emplace_back(pol, in.ReadPolymer());
+    prop_list_.push_back(in.Read<double>());
+    codon_list_.push_back(in.Read<int>());
+  }
+  prop_sum_ = in.Read<double>();
+  pol_count_ = in.Read<int>();
+  codon_counts_ = in.ReadVector<int>();
+  codon_speeds_ = in.ReadVector<double>();
+  if (codon_counts_.size() != codon_speeds_.size() ||
+      (tracker_ != nullptr && codon_counts_.size() > tracker_->codon_count())) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
+  }
+  // Ribosomes on this polymer depend on the tRNAs reading their codons
+  auto wrapper = wrapper_.lock();
+  for (int codon = 0; codon < codon_counts_.size(); codon++) {
+    if (codon_counts_[codon] > 0 && wrapper) {
+      tracker_->AddCodonDependency(codon, wrapper);
     }
-    int choice_index = Random::WeightedChoiceIndex(anticodons, weights);
-    // std::cout << "tRNA index " << choice_index << std::endl; 
-    // std::cout << "chosen anticodon" + anticodons[choice_index] << std::endl;
-    tracker.Increment(anticodons[choice_index] + "_charged", -1);
-    tracker.Increment(anticodons[choice_index] + "_uncharged", 1);
   }
-  tracker.force_update_all();
 }
 
-MobileElement::Ptr MobileElementManager::GetPol(int index) {
+const MobileElement::Ptr &MobileElementManager::GetPol(int index) {
   if (index >= polymerases_.size()) {
     throw std::range_error("Polymerase index out of range.");
   }
@@ -152,10 +292,13 @@ int MobileElementManager::Choose() {
   if (prop_list_.size() == 0) {
     std::string err =
         "There are no active polymerases on polymer (propensity sum: " +
-        std::to_string(prop_sum_) + ").";
+        std::to_string(prop_sum()) + ").";
     throw std::runtime_error(err);
   }
-  int pol_index = Random::WeightedChoiceIndex(polymerases_, prop_list_);
+  // Ribosome propensities are only refreshed lazily, when a move is chosen
+  UpdateAllPropensities();
+  int pol_index =
+      tracker_->rng().WeightedChoiceIndex(polymerases_, prop_list_);
   // std::cout << "chosen index :" << pol_index << std::endl;
   // Error checking to make sure that pol is in vector
   if (pol_index >= polymerases_.size()) {
@@ -170,6 +313,84 @@ int MobileElementManager::Choose() {
   return pol_index;
 }
 
+SiteIndex::SiteIndex(
+    int start, int stop,
+    const std::vector<Interval<BindingSite::Ptr>> &binding_intervals,
+    const std::vector<Interval<ReleaseSite::Ptr>> &release_intervals)
+    : start_(start), stop_(stop) {
+  for (const auto &interval : binding_intervals) {
+    start_ = std::min(start_, interval.value->start());
+    stop_ = std::max(stop_, interval.value->stop());
+  }
+  for (const auto &interval : release_intervals) {
+    start_ = std::min(start_, interval.value->start());
+    stop_ = std::max(stop_, interval.value->stop());
+  }
+  int words = (stop_ - start_) / 64 + 1;
+  binding_starts_.assign(words, 0);
+  site_stops_.assign(words, 0);
+  release_positions_.assign(words, 0);
+  for (const auto &interval : binding_intervals) {
+    Set(binding_starts_, interval.value->start());
+    Set(site_stops_, interval.value->stop());
+  }
+  for (const auto &interval : release_intervals) {
+    Set(site_stops_, interval.value->stop());
+    for (int i = interval.value->start(); i <= interval.value->stop(); i++) {
+      Set(release_positions_, i);
+    }
+  }
+}
+
+std::vector<int> SiteIndex::Positions(
+    int start, int stop,
+    const std::vector<Interval<BindingSite::Ptr>> &binding_intervals,
+    const std::vector<Interval<ReleaseSite::Ptr>> &release_intervals) {
+  std::vector<int> positions = {start, stop, int(binding_intervals.size())};
+  for (const auto &interval : binding_intervals) {
+    positions.push_back(interval.value->start());
+    positions.push_back(interval.value->stop());
+  }
+  for (const auto &interval : release_intervals) {
+    positions.push_back(interval.value->start());
+    positions.push_back(interval.value->stop());
+  }
+  return positions;
+}
+
+void SiteIndex::Set(std::vector<uint64_t> &bits, int position) {
+  int offset = position - start_;
+  bits[offset / 64] |= uint64_t(1) << (offset % 64);
+}
+
+bool SiteIndex::Any(const std::vector<uint64_t> &bits, int first,
+                    int last) const {
+  first = std::max(first, start_) - start_;
+  last = std::min(last, stop_) - start_;
+  if (first > last) {
+    return false;
+  }
+  int first_word = first / 64;
+  int last_word = last / 64;
+  // Bits from first to the end of its word, and from the start of the last
+  // word to last
+  uint64_t first_mask = ~uint64_t(0) << (first % 64);
+  uint64_t last_mask = ~uint64_t(0) >> (63 - last % 64);
+  if (first_word == last_word) {
+    return (bits[first_word] & first_mask & last_mask) != 0;
+  }
+  if ((bits[first_word] & first_mask) != 0 ||
+      (bits[last_word] & last_mask) != 0) {
+    return true;
+  }
+  for (int i = first_word + 1; i < last_word; i++) {
+    if (bits[i] != 0) {
+      return true;
+    }
+  }
+  return false;
+}
+
 Polymer::Polymer(const std::string &name, int start, int stop)
     : name_(name),
       start_(start),
@@ -213,7 +434,7 @@ void Polymer::Unlink() {
   binding_sites_.findOverlapping(start_, stop_, results);
   for (auto &interval : results) {
     // std::cout << "Destroying " + interval.value->name() + " \n" << std::endl;
-    SpeciesTracker::Instance().Remove(interval.value->name(),
+    tracker_->Remove(interval.value->name(),
                                       shared_from_this());
   }
 }
@@ -222,6 +443,7 @@ void Polymer::Initialize() {
   // Construct invterval trees
   binding_sites_ = IntervalTree<BindingSite::Ptr>(binding_intervals_);
   release_sites_ = IntervalTree<ReleaseSite::Ptr>(release_intervals_);
+  IndexSites();
   std::vector<Interval<BindingSite::Ptr>> results;
 
   // Cover all masked sites
@@ -231,7 +453,7 @@ void Polymer::Initialize() {
 
   for (auto &interval : results) {
     // TODO: move to wrapper reaction
-    SpeciesTracker::Instance().Add(interval.value->name(), shared_from_this());
+    tracker_->Add(interval.value->name(), shared_from_this());
     interval.value->Cover();
     interval.value->ResetState();
     // We don't need to log anything here because covered promoters are
@@ -253,7 +475,7 @@ void Polymer::Initialize() {
   binding_sites_.findContained(start_, mask_start, results);
   for (auto &interval : results) {
     // TODO: Move to bridge reaction
-    SpeciesTracker::Instance().Add(interval.value->name(), shared_from_this());
+    tracker_->Add(interval.value->name(), shared_from_this());
     interval.value->Uncover();
     interval.value->ResetState();
     LogUncover(interval.value->name());
@@ -287,7 +509,7 @@ BindingSite::Ptr Polymer::FindBindingSite(MobileElement::Ptr pol,
     throw std::runtime_error(err);
   }
   // Randomly select promoter.
-  BindingSite::Ptr elem = Random::WeightedChoice(promoter_choices);
+  BindingSite::Ptr elem = tracker_->rng().WeightedChoice(promoter_choices);
   // More error checking.
   if (!elem->CheckInteraction(pol->name())) {
     std::string err = "Polymerase " + pol->name() +
@@ -306,7 +528,7 @@ void Polymer::Bind(MobileElement::Ptr pol, const std::string &promoter_name) {
   pol->stop(elem->start() + pol->footprint() - 1);
   pol->reading_frame(elem->reading_frame());
   // Only set gene_bound_ for transcripts and ribosomesinit
-  if (pol->name() == "__ribosome") {
+  if (pol->kind() == MobileElement::Kind::kRibosome) {
     pol->gene_bound(elem->gene());
   }
   // More error checking.
@@ -327,18 +549,18 @@ void Polymer::Bind(MobileElement::Ptr pol, const std::string &promoter_name) {
     }
     interval.value->ResetState();
     // Report some data to tracker
-    if (pol->name() != "__rnase" &&
+    if (pol->kind() != MobileElement::Kind::kRnase &&
         interval.value->CheckInteraction("__ribosome")) {
-      auto &tracker = SpeciesTracker::Instance();
+      auto &tracker = *tracker_;
       tracker.IncrementRibo(interval.value->gene(), 1);
     }
-    if (pol->name() == "__rnase" &&
+    if (pol->kind() == MobileElement::Kind::kRnase &&
         interval.value->CheckInteraction("__ribosome") &&
         interval.value->degraded() == false) {
       // Only decrement transcript count if this binding site has
       // been exposed and logged by SpeciesTracker before
       if (interval.value->first_exposure() == true) {
-        auto &tracker = SpeciesTracker::Instance();
+        auto &tracker = *tracker_;
         tracker.IncrementTranscript(interval.value->gene(), -1);
       }
       interval.value->Degrade();
@@ -369,12 +591,72 @@ void Polymer::ShiftMask() {
   }
 }
 
+void Polymer::SaveState(StateWriter &out) const {
+  out.Write(start_);
+  out.Write(stop_);
+  out.Write<int64_t>(binding_intervals_.size());
+  for (const auto &interval : binding_intervals_) {
+    interval.value->SaveState(out);
+  }
+  out.Write<int64_t>(release_intervals_.size());
+  for (const auto &interval : release_intervals_) {
+    interval.value->SaveState(out);
+  }
+  out.Write(mask_.start());
+  out.Write(mask_.footprint());
+  out.Write(total_elements_);
+  out.Write(degraded_elements_);
+  out.Write(degrade_);
+  out.Write(attached_);
+  out.Write<int64_t>(uncovered_.size());
+  for (const auto &elem : uncovered_) {
+    out.Write(elem.first);
+    out.Write(elem.second);
+  }
+  polymerases_.SaveState(out);
+}
+
+void Polymer::LoadState(StateReader &in) {
+  int start = in.Read<int>();
+  int stop = in.Read<int>();
+  if (start != start_ || stop != stop_ ||
+      in.ReadSize() != binding_intervals_.size()) {
+    throw std::invalid_argument(
+        "Saved state does not match this model (elements of polymer '" +
+        name_ + "' differ).");
+  }
+  for (auto &interval : binding_intervals_) {
+    interval.value->LoadState(in);
+  }
+  if (in.ReadSize() != release_intervals_.size()) {
+    throw std::invalid_argument(
+        "Saved state does not match this model (elements of polymer '" +
+        name_ + "' differ).");
+  }
+  for (auto &interval : release_intervals_) {
+    interval.value->LoadState(in);
+  }
+  mask_.start(in.Read<int>());
+  mask_.footprint(in.Read<int>());
+  total_elements_ = in.Read<int>();
+  degraded_elements_ = in.Read<int>();
+  degrade_ = in.Read<bool>();
+  attached_ = in.Read<bool>();
+  uncovered_.clear();
+  int64_t count = in.ReadSize();
+  for (int64_t i = 0; i < count; i++) {
+    std::string name = in.ReadString();
+    uncovered_[name] = in.Read<int>();
+  }
+  polymerases_.LoadState(in);
+}
+
 void Polymer::LogCover(const std::string &species_name) {
   if (uncovered_.count(species_name) == 0) {
     uncovered_[species_name] = 0;
   } else {
     uncovered_[species_name]--;
-    SpeciesTracker::Instance().Increment(species_name, -1);
+    tracker_->Increment(species_name, -1);
   }
   if (uncovered_[species_name] < 0) {
     std::string err = "Cached count of uncovered element " + species_name +
@@ -389,7 +671,7 @@ void Polymer::LogUncover(const std::string &species_name) {
   } else {
     uncovered_[species_name]++;
   }
-  SpeciesTracker::Instance().Increment(species_name, 1);
+  tracker_->Increment(species_name, 1);
 }
 
 void Polymer::Move(int pol_index) {
@@ -406,7 +688,11 @@ void Polymer::Move(int pol_index) {
   bool pol_collision = CheckPolCollisions(pol_index);
   if (pol_collision) {
     pol->MoveBack();
-    SpeciesTracker::Instance().IncrementCollision(pol->name());
+    if (pol->species_id() >= 0) {
+      tracker_->IncrementCollision(pol->species_id());
+    } else {
+      tracker_->IncrementCollision(pol->name());
+    }
     return;
   }
 
@@ -419,13 +705,14 @@ void Polymer::Move(int pol_index) {
 
   // Choose a tRNA to consume, if pol is a ribosome AND 
   // the simulation is using tRNAs
-  if (pol->name() == "__ribosome" && !SpeciesTracker::Instance().codon_map().empty()) {
+  if (pol->kind() == MobileElement::Kind::kRibosome &&
+      !tracker_->codon_map().empty()) {
     polymerases_.DecrementtRNA(old_stop);
   }
 
   // Check for new covered and uncovered elements
   CheckBehind(old_start, pol->start());
-  if (pol->name() == "__rnase") {
+  if (pol->kind() == MobileElement::Kind::kRnase) {
     CheckAheadRnase(old_stop, pol->stop());
   } else {
     CheckAhead(old_stop, pol->stop());
@@ -433,7 +720,7 @@ void Polymer::Move(int pol_index) {
   
   // Check if polymerase has run into a terminator
   bool terminating = CheckTermination(pol_index);
-  if (terminating && pol->name() != "__rnase") {
+  if (terminating && pol->kind() != MobileElement::Kind::kRnase) {
     std::vector<Interval<BindingSite::Ptr>> results;
     binding_sites_.findOverlapping(old_start, pol->stop(), results);
     for (auto &interval : results) {
@@ -453,12 +740,15 @@ void Polymer::Move(int pol_index) {
   }
 
   // Update propensity for new codon (TODO: make its own function)
-  if (pol->name() == "__ribosome") {
+  if (pol->kind() == MobileElement::Kind::kRibosome) {
     polymerases_.UpdatePropensity(pol_index);
   }
 }
 
 void Polymer::CheckAhead(int old_stop, int new_stop) {
+  if (!site_index_->BindingStart(old_stop, new_stop - 1)) {
+    return;
+  }
   std::vector<Interval<BindingSite::Ptr>> results;
   binding_sites_.findOverlapping(old_stop + 1, new_stop, results);
   for (auto &interval : results) {
@@ -488,7 +778,7 @@ void Polymer::CheckAheadRnase(int old_stop, int new_stop) {
           interval.value->first_exposure() == true &&
           interval.value->degraded() == false) {
         degraded_elements_ += 1;
-        SpeciesTracker::Instance().IncrementTranscript(interval.value->gene(),
+        tracker_->IncrementTranscript(interval.value->gene(),
                                                        -1);
       }
       interval.value->Degrade();
@@ -498,6 +788,10 @@ void Polymer::CheckAheadRnase(int old_stop, int new_stop) {
 }
 
 void Polymer::CheckBehind(int old_start, int new_start) {
+  // Only sites that stop between the old and new start can be uncovered
+  if (!site_index_->SiteStop(old_start, new_start - 1)) {
+    return;
+  }
   std::vector<Interval<BindingSite::Ptr>> results;
   binding_sites_.findOverlapping(old_start, new_start + 1, results);
   for (auto &interval : results) {
@@ -518,7 +812,7 @@ void Polymer::CheckBehind(int old_start, int new_start) {
         // Is this a new transcript?
         if (!interval.value->first_exposure() &&
             interval.value->CheckInteraction("__ribosome")) {
-          SpeciesTracker::Instance().IncrementTranscript(interval.value->gene(),
+          tracker_->IncrementTranscript(interval.value->gene(),
                                                          1);
           interval.value->first_exposure(true);
           total_elements_ += 1;
@@ -555,7 +849,7 @@ void Polymer::CheckBehind(int old_start, int new_start) {
 bool Polymer::CheckTermination(int pol_index) {
   auto pol = polymerases_.GetPol(pol_index);
   if (pol->stop() >= stop_) {
-    if (pol->name() == "__rnase") {
+    if (pol->kind() == MobileElement::Kind::kRnase) {
       // std::cout << "rnase ran off end of transcript" << std::endl;
       polymerases_.Delete(pol_index);
       degrade_ = true;
@@ -566,6 +860,9 @@ bool Polymer::CheckTermination(int pol_index) {
       return true;
     }
   }
+  if (!site_index_->ReleaseOverlap(pol->start(), pol->stop())) {
+    return false;
+  }
   std::vector<Interval<ReleaseSite::Ptr>> results;
   release_sites_.findOverlapping(pol->start(), pol->stop(), results);
   for (auto &interval : results) {
@@ -574,7 +871,7 @@ bool Polymer::CheckTermination(int pol_index) {
         pol->gene_bound() == interval.value->gene()) {
       // terminate
       // std::cout << pol->name() + " " + interval.value->name() << std::endl;
-      double random_num = Random::random();
+      double random_num = tracker_->rng().random();
       if (random_num <= interval.value->efficiency(pol->name())) {
         // std::cout << pol->name() + " terminating" << std::endl;
         // Fire Emit signal until entire terminator is uncovered
@@ -603,7 +900,7 @@ bool Polymer::CheckTermination(int pol_index) {
   return false;
 }
 
-bool Polymer::CheckMaskCollisions(MobileElement::Ptr pol) {
+bool Polymer::CheckMaskCollisions(const MobileElement::Ptr &pol) {
   // Is there still a mask, and does it overlap polymerase?
   if (mask_.start() <= stop_ && pol->stop() >= mask_.start()) {
     if (pol->stop() - mask_.start() > 3) {
@@ -615,7 +912,7 @@ bool Polymer::CheckMaskCollisions(MobileElement::Ptr pol) {
     if (mask_.CheckInteraction(pol->name())) {
       ShiftMask();
     } else {
-      if (pol->name() == "__rnase" && attached_ == false &&
+      if (pol->kind() == MobileElement::Kind::kRnase && attached_ == false &&
           degraded_elements_ == total_elements_ &&
           polymerases_.pol_count() == 0) {
         degrade_ = true;
@@ -627,12 +924,12 @@ bool Polymer::CheckMaskCollisions(MobileElement::Ptr pol) {
 }
 
 bool Polymer::CheckPolCollisions(int pol_index) {
-  auto this_pol = polymerases_.GetPol(pol_index);
+  const auto &this_pol = polymerases_.GetPol(pol_index);
   if (!polymerases_.ValidIndex(pol_index + 1)) {
     // Are there any polymerases ahead of this one?
     return false;
   }
-  auto next_pol = polymerases_.GetPol(pol_index + 1);
+  const auto &next_pol = polymerases_.GetPol(pol_index + 1);
   // We only need to check the polymerase one position ahead of this
   // polymerase
   if ((this_pol->stop() >= next_pol->start()) &&
@@ -655,24 +952,48 @@ bool Polymer::CheckPolCollisions(int pol_index) {
   return false;
 }
 
+void Polymer::CopyElements(const Polymer &other) {
+  other.IndexSites();
+  site_index_ = other.site_index_;
+  binding_intervals_.clear();
+  for (const auto &interval : other.binding_intervals_) {
+    binding_intervals_.emplace_back(interval.start, interval.stop,
+                                    interval.value->Clone());
+  }
+  release_intervals_.clear();
+  for (const auto &interval : other.release_intervals_) {
+    release_intervals_.emplace_back(interval.start, interval.stop,
+                                    interval.value->Clone());
+  }
+  mask_ = other.mask_;
+}
+
+void Polymer::IndexSites() const {
+  if (!site_index_) {
+    site_index_ = std::make_shared<const SiteIndex>(
+        start_, stop_, binding_intervals_, release_intervals_);
+  }
+}
+
 Transcript::Transcript(
     const std::string &name, int start, int stop,
     const std::vector<Interval<BindingSite::Ptr>> &rbs_intervals,
     const std::vector<Interval<ReleaseSite::Ptr>> &stop_site_intervals,
-    const Mask &mask, const std::string &seq)
-    : Polymer(name, start, stop) {
+    const Mask &mask, std::shared_ptr<const Sequence> seq)
+    : Polymer(name, start, stop),
+      bindings_(std::make_shared<
+                std::map<std::string, std::map<std::string, double>>>()) {
   mask_ = mask;
-  seq_ = seq;
   binding_intervals_ = rbs_intervals;
   release_intervals_ = stop_site_intervals;
   attached_ = true;
-  if (!seq_.empty()) {
-    polymerases_.set_sequence(seq_);
-  }
+  polymerases_.sequence(seq);
 }
 
 Transcript::Transcript(const std::string &name, int length)
-    : Polymer(name, 1, length) {
+    : Polymer(name, 1, length),
+      bindings_(std::make_shared<
+                std::map<std::string, std::map<std::string, double>>>()) {
   attached_ = false;
   mask_ = Mask(stop_ + 1, stop_, std::map<std::string, double>());
 }
@@ -689,8 +1010,13 @@ void Transcript::AddGene(const std::string &name, int start, int stop,
                                            rbs_stop, binding);
   rbs->gene(name);
   rbs->reading_frame(start % 3);
+  site_index_.reset();
   binding_intervals_.emplace_back(rbs->start(), rbs->stop(), rbs);
-  bindings_["__" + name + "_rbs"] = binding;
+  if (bindings_.use_count() > 1) {
+    bindings_ = std::make_shared<
+        std::map<std::string, std::map<std::string, double>>>(*bindings_);
+  }
+  (*bindings_)["__" + name + "_rbs"] = binding;
   auto stop_codon =
       std::make_shared<ReleaseSite>("stop_codon", stop - 1, stop, term);
   stop_codon->reading_frame(start % 3);
@@ -705,8 +1031,7 @@ void Transcript::AddSequence(const std::string &seq) {
                             std::to_string(seq.size()) + " " +
                             std::to_string(stop_ - start_ + 1));
   }
-  polymerases_.set_sequence(seq);
-  seq_ = seq;
+  polymerases_.sequence(std::make_shared<const Sequence>(seq));
 }
 
 void Transcript::Bind(MobileElement::Ptr pol,
@@ -717,7 +1042,18 @@ void Transcript::Bind(MobileElement::Ptr pol,
 
 const std::map<std::string, std::map<std::string, double>>
     &Transcript::bindings() {
-  return bindings_;
+  return *bindings_;
+}
+
+Transcript::Ptr Transcript::Clone() const {
+  auto transcript = std::make_shared<Transcript>(name_, stop_ - start_ + 1);
+  transcript->start_ = start_;
+  transcript->stop_ = stop_;
+  transcript->CopyElements(*this);
+  transcript->attached_ = attached_;
+  transcript->bindings_ = bindings_;
+  transcript->polymerases_.sequence(polymerases_.sequence());
+  return transcript;
 }
 
 Genome::Genome(const std::string &name, int length,
@@ -757,6 +1093,7 @@ void Genome::AddPromoter(const std::string &name, int start, int stop,
                          const std::map<std::string, double> &interactions) {
   BindingSite::Ptr promoter =
       std::make_shared<BindingSite>(name, start, stop, interactions);
+  site_index_.reset();
   binding_intervals_.emplace_back(start, stop, promoter);
   bindings_[name] = interactions;
 }
@@ -770,6 +1107,7 @@ void Genome::AddTerminator(const std::string &name, int start, int stop,
   ReleaseSite::Ptr terminator =
       std::make_shared<ReleaseSite>(name, start, stop, efficiency);
   // New code for IntervalTree
+  site_index_.reset();
   release_intervals_.emplace_back(start, stop, terminator);
 }
 
@@ -838,8 +1176,7 @@ void Genome::AddSequence(const std::string &seq) {
                             std::to_string(seq.size()) + " " +
                             std::to_string(stop_ - start_ + 1));
   }
-  polymerases_.set_sequence(seq);
-  seq_ = seq;
+  polymerases_.sequence(std::make_shared<const Sequence>(seq));
 }
 
 void Genome::Attach(MobileElement::Ptr pol) {
@@ -848,6 +1185,25 @@ void Genome::Attach(MobileElement::Ptr pol) {
   transcript_signal_.Emit(transcript);
 }
 
+Genome::Ptr Genome::Clone() const {
+  auto genome = std::make_shared<Genome>(
+      name_, stop_, transcript_degradation_rate_ext_, rnase_speed_,
+      rnase_footprint_, transcript_degradation_rate_);
+  genome->CopyElements(*this);
+  for (const auto &interval : transcript_rbs_intervals_) {
+    genome->transcript_rbs_intervals_.emplace_back(
+        interval.start, interval.stop, interval.value->Clone());
+  }
+  for (const auto &interval : transcript_stop_site_intervals_) {
+    genome->transcript_stop_site_intervals_.emplace_back(
+        interval.start, interval.stop, interval.value->Clone());
+  }
+  genome->polymerases_.sequence(polymerases_.sequence());
+  genome->bindings_ = bindings_;
+  genome->rnase_bindings_ = rnase_bindings_;
+  return genome;
+}
+
 Transcript::Ptr Genome::BuildTranscript(int start, int stop) {
   std::vector<Interval<BindingSite::Ptr>> prom_results;
   std::vector<Interval<BindingSite::Ptr>> rbs_intervals;
@@ -887,6 +1243,7 @@ Transcript::Ptr Genome::BuildTranscript(int start, int stop) {
   // signals appropriately.
   transcript = std::make_shared<Transcript>("__rna", start, stop_,
                                             rbs_intervals, stop_site_intervals,
-                                            mask, seq_);
+                                            mask, polymerases_.sequence());
+  transcript->genome(shared_from_this());
   return transcript;
 }
@@ -3,7 +3,9 @@
 #ifndef SRC_POLYMER_HPP_  // header guard
 #define SRC_POLYMER_HPP_
 
+#include <cstdint>
 #include <map>
+#include <memory>
 #include <string>
 #include <vector>
 
@@ -16,6 +18,41 @@
 class Polymer;
 class PolymerWrapper;
 class Reaction;
+class SpeciesTracker;
+
+/**
+ * A nucleotide sequence together with the codon that starts at each position,
+ * encoded once as a number between 0 and 63 so that ribosomes look codons up
+ * without building strings. Never modified, so copies of a polymer share it.
+ */
+class Sequence {
+ public:
+  explicit Sequence(const std::string &nucleotides);
+  /**
+   * Code of a position that does not start three A, C, G, or T nucleotides.
+   */
+  static const int kNoCodon = 64;
+  /**
+   * Code of a codon, or kNoCodon.
+   *
+   * @param codon three-letter codon
+   */
+  static int Encode(const std::string &codon);
+  /**
+   * Is a code that of the stop codon TAA, TAG, or TGA?
+   */
+  static bool IsStop(int code) { return code == 48 || code == 50 || code == 56; }
+  const std::string &nucleotides() const { return nucleotides_; }
+  int size() const { return nucleotides_.size(); }
+  /**
+   * Code of the codon that starts at a position.
+   */
+  int codon(int position) const { return codons_[position]; }
+
+ private:
+  std::string nucleotides_;
+  std::vector<uint8_t> codons_;
+};
 
 /**
  * Manages all MobileElements (e.g., polymerases and ribosomes) on a Polymer.
@@ -62,9 +99,10 @@ class MobileElementManager {
   /**
    * Get a Polymer at a given index.
    *
-   * @return pointer to MobileElement
+   * @return pointer to MobileElement (a reference that is only valid until
+   *  an element is inserted or deleted; copy it to keep the element)
    */
-  std::shared_ptr<MobileElement> GetPol(int index);
+  const std::shared_ptr<MobileElement> &GetPol(int index);
   /**
    * Get an attached Polymer at a given index.
    *
@@ -78,20 +116,44 @@ class MobileElementManager {
    * @param index Index of MobileElement-Polymer pair
    */
   void UpdatePropensity(int index);
+  /**
+   * Refresh the individual propensities of ribosomes from the current number
+   * of charged tRNAs available for the codons they occupy.
+   */
   void UpdateAllPropensities();
   void DecrementtRNA(int pol_index);
+  /**
+   * Write or restore all MobileElements, the polymers attached to them, and
+   * their propensities (see Model::SaveState()). The wrapper and tracker must
+   * be set before the state is restored.
+   */
+  void SaveState(StateWriter &out) const;
+  void LoadState(StateReader &in);
   /**
    * Getters and setters.
    */
-  double prop_sum() { return prop_sum_; }
+  double prop_sum();
   int pol_count() { return pol_count_; }
   int pair_count() const { return polymerases_.size(); }
   int pol_start(int index) const { return polymerases_[index].first->start(); }
-  void set_sequence(const std::string &seq) { seq_ = seq; }
+  /**
+   * Nucleotide sequence read by ribosomes (null if there is none). The
+   * sequence is never modified, so copies of a transcript share it.
+   */
+  const std::shared_ptr<const Sequence> &sequence() const { return seq_; }
+  void sequence(std::shared_ptr<const Sequence> seq) { seq_ = seq; }
+  void wrapper(std::shared_ptr<PolymerWrapper> wrapper) { wrapper_ = wrapper; }
+  void tracker(SpeciesTracker *tracker) { tracker_ = tracker; }
 
  private:
   /**
-   * Total propensity sum of all MobileElements being tracked
+   * SpeciesTracker of the model that this manager's polymer belongs to.
+   */
+  SpeciesTracker *tracker_ = nullptr;
+  /**
+   * Total propensity sum of all MobileElements being tracked, excluding
+   * ribosomes whose propensity depends on charged tRNAs (these are summed
+   * per codon instead, see codon_speeds_).
    */
   double prop_sum_ = 0;
   /**
@@ -113,7 +175,103 @@ class MobileElementManager {
   /**
    * Nucleotide sequence of the parent genome.
    */
-  std::string seq_;
+  std::shared_ptr<const Sequence> seq_;
+  /**
+   * ID of codon currently occupied by each MobileElement, in the same order
+   * as polymerases_. Set to -1 for anything that is not a ribosome in a
+   * simulation with dynamic tRNAs.
+   */
+  std::vector<int> codon_list_;
+  /**
+   * Number of ribosomes on this polymer occupying each codon, indexed by
+   * codon ID.
+   */
+  std::vector<int> codon_counts_;
+  /**
+   * Sum of the speeds of all ribosomes occupying each codon, indexed by codon
+   * ID. The propensity of a codon bucket is this sum multiplied by the number
+   * of charged tRNAs that read the codon.
+   */
+  std::vector<double> codon_speeds_;
+  /**
+   * Wrapper reaction of the polymer that owns this manager. Registered with
+   * SpeciesTracker as depending on the codons occupied by bound ribosomes.
+   */
+  std::weak_ptr<PolymerWrapper> wrapper_;
+  /**
+   * Add or remove a ribosome from a codon bucket and update codon
+   * dependencies in SpeciesTracker accordingly.
+   *
+   * @param codon ID of codon being occupied or vacated
+   * @param speed speed of ribosome
+   */
+  void OccupyCodon(int codon, double speed);
+  void VacateCodon(int codon, double speed);
+  /**
+   * Is the propensity of this MobileElement weighted by the number of charged
+   * tRNAs available for the codon it occupies?
+   */
+  bool CodonWeighted(const std::shared_ptr<MobileElement> &pol);
+  /**
+   * ID (see SpeciesTracker::codon_id()) of the codon of the sequence that
+   * starts at a position.
+   */
+  int CodonId(int position) const;
+};
+
+/**
+ * Bitmaps of the positions where binding and release sites start, stop, or
+ * lie on a polymer. A polymerase moves one position at a time and usually
+ * passes no site at all, so Polymer checks the bitmaps (a few array loads,
+ * no allocation) before querying its interval trees.
+ *
+ * Only site positions are recorded, not the sites themselves, so an index is
+ * immutable and shared between copies of a polymer.
+ */
+class SiteIndex {
+ public:
+  SiteIndex(int start, int stop,
+            const std::vector<Interval<BindingSite::Ptr>> &binding_intervals,
+            const std::vector<Interval<ReleaseSite::Ptr>> &release_intervals);
+  /**
+   * Does a binding site start anywhere between first and last (inclusive)?
+   */
+  bool BindingStart(int first, int last) const {
+    return Any(binding_starts_, first, last);
+  }
+  /**
+   * Does a binding or release site stop anywhere between first and last?
+   */
+  bool SiteStop(int first, int last) const {
+    return Any(site_stops_, first, last);
+  }
+  /**
+   * Does a release site overlap any position between first and last?
+   */
+  bool ReleaseOverlap(int first, int last) const {
+    return Any(release_positions_, first, last);
+  }
+  /**
+   * Start and stop positions of a polymer and its sites, in order. Polymers
+   * with equal positions have equal site indexes.
+   */
+  static std::vector<int> Positions(
+      int start, int stop,
+      const std::vector<Interval<BindingSite::Ptr>> &binding_intervals,
+      const std::vector<Interval<ReleaseSite::Ptr>> &release_intervals);
+
+ private:
+  /**
+   * Lowest and highest position covered by the bitmaps. Positions outside
+   * this range hold no sites.
+   */
+  int start_;
+  int stop_;
+  std::vector<uint64_t> binding_starts_;
+  std::vector<uint64_t> site_stops_;
+  std::vector<uint64_t> release_positions_;
+  void Set(std::vector<uint64_t> &bits, int position);
+  bool Any(const std::vector<uint64_t> &bits, int first, int last) const;
 };
 
 /**
@@ -201,6 +359,13 @@ class Polymer : public std::enable_shared_from_this<Polymer> {
    * Shift mask by 1 base-pair and check for uncovered elements.
    */
   virtual void ShiftMask();
+  /**
+   * Write or restore the state of this polymer: bound MobileElements, covered
+   * elements, and the position of the mask (see Model::SaveState()). The
+   * polymer must be registered with the model before its state is restored.
+   */
+  void SaveState(StateWriter &out) const;
+  void LoadState(StateReader &in);
 
   /**
    * Getters and setters. There are two getters for prop_sum_... mostly to
@@ -215,23 +380,56 @@ class Polymer : public std::enable_shared_from_this<Polymer> {
   bool degrade() { return degrade_; }
   bool attached() { return attached_; }
   void attached(bool attached) { attached_ = attached; }
-  void wrapper(std::shared_ptr<PolymerWrapper> wrapper) { wrapper_ = wrapper; }
+  void wrapper(std::shared_ptr<PolymerWrapper> wrapper) {
+    wrapper_ = wrapper;
+    polymerases_.wrapper(wrapper);
+  }
   std::shared_ptr<PolymerWrapper> wrapper() { return wrapper_.lock(); }
+  /**
+   * Set the SpeciesTracker of the model that this polymer is registered
+   * with. Must be called before the polymer is initialized.
+   */
+  void tracker(SpeciesTracker *tracker) {
+    tracker_ = tracker;
+    polymerases_.tracker(tracker);
+  }
+  SpeciesTracker *tracker() { return tracker_; }
   const std::vector<Interval<BindingSite::Ptr>>& GetBindingIntervals() { return binding_intervals_; }
   const std::vector<Interval<ReleaseSite::Ptr>>& GetReleaseIntervals() { return release_intervals_; }
   const Mask& GetMask() { return mask_; }
   int num_attached() const { return polymerases_.pair_count(); }
+  /**
+   * Index of site positions (built if needed), which may be shared with any
+   * polymer that has sites at the same positions.
+   */
+  const std::shared_ptr<const SiteIndex> &site_index() const {
+    IndexSites();
+    return site_index_;
+  }
+  void site_index(std::shared_ptr<const SiteIndex> index) {
+    site_index_ = index;
+  }
+  const std::shared_ptr<const Sequence> &sequence() const {
+    return polymerases_.sequence();
+  }
+  void sequence(std::shared_ptr<const Sequence> seq) {
+    polymerases_.sequence(seq);
+  }
   int attached_pol_start(int index) const { return polymerases_.pol_start(index); }
 
   /**
    * Signal to fire when a polymerase terminates.
    */
-  Signal<std::shared_ptr<PolymerWrapper>, const std::string &,
+  Signal<const std::shared_ptr<PolymerWrapper> &, const std::string &,
          const std::string &>
       termination_signal_;
 
  protected:
   std::weak_ptr<PolymerWrapper> wrapper_;
+  /**
+   * SpeciesTracker of the model that this polymer is registered with.
+   */
+  SpeciesTracker *tracker_ = nullptr;
   int index_;
   /**
    * Name of polymer
@@ -283,6 +481,13 @@ class Polymer : public std::enable_shared_from_this<Polymer> {
    * Interval tree of release sites
    */
   IntervalTree<ReleaseSite::Ptr> release_sites_;
+  /**
+   * Positions of the sites in binding_sites_ and release_sites_. Built by
+   * Initialize() unless shared from the polymer this one was copied from, and
+   * reset whenever a site is added. Mutable since building it does not
+   * change the polymer (see IndexSites()).
+   */
+  mutable std::shared_ptr<const SiteIndex> site_index_;
   /**
    * Mask corresponding to this polymer. Controls which elements are hidden.
    */
@@ -344,7 +549,7 @@ class Polymer : public std::enable_shared_from_this<Polymer> {
    *
    * @return true if this pol will collide with mask (but not shift mask)
    */
-  bool CheckMaskCollisions(MobileElement::Ptr pol);
+  bool CheckMaskCollisions(const MobileElement::Ptr &pol);
   /**
    * Check for collisions between polymerases.
    *
@@ -366,6 +571,16 @@ class Polymer : public std::enable_shared_from_this<Polymer> {
    */
   void LogUncover(const std::string &species_name);
   void ChoosetRNA(int index);
+  /**
+   * Give this polymer copies of the elements and mask of another polymer. The
+   * site index is shared with the other polymer, which builds it first if
+   * needed so that all copies of a template share one index.
+   */
+  void CopyElements(const Polymer &other);
+  /**
+   * Build the site index, if it has not been built yet.
+   */
+  void IndexSites() const;
 };
 
 /**
@@ -390,7 +605,7 @@ class Transcript : public Polymer {
   Transcript(const std::string &name, int start, int stop,
              const std::vector<Interval<BindingSite::Ptr>> &rbs_intervals,
              const std::vector<Interval<ReleaseSite::Ptr>> &stop_site_intervals,
-             const Mask &mask, const std::string &seq);
+             const Mask &mask, std::shared_ptr<const Sequence> seq);
   /**
    * Constructor of transcript used for specifying transcripts without Genome
    *
@@ -431,13 +646,27 @@ class Transcript : public Polymer {
    * so this should only be used when adding transcripts to the simulation directly.
    */
   void AddSequence(const std::string &seq);
+  /**
+   * Genome that transcribed this transcript, if any.
+   */
+  Polymer::Ptr genome() const { return genome_.lock(); }
+  void genome(Polymer::Ptr genome) { genome_ = genome; }
+  /**
+   * Copy the definition of this transcript (elements, sequence, and
+   * bindings) into a new, unregistered transcript. The state of a simulation
+   * is not copied (see Model::Clone()). The copy shares the sequence and the
+   * layout of elements with this transcript.
+   */
+  Transcript::Ptr Clone() const;
 
  private:
-  std::map<std::string, std::map<std::string, double>> bindings_;
-   /**
-   * Nucleotide sequence of the parent genome.
-   */  
-  std::string seq_;
+  /**
+   * Binding rate constants of each RBS, shared by copies of this transcript
+   * and copied before they are modified.
+   */
+  std::shared_ptr<std::map<std::string, std::map<std::string, double>>>
+      bindings_;
+  std::weak_ptr<Polymer> genome_;
 };
 
 /**
@@ -495,20 +724,6 @@ class Genome : public Polymer {
    * @param promoter name of promoter to which this polymerase binds
    */
   void Attach(MobileElement::Ptr pol);
-  Signal<Transcript::Ptr> transcript_signal_;
-
- private:
-  std::vector<Interval<BindingSite::Ptr>> transcript_rbs_intervals_;
-  std::vector<Interval<ReleaseSite::Ptr>> transcript_stop_site_intervals_;
-  IntervalTree<BindingSite::Ptr> transcript_rbs_;
-  IntervalTree<ReleaseSite::Ptr> transcript_stop_sites_;
-  std::string seq_;
-  std::map<std::string, std::map<std::string, double>> bindings_;
-  std::map<std::string, double> rnase_bindings_;
-  double transcript_degradation_rate_ = 0.0;
-  double transcript_degradation_rate_ext_ = 0.0;
-  double rnase_speed_ = 0.0;
-  int rnase_footprint_ = 0;
   /**
    * Build a transcript object corresponding to start and stop positions
    * within this genome.
@@ -521,6 +736,24 @@ class Genome : public Polymer {
    * @returns pointer to Transcript object
    */
   Transcript::Ptr BuildTranscript(int start, int stop);
+  /**
+   * Copy the definition of this genome into a new, unregistered genome (see
+   * Transcript::Clone()).
+   */
+  Genome::Ptr Clone() const;
+  Signal<const Transcript::Ptr &> transcript_signal_;
+
+ private:
+  std::vector<Interval<BindingSite::Ptr>> transcript_rbs_intervals_;
+  std::vector<Interval<ReleaseSite::Ptr>> transcript_stop_site_intervals_;
+  IntervalTree<BindingSite::Ptr> transcript_rbs_;
+  IntervalTree<ReleaseSite::Ptr> transcript_stop_sites_;
+  std::map<std::string, std::map<std::string, double>> bindings_;
+  std::map<std::string, double> rnase_bindings_;
+  double transcript_degradation_rate_ = 0.0;
+  double transcript_degradation_rate_ext_ = 0.0;
+  double rnase_speed_ = 0.0;
+  int rnase_footprint_ = 0;
 };
 
 #endif  // SRC_POLYMER_HPP_
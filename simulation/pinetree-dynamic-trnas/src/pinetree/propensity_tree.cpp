@@ -0,0 +1,97 @@
+#include <algorithm>
+#include <stdexcept>
+
+#include "propensity_tree.hpp"
+
+void PropensityTree::Push(double value) {
+  if (size_ == capacity_) {
+    Reserve(size_ + 1);
+  }
+  size_++;
+  Set(size_ - 1, value);
+}
+
+void PropensityTree::Pop() {
+  if (size_ == 0) {
+    throw std::range_error("PropensityTree: cannot remove from empty tree.");
+  }
+  Set(size_ - 1, 0);
+  size_--;
+}
+
+void PropensityTree::Set(int index, double value) {
+  if (index >= size_ || index < 0) {
+    throw std::range_error("PropensityTree: leaf index out of range.");
+  }
+  int node = capacity_ + index;
+  nodes_[node] = value;
+  node /= 2;
+  while (node > 0) {
+    nodes_[node] = nodes_[2 * node] + nodes_[2 * node + 1];
+    node /= 2;
+  }
+}
+
+void PropensityTree::Rebuild(const std::vector<double> &values,
+                             int capacity) {
+  size_ = 0;
+  if (capacity > 0) {
+    capacity_ = 0;
+    nodes_.clear();
+  }
+  Reserve(std::max<int>(values.size(), capacity));
+  std::fill(nodes_.begin(), nodes_.end(), 0);
+  size_ = values.size();
+  for (int i = 0; i < size_; i++) {
+    nodes_[capacity_ + i] = values[i];
+  }
+  for (int node = capacity_ - 1; node > 0; node--) {
+    nodes_[node] = nodes_[2 * node] + nodes_[2 * node + 1];
+  }
+}
+
+int PropensityTree::Find(double target) const {
+  if (size_ == 0) {
+    throw std::runtime_error("PropensityTree: cannot sample from empty tree.");
+  }
+  int node = 1;
+  while (node < capacity_) {
+    int left = 2 * node;
+    if (target < nodes_[left]) {
+      node = left;
+    } else {
+      target -= nodes_[left];
+      node = left + 1;
+    }
+  }
+  int index = node - capacity_;
+  // Rounding in the descent can (very rarely) walk past the last non-zero
+  // leaf; step back to the closest leaf that can actually be selected.
+  if (index >= size_) {
+    index = size_ - 1;
+  }
+  while (index > 0 && nodes_[capacity_ + index] <= 0) {
+    index--;
+  }
+  return index;
+}
+
+void PropensityTree::Reserve(int min_capacity) {
+  if (min_capacity <= capacity_) {
+    return;
+  }
+  int new_capacity = (capacity_ == 0) ? 1 : capacity_;
+  while (new_capacity < min_capacity) {
+    new_capacity *= 2;
+  }
+  std::vector<double> leaves(nodes_.begin() + capacity_,
+                             nodes_.begin() + capacity_ + size_);
+  capacity_ = new_capacity;
+  nodes_.assign(2 * capacity_, 0);
+  for (int i = 0; i < leaves.size(); i++) {
+    nodes_[capacity_ + i] = leaves[i];
+  }
+  for (int node = capacity_ - 1; node > 0; node--) {
+    nodes_[node] = nodes_[2 * node] + nodes_[2 * node + 1];
+  }
+}
@@ -0,0 +1,82 @@
+#ifndef SRC_PROPENSITY_TREE_HPP  // header guard
+#define SRC_PROPENSITY_TREE_HPP
+
+#include <vector>
+
+/**
+ * A binary sum tree over reaction propensities. Leaves hold individual
+ * propensities and every internal node holds the sum of its two children, so
+ * that a single propensity can be changed and a reaction can be sampled in
+ * O(log n) time.
+ *
+ * Internal nodes are always recomputed from their children rather than
+ * adjusted by differences, so the tree does not accumulate floating point
+ * drift over long simulations.
+ */
+class PropensityTree {
+ public:
+  /**
+   * Append a propensity to the end of the tree.
+   *
+   * @param value propensity of the new leaf
+   */
+  void Push(double value);
+  /**
+   * Remove the last propensity from the tree.
+   */
+  void Pop();
+  /**
+   * Set the propensity of an existing leaf.
+   *
+   * @param index index of leaf
+   * @param value new propensity
+   */
+  void Set(int index, double value);
+  /**
+   * Rebuild the whole tree from a vector of propensities in O(n) time.
+   *
+   * @param values propensities, in reaction order
+   * @param capacity if positive, lay the tree out for this many leaves
+   *  (rounded up to a power of two and at least values.size()), e.g. to
+   *  reproduce the sums of a saved tree exactly
+   */
+  void Rebuild(const std::vector<double> &values, int capacity = 0);
+  /**
+   * Find the first leaf whose cumulative propensity exceeds a target value.
+   * This matches the semantics of std::upper_bound over cumulative sums, so
+   * leaves with a propensity of zero are never selected.
+   *
+   * @param target value between 0 and total()
+   *
+   * @return index of selected leaf
+   */
+  int Find(double target) const;
+  /**
+   * Getters and setters.
+   */
+  double get(int index) const { return nodes_[capacity_ + index]; }
+  double total() const { return (size_ == 0) ? 0 : nodes_[1]; }
+  int size() const { return size_; }
+  int capacity() const { return capacity_; }
+
+ private:
+  /**
+   * Number of leaves currently in use.
+   */
+  int size_ = 0;
+  /**
+   * Number of leaves allocated (always a power of two).
+   */
+  int capacity_ = 0;
+  /**
+   * Implicit binary tree. The root is stored at position 1, the children of
+   * node i at 2i and 2i + 1, and leaves start at position capacity_.
+   */
+  std::vector<double> nodes_;
+  /**
+   * Grow the tree so that it can hold at least min_capacity leaves.
+   */
+  void Reserve(int min_capacity);
+};
+
+#endif  // header guard
@@ -1,8 +1,11 @@
+#include <pybind11/numpy.h>
 #include <pybind11/pybind11.h>
 #include <pybind11/stl.h>
 #include "choices.hpp"
 #include "feature.hpp"
 #include "model.hpp"
+#include "observer.hpp"
+#include "output.hpp"
 #include "polymer.hpp"
 #include "reaction.hpp"
 #include "tracker.hpp"
@@ -10,6 +13,20 @@
 namespace py = pybind11;
 using namespace pybind11::literals;
 
+namespace {
+/**
+ * Wrap a count matrix of a SimulationResult in a NumPy array without copying.
+ * The array keeps the result alive.
+ */
+template <typename T>
+py::array_t<T> ResultMatrix(py::object self, std::vector<T> &data) {
+  const auto &result = self.cast<const SimulationResult &>();
+  size_t rows = result.species.size();
+  size_t columns = result.time.size();
+  return py::array_t<T>({rows, columns}, data.data(), self);
+}
+}  // namespace
+
 PYBIND11_MODULE(core, m) {
   m.doc() = (R"doc(
     Python module
@@ -133,7 +150,7 @@ PYBIND11_MODULE(core, m) {
       .def(py::init<double, double, std::vector<std::string>,
                     std::vector<std::string>>())
       .def("caculate_propensity", &SpeciesReaction::CalculatePropensity)
-      .def("execute", &SpeciesReaction::Execute)
+      .def("execute", (void (SpeciesReaction::*)(void)) &SpeciesReaction::Execute)
       .def_property_readonly(
           "reactants",
           (std::vector<std::string>(SpeciesReaction::*)(void) const) &
@@ -166,6 +183,31 @@ PYBIND11_MODULE(core, m) {
                              (int (MobileElementManager::*)(void)) &
                                  MobileElementManager::pol_count);
 
+  py::class_<CancellationToken, CancellationToken::Ptr>(m,
+                                                        "CancellationToken",
+                                                        R"doc(
+            
+            Token for stopping a running simulation from another thread 
+            (see ``Model.simulate``).
+
+            Examples:
+
+                >>> token = pt.CancellationToken()
+                >>> future = executor.submit(sim.simulate, time_limit=1000,
+                ...                          time_step=1, cancel=token)
+                >>> token.cancel()
+
+            )doc")
+      .def(py::init<>())
+      .def("cancel", &CancellationToken::Cancel,
+           "Stop simulations that use this token.")
+      .def("reset", &CancellationToken::Reset,
+           "Allow the token to be used again.")
+      .def_property_readonly("cancelled", &CancellationToken::cancelled);
+
+  py::handle interrupted_type = py::register_exception<SimulationInterrupted>(
+      m, "SimulationInterrupted", PyExc_RuntimeError);
+
   py::class_<Model, std::shared_ptr<Model>>(m, "Model",
                                             R"doc(
             
@@ -173,21 +215,51 @@ PYBIND11_MODULE(core, m) {
             
             Args:
                 cell_volume (float): The volume, in liters, of the system being simulated.
+                selection (str): Method used to select the next reaction in 
+                    each iteration of the Gillespie algorithm. ``"linear"`` 
+                    (default) scans the cumulative propensities of all 
+                    reactions. ``"tree"`` keeps propensities in a binary sum 
+                    tree, which is much faster for models with many 
+                    reactions (e.g. thousands of transcripts). Both methods 
+                    produce the same trajectory for a given seed, up to 
+                    floating point rounding.
+                rng (str): Pseudo-random number engine. ``"mt19937"`` 
+                    (default) reproduces the trajectories of earlier 
+                    versions of pinetree. ``"xoshiro256++"`` and 
+                    ``"pcg64"`` are faster and support many independent 
+                    streams per seed (see ``seed``).
              
             Examples:
 
                 >>> import pinetree.pinetree as pt
                 >>> sim = pt.Model(cell_volume=8e-16) # Approximate volume of E. coli cell
+                >>> sim = pt.Model(cell_volume=8e-16, selection="tree")
+                >>> sim = pt.Model(cell_volume=8e-16, rng="pcg64")
 
            )doc")
-      .def(py::init<double>(), "cell_volume"_a)
-      .def("seed", &Model::seed,
+      .def(py::init<double, const std::string &, const std::string &>(),
+           "cell_volume"_a, "selection"_a = "linear", "rng"_a = "mt19937")
+      .def("seed", &Model::seed, "seed"_a, "stream"_a = 0,
            R"doc(
              
              Set a seed for reproducible simulations.
              
              Args:
                 seed (int): a seed for the random number generator
+                stream (int): index of an independent random number stream 
+                    for this seed (default 0). Replicate simulations that 
+                    share a seed but use streams 0, 1, 2, ... are 
+                    statistically independent and reproducible regardless 
+                    of the order or thread in which they run. Streams are 
+                    selected by jump-ahead for ``"xoshiro256++"``, by the 
+                    stream increment for ``"pcg64"``, and by 
+                    ``std::seed_seq`` for ``"mt19937"``.
+
+             Examples:
+
+                >>> for replicate in range(4):
+                ...     sim = pt.Model(cell_volume=8e-16, rng="xoshiro256++")
+                ...     sim.seed(34, stream=replicate)
 
              )doc")
       .def("add_reaction", &Model::AddReaction, "rate_constant"_a,
@@ -290,18 +362,111 @@ PYBIND11_MODULE(core, m) {
         )doc")
       .def("register_transcript", &Model::RegisterTranscript, R"doc(
         
-        Register a genome-independent transcript with the model.
+        Register a genome-independent transcript with the model. 
+        Transcripts can also be registered after the model has been 
+        simulated, e.g. to add a variant gene to a cell that has already 
+        reached steady state.
 
         Args:
             transcript (Transcript): a pinetree ``Transcript`` object.
         
         )doc")
-      .def("simulate", &Model::Simulate, "time_limit"_a, "time_step"_a,
-           "output"_a = "counts.tsv",
+      .def("register_transcripts", &Model::RegisterTranscripts,
+           "transcript"_a, "copies"_a, R"doc(
+        
+        Register many identical copies of a genome-independent transcript. 
+        This simulates exactly like calling ``register_transcript()`` with a 
+        newly built transcript ``copies`` times, but is much faster and the 
+        copies share a single sequence and gene layout in memory. 
+
+        Args:
+            transcript (Transcript): a pinetree ``Transcript`` object used as 
+                a template; it is copied and not registered itself, so it 
+                can be modified or reused afterwards.
+            copies (int): number of copies to register.
+        
+        )doc")
+      .def("simulate",
+           [interrupted_type](
+               Model &model, int time_limit, double time_step,
+               py::object output, const std::string &method, double epsilon,
+               py::object output_format, bool sparse,
+               const std::vector<Observer::Ptr> &observers,
+               CancellationToken::Ptr cancel,
+               py::object time_budget) -> py::object {
+             WriterGroup writers;
+             for (const auto &observer : observers) {
+               writers.Add(observer.get());
+             }
+             CountsWriter::Ptr file;
+             std::unique_ptr<ArrayWriter> arrays;
+             if (!output.is_none()) {
+               // An empty format is chosen from the file extension
+               file = CountsWriter::Create(
+                   output_format.is_none() ? ""
+                                           : output_format.cast<std::string>(),
+                   output.cast<std::string>(), sparse);
+               writers.Add(file.get());
+             } else if (observers.empty()) {
+               arrays.reset(new ArrayWriter());
+               writers.Add(arrays.get());
+             }
+             RunControl control;
+             control.token = cancel;
+             if (!time_budget.is_none()) {
+               control.time_budget = time_budget.cast<double>();
+             }
+             // Python only handles signals (e.g. Ctrl-C) in the main thread
+             auto threading = py::module_::import("threading");
+             if (threading.attr("current_thread")().is(
+                     threading.attr("main_thread")())) {
+               control.interrupted = []() {
+                 py::gil_scoped_acquire acquire;
+                 return PyErr_CheckSignals() != 0;
+               };
+             }
+             try {
+               py::gil_scoped_release release;
+               model.Simulate(time_limit, time_step, writers, method, epsilon,
+                              control);
+             } catch (const SimulationInterrupted &e) {
+               // Re-raise the exception of a signal handler, if any
+               if (PyErr_Occurred()) {
+                 throw py::error_already_set();
+               }
+               // Hand the counts recorded so far to the caller with the
+               // exception
+               py::object error = interrupted_type(e.what());
+               error.attr("result") =
+                   arrays ? py::cast(arrays->result()) : py::none();
+               PyErr_SetObject(interrupted_type.ptr(), error.ptr());
+               throw py::error_already_set();
+             } catch (const std::exception &) {
+               if (!arrays) {
+                 throw;
+               }
+               // Translate other errors (e.g. a model that ran out of
+               // reactants) as usual and attach the counts recorded so far
+               py::detail::try_translate_exceptions();
+               py::error_already_set error;
+               error.value().attr("result") = py::cast(arrays->result());
+               throw error;
+             }
+             if (arrays) {
+               return py::cast(arrays->result());
+             }
+             return py::none();
+           },
+           "time_limit"_a, "time_step"_a, "output"_a = "counts.tsv",
+           "method"_a = "direct", "epsilon"_a = 0.03,
+           "output_format"_a = py::none(), "sparse"_a = false,
+           "observers"_a = std::vector<Observer::Ptr>(),
+           "cancel"_a = nullptr, "time_budget"_a = py::none(),
            R"doc(
             
             Run a gene expression simulation. Produces a tab separated file of 
-            protein and transcript counts at user-specified time intervals.
+            protein and transcript counts at user-specified time intervals, 
+            or returns the counts in memory if ``output`` is ``None``.
 
             Args:
                 time_limit (int): Simulated time, in seconds at which this 
@@ -312,10 +477,288 @@ PYBIND11_MODULE(core, m) {
                     etc) in the system.
                 time_step (double): Time interval, in seconds, that species counts 
                     are reported.
-                output (str): Name of output file (default: counts.tsv).
+                output (str): Name of output file (default: counts.tsv). If 
+                    ``None``, no file is written and the counts are returned 
+                    as a ``SimulationResult``.
+                method (str): ``"direct"`` (default) executes every reaction 
+                    exactly with Gillespie's direct method. ``"tau_leap"`` 
+                    advances species-level reactions (including tRNA 
+                    charging) by Poisson-distributed numbers of firings per 
+                    step, while polymerase and ribosome movement, binding, 
+                    and species reactions that are close to exhausting a 
+                    reactant are still executed one at a time. Tau-leaping 
+                    is approximate but much faster when fast, high-copy 
+                    species reactions dominate the simulation. 
+                    ``"next_reaction"`` is exact, like ``"direct"``, but 
+                    keeps a putative firing time for every reaction in a 
+                    priority queue (Gibson and Bruck 2000). It draws one 
+                    random number per reaction and only updates reactions 
+                    whose propensity changed, which pays off in models with 
+                    many weakly coupled polymers (e.g. hundreds of 
+                    transcripts).
+                epsilon (float): Error control for ``"tau_leap"``: the 
+                    largest expected relative change in any reactant count 
+                    during a single leap (default: 0.03). Smaller values 
+                    are more accurate and slower.
+                output_format (str): ``"tsv"`` writes a tab separated 
+                    text file. ``"npz"`` writes an uncompressed 
+                    NumPy archive with one typed array per column 
+                    (``time``, ``species``, ``protein``, ``transcript``, 
+                    ``ribo_density``, ``collisions``), where ``species`` 
+                    holds integer IDs into the ``species_names`` array. 
+                    Load it with ``numpy.load()``; it is much smaller and 
+                    faster to write and read than the text output. By 
+                    default, the format follows the extension of 
+                    ``output``: ``"npz"`` for ``.npz`` files and ``"tsv"`` 
+                    otherwise.
+                sparse (bool): If ``True`` (``"npz"`` only), a species is 
+                    only recorded at an output time if its counts changed 
+                    since it was last recorded. Use 
+                    ``pinetree.read_counts()`` to recover the full table.
+                observers (list): Observers (e.g. ``RunningStats``, 
+                    ``LastValue``, ``ThresholdCrossing``) that reduce counts 
+                    to summary statistics during the simulation. If 
+                    ``output`` is ``None`` and observers are given, no 
+                    trajectory is recorded at all.
+                cancel (CancellationToken): Stop the simulation once 
+                    ``cancel.cancel()`` has been called, e.g. from another 
+                    thread.
+                time_budget (float): Stop the simulation after this many 
+                    seconds of wall-clock time.
+
+            Returns:
+                SimulationResult: if ``output`` is ``None`` and there are no 
+                ``observers``, otherwise ``None``.
+
+            Raises:
+                SimulationInterrupted: if the simulation was cancelled, ran 
+                    out of ``time_budget``, or was interrupted by a signal 
+                    whose handler did not raise an exception itself. Output 
+                    is written up to the time of interruption. If ``output`` 
+                    is ``None``, the exception's ``result`` attribute holds 
+                    the ``SimulationResult`` up to the time of interruption 
+                    (otherwise it is ``None``). Other errors during an 
+                    in-memory simulation carry the counts up to the error 
+                    in ``result`` as well.
+
+            Note:
+                Each ``Model`` keeps its own species counts and random number
+                generator, and the GIL is released while simulating, so
+                independent models can be simulated concurrently from
+                separate Python threads. In the main thread, signals such 
+                as Ctrl-C are handled while simulating. Calling 
+                ``simulate`` again continues from where the previous call 
+                stopped (or from a state restored with ``load_state``).
+
+          )doc")
+      .def("save_state",
+           (void (Model::*)(const std::string &)) &Model::SaveState, "path"_a, R"doc(
+            
+            Save the complete state of the simulation (species counts, 
+            polymer positions, simulation time, and random number 
+            generator) to a binary file.
+
+            Args:
+                path (str): Name of state file.
+
+          )doc")
+      .def("load_state",
+           (void (Model::*)(const std::string &)) &Model::LoadState, "path"_a, R"doc(
+            
+            Restore a state saved with ``save_state``. The model must have 
+            been built in the same way as the saved model (the same species, 
+            reactions, genomes, and transcripts, added in the same order) and
+            must not have been simulated yet. A subsequent ``simulate`` call 
+            continues the saved simulation exactly, e.g. to resume a long run
+            or to start several simulations after a shared burn-in. States 
+            of models with transcripts registered after they were first 
+            simulated cannot be loaded (use ``clone`` instead).
+
+            Args:
+                path (str): State file written by ``save_state``.
+
+            Raises:
+                ValueError: if the saved state does not match this model. 
+                    The model should not be used afterwards.
+                RuntimeError: if the file is not a valid state file or the 
+                    model has already been simulated.
+
+            Example:
+                >>> sim.simulate(time_limit=500, time_step=1, output="a.tsv")
+                >>> sim.save_state("burn_in.state")
+                >>> resumed = build_model()  # same construction as sim
+                >>> resumed.load_state("burn_in.state")
+                >>> resumed.simulate(time_limit=1000, time_step=1,
+                ...                  output="b.tsv")
+
+          )doc")
+      .def("clone", &Model::Clone, R"doc(
+            
+            Copy this model, including the state of the simulation. The copy 
+            is independent of this model and of the ``Genome`` and 
+            ``Transcript`` objects registered with it. Simulating the copy 
+            continues exactly like simulating this model would, so one 
+            burn-in can be forked into many variants, e.g. by registering 
+            different transcripts or reseeding each copy.
+
+            Returns:
+                Model: the copy.
+
+            Example:
+                >>> sim.simulate(time_limit=500, time_step=1, output=None)
+                >>> for i, rbs_strength in enumerate([1e6, 1e7]):
+                ...     variant = sim.clone()
+                ...     variant.register_transcript(gfp(rbs_strength))
+                ...     variant.simulate(time_limit=1000, time_step=1,
+                ...                      output=f"variant_{i}.tsv")
 
           )doc");
 
+  py::class_<SimulationResult, SimulationResult::Ptr>(m, "SimulationResult",
+                                                    R"doc(
+            
+            Species counts returned by ``Model.simulate(output=None)``. Count 
+            matrices have one row per species (in the order of ``species``) 
+            and one column per output time (in the order of ``time``). They 
+            are NumPy arrays that share memory with this object, so no data is 
+            copied.
+
+            Examples:
+
+                >>> result = sim.simulate(time_limit=60, time_step=1, output=None)
+                >>> row = result.species.index("proteinX")
+                >>> result.protein[row, -1]  # final count of proteinX
+
+            )doc")
+      .def_property_readonly(
+          "time",
+          [](py::object self) {
+            auto &result = self.cast<SimulationResult &>();
+            return py::array_t<double>(result.time.size(), result.time.data(),
+                                       self);
+          },
+          "Output times (1-d array).")
+      .def_readonly("species", &SimulationResult::species,
+                    "Species names, one per matrix row.")
+      .def_property_readonly(
+          "protein",
+          [](py::object self) {
+            return ResultMatrix(self, self.cast<SimulationResult &>().protein);
+          },
+          "Free copy numbers of proteins and other species.")
+      .def_property_readonly(
+          "transcript",
+          [](py::object self) {
+            return ResultMatrix(self,
+                                self.cast<SimulationResult &>().transcript);
+          },
+          "Transcript copy numbers.")
+      .def_property_readonly(
+          "ribo_density",
+          [](py::object self) {
+            return ResultMatrix(self,
+                                self.cast<SimulationResult &>().ribo_density);
+          },
+          "Ribosomes per transcript.")
+      .def_property_readonly(
+          "collisions",
+          [](py::object self) {
+            return ResultMatrix(self,
+                                self.cast<SimulationResult &>().collisions);
+          },
+          "Polymerase collisions since the previous output time.");
+
+  py::class_<Observer, Observer::Ptr>(m, "Observer", R"doc(
+            
+            Base class of observers passed to ``Model.simulate``. Observers 
+            see the value of each selected species at every output time and 
+            keep only summary statistics. Statistics are reset when an 
+            observer is passed to a new simulation.
+
+            )doc")
+      .def_property_readonly("species", &Observer::species,
+                             "Names of observed species.")
+      .def_property_readonly("quantity", &Observer::quantity,
+                             "Observed output column.");
+
+  py::class_<RunningStats, Observer, std::shared_ptr<RunningStats>>(
+      m, "RunningStats", R"doc(
+            
+            Running mean and sample variance of each species over the output 
+            times in a time window.
+
+            Args:
+                species (list): Names of species to observe. If empty 
+                    (default), every species in the output is observed.
+                quantity (str): Output column to observe: ``"protein"`` 
+                    (default), ``"transcript"``, ``"ribo_density"``, or 
+                    ``"collisions"``.
+                start (float): First simulation time included (default 0).
+                stop (float): Last simulation time included (default: end 
+                    of simulation).
+
+            Examples:
+
+                >>> stats = pt.RunningStats(["proteinX"], start=100)
+                >>> sim.simulate(time_limit=500, time_step=1, output=None,
+                ...              observers=[stats])
+                >>> stats.mean["proteinX"]
+
+            )doc")
+      .def(py::init<const std::vector<std::string> &, const std::string &,
+                    double, double>(),
+           "species"_a = std::vector<std::string>(), "quantity"_a = "protein",
+           "start"_a = 0,
+           "stop"_a = std::numeric_limits<double>::infinity())
+      .def_property_readonly("mean", &RunningStats::mean,
+                             "Mean of each species.")
+      .def_property_readonly("variance", &RunningStats::variance,
+                             "Sample variance of each species (NaN if fewer "
+                             "than two values were observed).")
+      .def_property_readonly("count", &RunningStats::count,
+                             "Number of values observed for each species.");
+
+  py::class_<LastValue, Observer, std::shared_ptr<LastValue>>(m, "LastValue",
+                                                              R"doc(
+            
+            Value of each species at the last output time.
+
+            Args:
+                species (list): Names of species to observe. If empty 
+                    (default), every species in the output is observed.
+                quantity (str): Output column to observe (default: 
+                    ``"protein"``).
+
+            )doc")
+      .def(py::init<const std::vector<std::string> &, const std::string &>(),
+           "species"_a = std::vector<std::string>(), "quantity"_a = "protein")
+      .def_property_readonly("values", &LastValue::values,
+                             "Last value of each species.");
+
+  py::class_<ThresholdCrossing, Observer, std::shared_ptr<ThresholdCrossing>>(
+      m, "ThresholdCrossing", R"doc(
+            
+            First output time at which each species reaches a threshold.
+
+            Args:
+                species (list): Names of species to observe. If empty, every 
+                    species in the output is observed.
+                threshold (float): Value to reach.
+                quantity (str): Output column to observe (default: 
+                    ``"protein"``).
+                direction (str): ``"rising"`` (default) records when the value 
+                    first is at or above ``threshold``, ``"falling"`` when it 
+                    first is at or below ``threshold``.
+
+            )doc")
+      .def(py::init<const std::vector<std::string> &, double,
+                    const std::string &, const std::string &>(),
+           "species"_a, "threshold"_a, "quantity"_a = "protein",
+           "direction"_a = "rising")
+      .def_property_readonly("times", &ThresholdCrossing::times,
+                             "Time of first crossing of each species (NaN if "
+                             "the threshold was never reached).");
+
   // Polymers, genomes, and transcripts
   py::class_<Polymer, Polymer::Ptr>(m, "Polymer");
   py::class_<Genome, Polymer, Genome::Ptr>(m, "Genome")
@@ -4,12 +4,24 @@
 
 const static double AVAGADRO = double(6.0221409e+23);
 
+void Reaction::SaveState(StateWriter &out) const {
+  out.Write(old_prop_);
+  out.Write(remove_);
+}
+
+void Reaction::LoadState(StateReader &in) {
+  old_prop_ = in.Read<double>();
+  remove_ = in.Read<bool>();
+}
+
 SpeciesReaction::SpeciesReaction(double rate_constant, double volume,
                                  const std::vector<std::string> &reactants,
-                                 const std::vector<std::string> &products)
+                                 const std::vector<std::string> &products,
+                                 SpeciesTracker *tracker)
     : rate_constant_(rate_constant),
       reactants_(reactants),
       products_(products) {
+  tracker_ = tracker;
   // Error checking
   old_prop_ = 0;
   if (reactants_.size() > 2) {
@@ -32,34 +44,57 @@ SpeciesReaction::SpeciesReaction(double rate_constant, double volume,
   if (reactants_.size() == 2) {
     rate_constant_ = rate_constant_ / (AVAGADRO * volume);
   }
+  if (tracker_ == nullptr) {
+    return;
+  }
+  for (const auto &reactant : reactants_) {
+    reactant_ids_.push_back(tracker_->Intern(reactant));
+  }
+  for (const auto &product : products_) {
+    product_ids_.push_back(tracker_->Intern(product));
+  }
 }
 
 double SpeciesReaction::CalculatePropensity() {
   if (remove_ == true) {
     old_prop_ = 0;
   }
+  if (tracker_ == nullptr) {
+    throw std::runtime_error(
+        "SpeciesReaction must belong to a Model before it can be simulated.");
+  }
+  auto &tracker = *tracker_;
   double new_prop = rate_constant_;
-  for (const auto &reactant : reactants_) {
-    new_prop *= SpeciesTracker::Instance().species(reactant);
+  for (int reactant : reactant_ids_) {
+    new_prop *= tracker.species(reactant);
   }
   double prop_diff = new_prop - old_prop_;
   old_prop_ = new_prop;
   return prop_diff;
 }
 
-void SpeciesReaction::Execute() {
-  for (const auto &reactant : reactants_) {
-    SpeciesTracker::Instance().Increment(reactant, -1);
+void SpeciesReaction::Execute() { Execute(1); }
+
+void SpeciesReaction::Execute(int times) {
+  if (tracker_ == nullptr) {
+    throw std::runtime_error(
+        "SpeciesReaction must belong to a Model before it can be simulated.");
   }
-  for (const auto &product : products_) {
-    SpeciesTracker::Instance().Increment(product, 1);
+  auto &tracker = *tracker_;
+  for (int reactant : reactant_ids_) {
+    tracker.Increment(reactant, -times);
+  }
+  for (int product : product_ids_) {
+    tracker.Increment(product, times);
   }
 }
 
 Bind::Bind(double rate_constant, double volume,
-           const std::string &promoter_name)
+           const std::string &promoter_name, SpeciesTracker *tracker)
     : rate_constant_(rate_constant), promoter_name_(promoter_name) {
   old_prop_ = 0;
+  tracker_ = tracker;
+  promoter_id_ = tracker_->Intern(promoter_name_);
   // Check volume
   if (volume <= 0) {
     throw std::runtime_error("Reaction volume cannot be zero.");
@@ -67,27 +102,30 @@ Bind::Bind(double rate_constant, double volume,
 }
 
 Polymer::Ptr Bind::ChoosePolymer() {
-  auto &tracker = SpeciesTracker::Instance();
+  auto &tracker = *tracker_;
   auto weights = std::vector<double>();
   for (const auto &polymer : tracker.FindPolymers(promoter_name_)) {
     weights.push_back(double(polymer->uncovered(promoter_name_)));
   }
   Polymer::Ptr polymer =
-      Random::WeightedChoice(tracker.FindPolymers(promoter_name_), weights);
+      tracker.rng().WeightedChoice(tracker.FindPolymers(promoter_name_), weights);
   return polymer;
 }
 
 BindPolymerase::BindPolymerase(double rate_constant, double volume,
                                const std::string &promoter_name,
-                               const Polymerase &pol_template)
-    : Bind(rate_constant, volume, promoter_name), pol_template_(pol_template) {
+                               const Polymerase &pol_template,
+                               SpeciesTracker *tracker)
+    : Bind(rate_constant, volume, promoter_name, tracker),
+      pol_template_(pol_template) {
   rate_constant_ = rate_constant_ / (AVAGADRO * volume);
+  pol_id_ = tracker_->Intern(pol_template_.name());
 }
 
 double BindPolymerase::CalculatePropensity() {
-  auto &tracker = SpeciesTracker::Instance();
-  double new_prop = rate_constant_ * tracker.species(pol_template_.name()) *
-                    tracker.species(promoter_name_);
+  auto &tracker = *tracker_;
+  double new_prop = rate_constant_ * tracker.species(pol_id_) *
+                    tracker.species(promoter_id_);
   double prop_diff = new_prop - old_prop_;
   old_prop_ = new_prop;
   return prop_diff;
@@ -96,29 +134,32 @@ double BindPolymerase::CalculatePropensity() {
 void BindPolymerase::Execute() {
   auto polymer = ChoosePolymer();
   auto new_pol = std::make_shared<Polymerase>(pol_template_);
+  new_pol->species_id(pol_id_);
   polymer->Bind(new_pol, promoter_name_);
-  SpeciesTracker::Instance().propensity_signal_.Emit(polymer->wrapper());
+  tracker_->propensity_signal_.Emit(polymer->wrapper());
   // Polymer should handle decrementing promoter
-  SpeciesTracker::Instance().Increment(new_pol->name(), -1);
+  tracker_->Increment(pol_id_, -1);
 }
 
 BindRnase::BindRnase(double rate_constant, double volume,
-                     const Rnase &rnase_template, const std::string &name)
-    : Bind(rate_constant, volume, name), pol_template_(rnase_template) {}
+                     const Rnase &rnase_template, const std::string &name,
+                     SpeciesTracker *tracker)
+    : Bind(rate_constant, volume, name, tracker),
+      pol_template_(rnase_template) {}
 
 void BindRnase::Execute() {
   auto polymer = ChoosePolymer();
   auto new_pol = std::make_shared<Rnase>(pol_template_);
   polymer->Bind(new_pol, promoter_name_);
-  SpeciesTracker::Instance().propensity_signal_.Emit(polymer->wrapper());
+  tracker_->propensity_signal_.Emit(polymer->wrapper());
 }
 
 double BindRnase::CalculatePropensity() {
   if (remove_ == true) {
     old_prop_ = 0;
   }
-  auto &tracker = SpeciesTracker::Instance();
-  double new_prop = rate_constant_ * tracker.species(promoter_name_);
+  auto &tracker = *tracker_;
+  double new_prop = rate_constant_ * tracker.species(promoter_id_);
   double prop_diff = new_prop - old_prop_;
   old_prop_ = new_prop;
   return prop_diff;
@@ -151,10 +192,8 @@ double PolymerWrapper::CalculatePropensity() {
     if (remove_ == true) {
       old_prop_ = 0;
     }
-    if (!SpeciesTracker::Instance().codon_map().empty()) {
-      polymer_->UpdateAllPropensities();
-    }
-    double new_prop = polymer_->prop_sum() - old_prop_;
-    old_prop_ = polymer_->prop_sum();
+    double prop_sum = polymer_->prop_sum();
+    double new_prop = prop_sum - old_prop_;
+    old_prop_ = prop_sum;
     return new_prop;
   }
@@ -39,12 +39,19 @@ class Reaction : public std::enable_shared_from_this<Reaction> {
   virtual int index() const { return index_; }
   virtual void index(int index) { index_ = index; }
   virtual void mark_tRNA() { tRNA_reaction_ = true; }
+  /**
+   * Write or restore the propensity last reported by this reaction (see
+   * Model::SaveState()).
+   */
+  void SaveState(StateWriter &out) const;
+  void LoadState(StateReader &in);
 
  protected:
   /**
-   * The index of this reaction in the reaction list maintained by Model.
+   * The index of this reaction in the reaction list maintained by Model, or
+   * -1 if it has not been added to the reaction list.
    */
-  int index_;
+  int index_ = -1;
 
   double old_prop_ = 0;
   /**
@@ -55,6 +62,10 @@ class Reaction : public std::enable_shared_from_this<Reaction> {
    * Reaction impacts ribosome movement propensities.
    */
   bool tRNA_reaction_ = false;
+  /**
+   * SpeciesTracker of the model that this reaction belongs to.
+   */
+  SpeciesTracker *tracker_ = nullptr;
 };
 
 /**
@@ -71,11 +82,14 @@ class SpeciesReaction : public Reaction {
    * @param reactants vector of reactant names
    * @param products vector of product names
    * @param volume the volume in which these reactions will occur
+   * @param tracker SpeciesTracker of the model this reaction belongs to. A
+   *                reaction without a tracker cannot be simulated.
    *
    */
   SpeciesReaction(double rate_constant, double volume,
                   const std::vector<std::string> &reactants,
-                  const std::vector<std::string> &products);
+                  const std::vector<std::string> &products,
+                  SpeciesTracker *tracker = nullptr);
   /**
    * Convenience typedefs.
    */
@@ -90,11 +104,19 @@ class SpeciesReaction : public Reaction {
    * Execute the reaction. Decrement reactants and increment products.
    */
   void Execute();
+  /**
+   * Execute the reaction several times at once (used for tau-leaping).
+   *
+   * @param times number of times the reaction fires
+   */
+  void Execute(int times);
   /**
    * Getters and setters.
    */
   const std::vector<std::string> &reactants() const { return reactants_; }
   const std::vector<std::string> &products() const { return products_; }
+  const std::vector<int> &reactant_ids() const { return reactant_ids_; }
+  const std::vector<int> &product_ids() const { return product_ids_; }
 
  private:
   /**
@@ -109,6 +131,12 @@ class SpeciesReaction : public Reaction {
    * Vector of product names.
    */
   const std::vector<std::string> products_;
+  /**
+   * SpeciesTracker IDs of reactants and products, in the same order as
+   * reactants_ and products_.
+   */
+  std::vector<int> reactant_ids_;
+  std::vector<int> product_ids_;
 };
 
 /**
@@ -121,10 +149,10 @@ class Bind : public Reaction {
    *
    * @param rate_constant rate constant of the binding reaction
    * @param promoter_name name of promoter involved in this reaction
-   * @param pol_template Polymerase object that will get copied and bound to
-   *  Polymer upon execution of this reaction
+   * @param tracker SpeciesTracker of the model this reaction belongs to
    */
-  Bind(double rate_constant, double volume, const std::string &promoter_name);
+  Bind(double rate_constant, double volume, const std::string &promoter_name,
+       SpeciesTracker *tracker);
   /**
    * Calculate propensity of binding reaction.
    *
@@ -152,6 +180,10 @@ class Bind : public Reaction {
    * Name of promoter involved in this binding reaction.
    */
   const std::string promoter_name_;
+  /**
+   * SpeciesTracker ID of promoter.
+   */
+  int promoter_id_;
 };
 
 /**
@@ -165,10 +197,11 @@ class BindPolymerase : public Bind {
    * @param rate_constant binding rate constant
    * @param volume volume that in which reaction occurs
    * @param pol_template polymerase object to construct upon binding
+   * @param tracker SpeciesTracker of the model this reaction belongs to
    */
   BindPolymerase(double rate_constant, double volume,
                  const std::string &promoter_name,
-                 const Polymerase &pol_template);
+                 const Polymerase &pol_template, SpeciesTracker *tracker);
   /**
    * Bind the polymerase.
    */
@@ -183,6 +216,10 @@ class BindPolymerase : public Bind {
    * Polymerase object to be copied and bound to Polymer upon execution.
    */
   const Polymerase pol_template_;
+  /**
+   * SpeciesTracker ID of polymerase.
+   */
+  int pol_id_;
 };
 
 /**
@@ -196,9 +233,10 @@ class BindRnase : public Bind {
    * @param rate_constant rate constant of binding reaction
    * @param volume volume in which reaction occurs
    * @param rnase_template Rnase to construct upon binding
+   * @param tracker SpeciesTracker of the model this reaction belongs to
    */
   BindRnase(double rate_constant, double volume, const Rnase &rnase_template,
-            const std::string &name);
+            const std::string &name, SpeciesTracker *tracker);
   /**
    * Bind Rnase to open binding site.
    */
@@ -248,6 +286,7 @@ class PolymerWrapper : public Reaction {
    */
   void index(int index);
   int index() const { return index_; }
+  Polymer::Ptr polymer() const { return polymer_; }
 
  private:
   /**
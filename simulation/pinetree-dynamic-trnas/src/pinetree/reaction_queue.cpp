@@ -0,0 +1,85 @@
+#include <algorithm>
+#include <stdexcept>
+
+#include "reaction_queue.hpp"
+
+void ReactionQueue::Push(double time) {
+  int index = times_.size();
+  times_.push_back(time);
+  heap_.push_back(index);
+  position_.push_back(index);
+  SiftUp(index);
+}
+
+void ReactionQueue::Pop() {
+  if (times_.empty()) {
+    throw std::range_error("ReactionQueue: cannot remove from empty queue.");
+  }
+  int index = times_.size() - 1;
+  int position = position_[index];
+  int last = heap_.size() - 1;
+  Swap(position, last);
+  heap_.pop_back();
+  times_.pop_back();
+  position_.pop_back();
+  if (position < last) {
+    SiftUp(position);
+    SiftDown(position);
+  }
+}
+
+void ReactionQueue::Set(int index, double time) {
+  if (index >= times_.size() || index < 0) {
+    throw std::range_error("ReactionQueue: reaction index out of range.");
+  }
+  double old_time = times_[index];
+  times_[index] = time;
+  if (time < old_time) {
+    SiftUp(position_[index]);
+  } else {
+    SiftDown(position_[index]);
+  }
+}
+
+void ReactionQueue::Clear() {
+  times_.clear();
+  heap_.clear();
+  position_.clear();
+}
+
+void ReactionQueue::SiftUp(int position) {
+  while (position > 0) {
+    int parent = (position - 1) / 2;
+    if (times_[heap_[parent]] <= times_[heap_[position]]) {
+      break;
+    }
+    Swap(position, parent);
+    position = parent;
+  }
+}
+
+void ReactionQueue::SiftDown(int position) {
+  int size = heap_.size();
+  while (true) {
+    int smallest = position;
+    int left = 2 * position + 1;
+    int right = left + 1;
+    if (left < size && times_[heap_[left]] < times_[heap_[smallest]]) {
+      smallest = left;
+    }
+    if (right < size && times_[heap_[right]] < times_[heap_[smallest]]) {
+      smallest = right;
+    }
+    if (smallest == position) {
+      break;
+    }
+    Swap(position, smallest);
+    position = smallest;
+  }
+}
+
+void ReactionQueue::Swap(int a, int b) {
+  std::swap(heap_[a], heap_[b]);
+  position_[heap_[a]] = a;
+  position_[heap_[b]] = b;
+}
@@ -0,0 +1,63 @@
+#ifndef SRC_REACTION_QUEUE_HPP  // header guard
+#define SRC_REACTION_QUEUE_HPP
+
+#include <vector>
+
+/**
+ * An indexed binary min-heap of putative reaction times, as used by the next
+ * reaction method (Gibson and Bruck 2000). Items are identified by the index
+ * of their reaction, so that the time of any reaction can be changed in
+ * O(log n) time and the next reaction can be found in O(1) time.
+ */
+class ReactionQueue {
+ public:
+  /**
+   * Append a reaction time; its index is the current size of the queue.
+   *
+   * @param time putative time of the new reaction
+   */
+  void Push(double time);
+  /**
+   * Remove the reaction with the highest index from the queue.
+   */
+  void Pop();
+  /**
+   * Change the putative time of an existing reaction.
+   *
+   * @param index index of reaction
+   * @param time new putative time
+   */
+  void Set(int index, double time);
+  /**
+   * Remove all reactions from the queue.
+   */
+  void Clear();
+  /**
+   * Getters and setters.
+   */
+  int top() const { return heap_[0]; }
+  double get(int index) const { return times_[index]; }
+  int size() const { return times_.size(); }
+
+ private:
+  /**
+   * Putative reaction times, by reaction index.
+   */
+  std::vector<double> times_;
+  /**
+   * Heap of reaction indices, ordered by time.
+   */
+  std::vector<int> heap_;
+  /**
+   * Position of each reaction index in heap_.
+   */
+  std::vector<int> position_;
+  /**
+   * Move the item at a heap position up or down until the heap is ordered.
+   */
+  void SiftUp(int position);
+  void SiftDown(int position);
+  void Swap(int a, int b);
+};
+
+#endif  // header guard
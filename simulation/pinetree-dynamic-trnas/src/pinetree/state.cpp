@@ -0,0 +1,157 @@
+#include "state.hpp"
+
+namespace {
+const std::string kMagic = "pinetree-state";
+const int32_t kVersion = 1;
+/**
+ * Written in the byte order of the saving machine, to detect states saved on
+ * a machine with a different byte order.
+ */
+const uint32_t kByteOrder = 0x01020304;
+}  // namespace
+
+StateWriter::StateWriter(std::ostream &out) : out_(out) {
+  Write(kMagic);
+  Write(kVersion);
+  Write(kByteOrder);
+}
+
+void StateWriter::Write(const std::string &value) {
+  Write<int64_t>(value.size());
+  out_.write(value.data(), value.size());
+}
+
+void StateWriter::AddPolymer(const std::shared_ptr<Polymer> &polymer) {
+  if (polymer) {
+    polymer_ids_[polymer.get()] = polymer_count_;
+  }
+  polymer_count_++;
+}
+
+void StateWriter::AddReaction(const std::shared_ptr<Reaction> &reaction) {
+  if (reaction) {
+    reaction_ids_[reaction.get()] = reaction_count_;
+  }
+  reaction_count_++;
+}
+
+void StateWriter::WritePolymer(const std::shared_ptr<Polymer> &polymer) {
+  if (!polymer) {
+    Write<int32_t>(-1);
+    return;
+  }
+  auto it = polymer_ids_.find(polymer.get());
+  if (it == polymer_ids_.end()) {
+    throw std::logic_error("StateWriter: polymer has not been added.");
+  }
+  Write<int32_t>(it->second);
+}
+
+void StateWriter::WriteReaction(const std::shared_ptr<Reaction> &reaction) {
+  if (!reaction) {
+    Write<int32_t>(-1);
+    return;
+  }
+  auto it = reaction_ids_.find(reaction.get());
+  if (it == reaction_ids_.end()) {
+    throw std::logic_error("StateWriter: reaction has not been added.");
+  }
+  Write<int32_t>(it->second);
+}
+
+void StateWriter::Close() {
+  Section("end");
+  out_.flush();
+  if (!out_) {
+    throw std::runtime_error("Could not write simulation state.");
+  }
+}
+
+StateReader::StateReader(std::istream &in) : in_(in) {
+  auto start = in_.tellg();
+  in_.seekg(0, std::ios::end);
+  end_ = in_.tellg();
+  in_.seekg(start);
+  Check();
+  if (ReadSize() != kMagic.size()) {
+    throw std::runtime_error("Not a saved pinetree simulation state.");
+  }
+  std::string magic(kMagic.size(), '\0');
+  in_.read(&magic[0], magic.size());
+  Check();
+  if (magic != kMagic) {
+    throw std::runtime_error("Not a saved pinetree simulation state.");
+  }
+  if (Read<int32_t>() != kVersion) {
+    throw std::runtime_error(
+        "Saved simulation state was written by an incompatible version of "
+        "pinetree.");
+  }
+  if (Read<uint32_t>() != kByteOrder) {
+    throw std::runtime_error(
+        "Saved simulation state was written on a machine with a different "
+        "byte order.");
+  }
+}
+
+void StateReader::Check() {
+  if (!in_) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
+  }
+}
+
+int64_t StateReader::ReadSize(int item_size) {
+  auto size = Read<int64_t>();
+  if (size < 0 || size > (end_ - in_.tellg()) / item_size) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
+  }
+  return size;
+}
+
+std::string StateReader::ReadString() {
+  std::string value(ReadSize(), '\0');
+  if (!value.empty()) {
+    in_.read(&value[0], value.size());
+    Check();
+  }
+  return value;
+}
+
+void StateReader::Section(const std::string &name) {
+  if (ReadString() != name) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
+  }
+}
+
+void StateReader::AddPolymer(const std::shared_ptr<Polymer> &polymer) {
+  polymers_.push_back(polymer);
+}
+
+void StateReader::AddReaction(const std::shared_ptr<Reaction> &reaction) {
+  reactions_.push_back(reaction);
+}
+
+int StateReader::ReadId(int size) {
+  auto id = Read<int32_t>();
+  if (id < -1 || id >= size) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
+  }
+  return id;
+}
+
+std::shared_ptr<Polymer> StateReader::ReadPolymer() {
+  int id = ReadId(polymers_.size());
+  return (id < 0) ? nullptr : polymers_[id];
+}
+
+std::shared_ptr<Reaction> StateReader::ReadReaction() {
+  int id = ReadId(reactions_.size());
+  return (id < 0) ? nullptr : reactions_[id];
+}
+
+void StateReader::Close() {
+  Section("end");
+  if (in_.tellg() != end_) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
+  }
+}
@@ -0,0 +1,132 @@
+#ifndef SRC_STATE_HPP  // header guard
+#define SRC_STATE_HPP
+
+#include <cstdint>
+#include <iostream>
+#include <map>
+#include <memory>
+#include <stdexcept>
+#include <string>
+#include <type_traits>
+#include <vector>
+
+class Polymer;
+class Reaction;
+
+/**
+ * Writes the state of a simulation to a stream (see Model::SaveState()).
+ * Numbers are stored in binary, in the byte order of this machine, so that
+ * floating point values are restored exactly.
+ *
+ * Polymers and reactions are written as IDs. Every polymer and reaction that
+ * may be referred to must be added (in the same order as when reading the
+ * state) before it is written.
+ */
+class StateWriter {
+ public:
+  /**
+   * Write the file header.
+   */
+  explicit StateWriter(std::ostream &out);
+  template <typename T>
+  void Write(T value) {
+    static_assert(std::is_arithmetic<T>::value,
+                  "StateWriter: use Write() for numbers and strings only.");
+    out_.write(reinterpret_cast<const char *>(&value), sizeof(T));
+  }
+  void Write(const std::string &value);
+  template <typename T>
+  void Write(const std::vector<T> &values) {
+    Write<int64_t>(values.size());
+    for (const auto &value : values) {
+      Write<T>(value);
+    }
+  }
+  /**
+   * Mark the start of a section, so that reading a state of a different
+   * layout fails early.
+   */
+  void Section(const std::string &name) { Write(name); }
+  void AddPolymer(const std::shared_ptr<Polymer> &polymer);
+  void AddReaction(const std::shared_ptr<Reaction> &reaction);
+  /**
+   * Write the ID of a polymer or reaction (-1 for a null pointer).
+   */
+  void WritePolymer(const std::shared_ptr<Polymer> &polymer);
+  void WriteReaction(const std::shared_ptr<Reaction> &reaction);
+  /**
+   * Check that everything has been written.
+   */
+  void Close();
+
+ private:
+  std::ostream &out_;
+  std::map<const Polymer *, int> polymer_ids_;
+  std::map<const Reaction *, int> reaction_ids_;
+  /**
+   * Number of polymers and reactions added, including null pointers.
+   */
+  int polymer_count_ = 0;
+  int reaction_count_ = 0;
+};
+
+/**
+ * Reads a state written by StateWriter. Throws std::runtime_error if the state
+ * is truncated or corrupt.
+ */
+class StateReader {
+ public:
+  /**
+   * Read and check the file header.
+   */
+  explicit StateReader(std::istream &in);
+  template <typename T>
+  T Read() {
+    static_assert(std::is_arithmetic<T>::value,
+                  "StateReader: use Read() for numbers only.");
+    T value;
+    in_.read(reinterpret_cast<char *>(&value), sizeof(T));
+    Check();
+    return value;
+  }
+  std::string ReadString();
+  template <typename T>
+  std::vector<T> ReadVector() {
+    int64_t size = ReadSize(sizeof(T));
+    std::vector<T> values;
+    values.reserve(size);
+    for (int64_t i = 0; i < size; i++) {
+      values.push_back(Read<T>());
+    }
+    return values;
+  }
+  /**
+   * Read the length of a sequence of items of the given size in bytes.
+   */
+  int64_t ReadSize(int item_size = 1);
+  void Section(const std::string &name);
+  void AddPolymer(const std::shared_ptr<Polymer> &polymer);
+  void AddReaction(const std::shared_ptr<Reaction> &reaction);
+  std::shared_ptr<Polymer> ReadPolymer();
+  std::shared_ptr<Reaction> ReadReaction();
+  /**
+   * Check that the whole state has been read.
+   */
+  void Close();
+
+ private:
+  std::istream &in_;
+  /**
+   * Position of the end of the stream, used to reject impossible sizes.
+   */
+  std::streamoff end_;
+  std::vector<std::shared_ptr<Polymer>> polymers_;
+  std::vector<std::shared_ptr<Reaction>> reactions_;
+  void Check();
+  /**
+   * Read an ID and check that it is -1 or less than size.
+   */
+  int ReadId(int size);
+};
+
+#endif  // header guard
@@ -1,18 +1,30 @@
 #include <algorithm>
+#include <cstdio>
 
 #include "tracker.hpp"
 
-SpeciesTracker &SpeciesTracker::Instance() {
-  static SpeciesTracker instance;
-  return instance;
-}
-
 void SpeciesTracker::Clear() {
+  species_ids_.clear();
+  species_names_.clear();
   species_.clear();
   promoter_map_.clear();
   species_map_.clear();
   transcripts_.clear();
   ribo_per_transcript_.clear();
+  is_species_.clear();
+  is_transcript_.clear();
+  has_ribo_.clear();
+  report_order_.clear();
+  report_order_stale_ = true;
+  collisions_.clear();
+  codon_map_.clear();
+  codon_ids_.clear();
+  code_codon_ids_.clear();
+  codon_trnas_.clear();
+  codon_weights_.clear();
+  codon_dependents_.clear();
+  trna_codons_.clear();
+  stale_reactions_.clear();
   propensity_signal_.DisconnectAll();
 }
 
@@ -31,71 +43,101 @@ void SpeciesTracker::Register(SpeciesReaction::Ptr reaction) {
   }
 }
 
+int SpeciesTracker::Intern(const std::string &name) {
+  auto it = species_ids_.find(name);
+  if (it != species_ids_.end()) {
+    return it->second;
+  }
+  int id = species_names_.size();
+  species_ids_[name] = id;
+  species_names_.push_back(name);
+  species_.push_back(0);
+  transcripts_.push_back(0);
+  ribo_per_transcript_.push_back(0);
+  is_species_.push_back(false);
+  is_transcript_.push_back(false);
+  has_ribo_.push_back(false);
+  collisions_.push_back(0);
+  species_map_.push_back(Reaction::VecPtr());
+  trna_codons_.push_back(std::vector<int>());
+  return id;
+}
+
 void SpeciesTracker::Increment(const std::string &species_name,
                                int copy_number) {
-  if (species_.count(species_name) == 0) {
-    species_[species_name] = copy_number;
-  } else {
-    species_[species_name] += copy_number;
+  Increment(Intern(species_name), copy_number);
+}
+
+void SpeciesTracker::Increment(int species_id, int copy_number) {
+  species_[species_id] += copy_number;
+  if (!is_species_[species_id]) {
+    is_species_[species_id] = true;
+    report_order_stale_ = true;
   }
-  if (species_map_.count(species_name) > 0) { // is this correct?
-    for (const auto &reaction : species_map_[species_name]) {
-      propensity_signal_.Emit(reaction);
+  for (const auto &reaction : species_map_[species_id]) {
+    propensity_signal_.Emit(reaction);
+  }
+  if (!codon_weights_.empty() && copy_number != 0) {
+    for (int codon : trna_codons_[species_id]) {
+      codon_weights_[codon] += copy_number;
+      stale_reactions_.insert(stale_reactions_.end(),
+                              codon_dependents_[codon].begin(),
+                              codon_dependents_[codon].end());
     }
   }
-  if (species_[species_name] < 0) {
-    throw std::runtime_error("Species count less than 0." + species_name);
+  if (species_[species_id] < 0) {
+    throw std::runtime_error("Species count less than 0." +
+                             species_names_[species_id]);
   }
 }
 
 void SpeciesTracker::IncrementRibo(const std::string &transcript_name,
                                    int copy_number) {
-  if (ribo_per_transcript_.count(transcript_name) == 0) {
-    ribo_per_transcript_[transcript_name] = copy_number;
-  } else {
-    ribo_per_transcript_[transcript_name] += copy_number;
-  }
-  if (ribo_per_transcript_[transcript_name] < 0) {
+  int id = Intern(transcript_name);
+  ribo_per_transcript_[id] += copy_number;
+  has_ribo_[id] = true;
+  if (ribo_per_transcript_[id] < 0) {
     throw std::runtime_error("Ribosome count less than 0." + transcript_name);
   }
 }
 
 void SpeciesTracker::IncrementTranscript(const std::string &transcript_name,
                                          int copy_number) {
-  if (transcripts_.count(transcript_name) == 0) {
-    transcripts_[transcript_name] = copy_number;
-  } else {
-    transcripts_[transcript_name] += copy_number;
+  int id = Intern(transcript_name);
+  transcripts_[id] += copy_number;
+  if (!is_transcript_[id]) {
+    is_transcript_[id] = true;
+    report_order_stale_ = true;
   }
-  if (transcripts_[transcript_name] < 0) {
+  if (transcripts_[id] < 0) {
     throw std::runtime_error("Transcript count less than 0." + transcript_name);
   }
 }
 
 void SpeciesTracker::InitializeCollision(const std::string &pol_name) {
-  collisions[pol_name] = 0;
+  collisions_[Intern(pol_name)] = 0;
 }
 
 void SpeciesTracker::IncrementCollision(const std::string &pol_name) {
-  collisions[pol_name] += 1;
+  collisions_[Intern(pol_name)] += 1;
 }
 
 void SpeciesTracker::ResetCollision() {
-  collisions.clear();
+  std::fill(collisions_.begin(), collisions_.end(), 0);
 }
 
 void SpeciesTracker::Add(const std::string &species_name,
                          Reaction::Ptr reaction) {
-  Increment(species_name, 0);
-  if (species_map_.count(species_name) == 0) {
-    species_map_[species_name] = Reaction::VecPtr{reaction};
-  } else {
-    // TODO: Maybe use a better data type here like a set?
-    auto it = std::find(species_map_[species_name].begin(),
-                        species_map_[species_name].end(), reaction);
-    if (it == species_map_[species_name].end()) {
-      species_map_[species_name].push_back(reaction);
-    }
+  int id = Intern(species_name);
+  if (!is_species_[id]) {
+    is_species_[id] = true;
+    report_order_stale_ = true;
+  }
+  // Only the reaction added last can already be recorded (see header), so
+  // adding the many binding reactions of high-copy transcripts stays linear
+  auto &reactions = species_map_[id];
+  if (reactions.empty() || reactions.back() != reaction) {
+    reactions.push_back(reaction);
   }
 }
 
@@ -120,7 +162,7 @@ void SpeciesTracker::Remove(const std::string &promoter_name,
 }
 
 void SpeciesTracker::TerminateTranscription(
-    std::shared_ptr<PolymerWrapper> wrapper, const std::string &pol_name,
+    const std::shared_ptr<PolymerWrapper> &wrapper, const std::string &pol_name,
     const std::string &gene_name) {
   Increment(pol_name, 1);
   propensity_signal_.Emit(wrapper);
@@ -128,7 +170,7 @@ void SpeciesTracker::TerminateTranscription(
 }
 
 void SpeciesTracker::TerminateTranslation(
-    std::shared_ptr<PolymerWrapper> wrapper, const std::string &pol_name,
+    const std::shared_ptr<PolymerWrapper> &wrapper, const std::string &pol_name,
     const std::string &gene_name) {
   Increment(pol_name, 1);
   Increment(gene_name, 1);
@@ -139,10 +181,79 @@ void SpeciesTracker::TerminateTranslation(
 
 const Reaction::VecPtr &SpeciesTracker::FindReactions(
     const std::string &species_name) {
-  if (species_map_.count(species_name) == 0) {
+  auto it = species_ids_.find(species_name);
+  if (it == species_ids_.end() || species_map_[it->second].empty()) {
     throw std::runtime_error("Species not found in tracker.");
   }
-  return species_map_[species_name];
+  return species_map_[it->second];
+}
+
+void SpeciesTracker::AddCodonDependency(int codon_id, Reaction::Ptr reaction) {
+  codon_dependents_[codon_id].insert(reaction);
+}
+
+void SpeciesTracker::RemoveCodonDependency(int codon_id,
+                                           Reaction::Ptr reaction) {
+  codon_dependents_[codon_id].erase(reaction);
+}
+
+void SpeciesTracker::codon_map(
+    const std::map<std::string, std::vector<std::string>> &codon_map) {
+  codon_map_ = codon_map;
+  codon_ids_.clear();
+  code_codon_ids_.assign(Sequence::kNoCodon + 1, -1);
+  codon_trnas_.assign(codon_map_.size(), {});
+  for (auto &codons : trna_codons_) {
+    codons.clear();
+  }
+  codon_weights_.assign(codon_map_.size(), 0);
+  codon_dependents_.assign(codon_map_.size(), std::set<Reaction::Ptr>());
+  int id = 0;
+  for (const auto &codon : codon_map_) {
+    codon_ids_[codon.first] = id;
+    int code = Sequence::Encode(codon.first);
+    if (code != Sequence::kNoCodon) {
+      code_codon_ids_[code] = id;
+    }
+    for (const auto &anticodon : codon.second) {
+      int species_id = Intern(anticodon + "_charged");
+      codon_trnas_[id].emplace_back(species_id,
+                                    Intern(anticodon + "_uncharged"));
+      trna_codons_[species_id].push_back(id);
+      codon_weights_[id] += species_[species_id];
+    }
+    id++;
+  }
+}
+
+int SpeciesTracker::codon_id(const std::string &codon) {
+  auto it = codon_ids_.find(codon);
+  if (it == codon_ids_.end()) {
+    throw std::runtime_error("Codon '" + codon +
+                             "' not found in codon-to-anticodon map.");
+  }
+  return it->second;
+}
+
+void SpeciesTracker::ConsumetRNA(int codon_id) {
+  const auto &trnas = codon_trnas_[codon_id];
+  // Same choice as Random::WeightedChoiceIndex() with the charged counts as
+  // weights, without building vectors of weights and cumulative sums
+  double total = 0;
+  for (const auto &trna : trnas) {
+    total += species_[trna.first];
+  }
+  double value = rng_.random() * total;
+  double cumulative = 0;
+  for (const auto &trna : trnas) {
+    cumulative += species_[trna.first];
+    if (cumulative > value) {
+      Increment(trna.first, -1);
+      Increment(trna.second, 1);
+      return;
+    }
+  }
+  throw std::runtime_error("No charged tRNA left to read codon.");
 }
 
 const Polymer::VecPtr &SpeciesTracker::FindPolymers(
@@ -154,56 +265,154 @@ const Polymer::VecPtr &SpeciesTracker::FindPolymers(
 }
 
 int SpeciesTracker::species(const std::string &reactant) {
-  if (species_.count(reactant) == 0) {
+  auto it = species_ids_.find(reactant);
+  if (it == species_ids_.end() || !is_species_[it->second]) {
     throw std::runtime_error("Species not found in tracker.");
   }
-  return species_[reactant];
+  return species_[it->second];
 }
 
 int SpeciesTracker::transcripts(const std::string &transcript_name) {
-  return transcripts_[transcript_name];
+  int id = Intern(transcript_name);
+  if (!is_transcript_[id]) {
+    is_transcript_[id] = true;
+    report_order_stale_ = true;
+  }
+  return transcripts_[id];
 }
 
 int SpeciesTracker::ribo_per_transcript(const std::string &transcript_name) {
-  return ribo_per_transcript_[transcript_name];
+  int id = Intern(transcript_name);
+  has_ribo_[id] = true;
+  return ribo_per_transcript_[id];
 }
 
 const std::string SpeciesTracker::GatherCounts(double time_stamp) {
-  std::map<std::string, std::vector<double>> output;
-  for (auto elem : species_) {
-    output[elem.first].push_back(elem.second);
-    output[elem.first].push_back(0);
-    output[elem.first].push_back(0);
-    if (collisions.find(elem.first) != collisions.end()) {
-      // if element is a polymerase, get its collision count
-      output[elem.first].push_back(collisions[elem.first]);
-    } else {
-      output[elem.first].push_back(0);
+  std::vector<SpeciesCounts> counts;
+  GatherCounts(counts);
+  std::string out_string;
+  FormatCounts(time_stamp, counts, out_string);
+  return out_string;
+}
+
+void SpeciesTracker::GatherCounts(std::vector<SpeciesCounts> &counts) {
+  if (report_order_stale_) {
+    // species_ids_ is ordered by name, so rows come out sorted by name
+    report_order_.clear();
+    for (const auto &elem : species_ids_) {
+      if (is_species_[elem.second] || is_transcript_[elem.second]) {
+        report_order_.push_back(elem.second);
+      }
     }
+    report_order_stale_ = false;
+  }
+  counts.resize(report_order_.size());
+  for (int i = 0; i < report_order_.size(); i++) {
+    counts[i] = this->counts(report_order_[i]);
+  }
+}
+
+SpeciesCounts SpeciesTracker::counts(int species_id) const {
+  SpeciesCounts row;
+  row.species = species_id;
+  row.protein = species_[species_id];
+  row.transcript = transcripts_[species_id];
+  row.ribo_density = 0;
+  if (is_transcript_[species_id] && has_ribo_[species_id]) {
+    row.ribo_density = double(ribo_per_transcript_[species_id]) /
+                       double(transcripts_[species_id]);
+  }
+  // Only polymerases that are also species report collisions
+  row.collisions = is_species_[species_id] ? collisions_[species_id] : 0;
+  return row;
+}
+
+void SpeciesTracker::FormatCounts(double time_stamp,
+                                  const std::vector<SpeciesCounts> &counts,
+                                  std::string &out) const {
+  // Large enough for any double printed with "%f", as by std::to_string
+  char time_field[400];
+  char field[400];
+  int time_length =
+      std::snprintf(time_field, sizeof(time_field), "%f\t", time_stamp);
+  for (const auto &row : counts) {
+    out.append(time_field, time_length);
+    out += species_names_[row.species];
+    int length = std::snprintf(field, sizeof(field), "\t%f\t%f\t%f\t%f\n",
+                               double(row.protein), double(row.transcript),
+                               row.ribo_density, double(row.collisions));
+    out.append(field, std::min<int>(length, sizeof(field) - 1));
   }
-  for (auto transcript : transcripts_) {
-    if (output[transcript.first].size() == 4) {
-      output[transcript.first][1] = transcript.second;
-    } else {
-      output[transcript.first].push_back(0);
-      output[transcript.first].push_back(transcript.second);
-      output[transcript.first].push_back(0);
+}
+
+void SpeciesTracker::SaveState(StateWriter &out) const {
+  out.Write<int64_t>(species_names_.size());
+  out.Write(species_);
+  out.Write(transcripts_);
+  out.Write(ribo_per_transcript_);
+  out.Write(is_species_);
+  out.Write(is_transcript_);
+  out.Write(has_ribo_);
+  out.Write(collisions_);
+  out.Write(codon_weights_);
+  out.Write(force_update_all_);
+  out.Write<int64_t>(promoter_map_.size());
+  for (const auto &promoter : promoter_map_) {
+    out.Write(promoter.first);
+    out.Write<int64_t>(promoter.second.size());
+    for (const auto &polymer : promoter.second) {
+      out.WritePolymer(polymer);
     }
-    if (ribo_per_transcript_.find(transcript.first) !=
-        ribo_per_transcript_.end()) {
-      output[transcript.first][2] =
-          double(ribo_per_transcript_[transcript.first]) /
-          double(output[transcript.first][1]);
+  }
+  out.Write(rng_.state());
+}
+
+void SpeciesTracker::LoadState(StateReader &in) {
+  if (in.ReadSize() != species_names_.size()) {
+    throw std::invalid_argument(
+        "Saved state does not match this model (species differ).");
+  }
+  species_ = in.ReadVector<int>();
+  transcripts_ = in.ReadVector<int>();
+  ribo_per_transcript_ = in.ReadVector<int>();
+  is_species_ = in.ReadVector<bool>();
+  is_transcript_ = in.ReadVector<bool>();
+  has_ribo_ = in.ReadVector<bool>();
+  collisions_ = in.ReadVector<int>();
+  auto codon_weights = in.ReadVector<int>();
+  for (const auto *counts : {&species_, &transcripts_, &ribo_per_transcript_,
+                             &collisions_}) {
+    if (counts->size() != species_names_.size()) {
+      throw std::runtime_error(
+          "Saved simulation state is truncated or corrupt.");
     }
-    output[transcript.first].push_back(0);
   }
-  std::string out_string;
-  for (auto row : output) {
-    out_string = out_string + (std::to_string(time_stamp) + "\t" + row.first +
-                               "\t" + std::to_string(row.second[0]) + "\t" +
-                               std::to_string(row.second[1]) + "\t" +
-                               std::to_string(row.second[2]) + "\t" +
-                               std::to_string(row.second[3]) + "\n");
+  if (is_species_.size() != species_names_.size() ||
+      is_transcript_.size() != species_names_.size() ||
+      has_ribo_.size() != species_names_.size()) {
+    throw std::runtime_error("Saved simulation state is truncated or corrupt.");
   }
-  return out_string;
+  if (codon_weights.size() != codon_weights_.size()) {
+    throw std::invalid_argument(
+        "Saved state does not match this model (codons differ).");
+  }
+  codon_weights_ = codon_weights;
+  force_update_all_ = in.Read<bool>();
+  promoter_map_.clear();
+  int64_t promoters = in.ReadSize();
+  for (int64_t i = 0; i < promoters; i++) {
+    auto &polymers = promoter_map_[in.ReadString()];
+    int64_t count = in.ReadSize();
+    for (int64_t j = 0; j < count; j++) {
+      auto polymer = in.ReadPolymer();
+      if (!polymer) {
+        throw std::runtime_error(
+            "Saved simulation state is truncated or corrupt.");
+      }
+      polymers.push_back(polymer);
+    }
+  }
+  rng_.state(in.ReadString());
+  report_order_stale_ = true;
+  stale_reactions_.clear();
 }
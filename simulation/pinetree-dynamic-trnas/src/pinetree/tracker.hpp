@@ -4,8 +4,24 @@
 #define SRC_TRACKER_HPP
 
 #include <memory>
+#include <set>
 
-#include "model.hpp"
+#include "choices.hpp"
+#include "reaction.hpp"
+
+/**
+ * Counts of one species, transcript, or polymerase at an output time.
+ */
+struct SpeciesCounts {
+  /**
+   * ID of species (see SpeciesTracker::Intern())
+   */
+  int species;
+  int protein;
+  int transcript;
+  double ribo_density;
+  int collisions;
+};
 
 /**
  * Tracks species' copy numbers and maintains promoter-to-polymer and species-
@@ -13,17 +29,15 @@
  * and which reactions involve a given species. These maps are needed to cache
  * propensities and increase the performance of the simulation.
  *
- * Follows a singleton pattern:
- * http://stackoverflow.com/a/1008289/5360633
+ * Each Model owns one SpeciesTracker, which is passed by pointer to the
+ * polymers and reactions registered with that model. The tracker also holds
+ * the model's random number generator.
  *
  * TODO: Move propensity cache from Model into this class?
  */
 class SpeciesTracker {
  public:
-  /**
-   * Retrieve the only instance of this object.
-   */
-  static SpeciesTracker &Instance();
+  SpeciesTracker() {}
   /**
    * Clear all data in the tracker.
    */
@@ -44,6 +58,24 @@ class SpeciesTracker {
    * @param copy_number number to add to current copy number count
    */
   void Increment(const std::string &species_name, int copy_number);
+  /**
+   * Change a species count by a given value, looking the species up by its
+   * integer ID.
+   *
+   * @param species_id ID of species (see Intern())
+   * @param copy_number number to add to current copy number count
+   */
+  void Increment(int species_id, int copy_number);
+  /**
+   * Look up the integer ID of a named species, transcript, or polymerase,
+   * assigning a new ID if the name has not been seen before. IDs are dense,
+   * starting at 0, and remain valid until Clear() is called.
+   *
+   * @param name name of species
+   *
+   * @return ID of species
+   */
+  int Intern(const std::string &name);
   /**
    * Update ribosome count for a given transcript.
    *
@@ -60,9 +92,13 @@ class SpeciesTracker {
   void IncrementTranscript(const std::string &transcript_name, int copy_number);
   void InitializeCollision(const std::string &pol_name);
   void IncrementCollision(const std::string &pol_name);
+  void IncrementCollision(int pol_id) { collisions_[pol_id] += 1; }
   void ResetCollision();
   /**
-   * Add a species-reaction pair to species-reaction map.
+   * Add a species-reaction pair to species-reaction map. All species of a
+   * reaction must be added one after another, before any other reaction is
+   * added, so that a species that appears twice in a reaction is only
+   * recorded once.
    *
    * @param species_name name of species
    * @param reaction reaction object (pointer) that involves species
@@ -91,7 +127,7 @@ class SpeciesTracker {
    * @param gene_name name of last gene on the polymerase encountered (not
    *  currently used, but may be used in future)
    */
-  void TerminateTranscription(std::shared_ptr<PolymerWrapper> wrapper,
+  void TerminateTranscription(const std::shared_ptr<PolymerWrapper> &wrapper,
                               const std::string &pol_name,
                               const std::string &gene_name);
   /**
@@ -101,7 +137,7 @@ class SpeciesTracker {
    * @param pol_name name of ribosome completing transcription
    * @param protein_name name of newly-synthesized protein
    */
-  void TerminateTranslation(std::shared_ptr<PolymerWrapper> wrapper,
+  void TerminateTranslation(const std::shared_ptr<PolymerWrapper> &wrapper,
                             const std::string &pol_name,
                             const std::string &protein_name);
   /**
@@ -120,70 +156,214 @@ class SpeciesTracker {
    * @return vector of pointers to Reaction objects that involve species_name
    */
   const Reaction::VecPtr &FindReactions(const std::string &species_name);
+  /**
+   * Record that a polymer has at least one ribosome sitting on a codon. The
+   * propensity of the polymer will be refreshed whenever the copy number of
+   * any charged tRNA species that reads this codon changes.
+   *
+   * @param codon_id integer ID of codon (see codon_id())
+   * @param reaction wrapper reaction of the polymer
+   */
+  void AddCodonDependency(int codon_id, Reaction::Ptr reaction);
+  /**
+   * Remove a polymer from the set of reactions depending on a codon, i.e.
+   * when the last ribosome on that codon moves on.
+   *
+   * @param codon_id integer ID of codon
+   * @param reaction wrapper reaction of the polymer
+   */
+  void RemoveCodonDependency(int codon_id, Reaction::Ptr reaction);
+  /**
+   * A ribosome reads a codon: turn one charged tRNA that reads it, chosen at
+   * random weighted by the counts of charged tRNAs, into an uncharged tRNA.
+   *
+   * @param codon_id integer ID of codon
+   */
+  void ConsumetRNA(int codon_id);
+  /**
+   * Polymers whose ribosome propensities are stale because a charged tRNA
+   * count changed since the last call to ClearStale().
+   */
+  const Reaction::VecPtr &stale_reactions() { return stale_reactions_; }
+  void ClearStale() { stale_reactions_.clear(); }
+  /**
+   * Counts of all species and transcripts as tab-separated text, one row per
+   * species, sorted by name.
+   */
   const std::string GatherCounts(double time_stamp);
+  /**
+   * Collect the counts of all species and transcripts, sorted by name. Costs
+   * O(n) in the number of reported species and does not allocate once counts
+   * has grown to its final size.
+   *
+   * @param counts vector to fill; existing contents are discarded
+   */
+  void GatherCounts(std::vector<SpeciesCounts> &counts);
+  /**
+   * Append counts (see GatherCounts()) to a string as tab-separated text.
+   *
+   * @param time_stamp value of the time column
+   * @param counts rows to format
+   * @param out string to append to
+   */
+  void FormatCounts(double time_stamp, const std::vector<SpeciesCounts> &counts,
+                    std::string &out) const;
+  /**
+   * Current counts of a single species, as reported by GatherCounts().
+   *
+   * @param species_id ID of species (see Intern())
+   */
+  SpeciesCounts counts(int species_id) const;
   /**
    * Getters and setters
    */
   int species(const std::string &reactant);
+  int species(int species_id) const { return species_[species_id]; }
+  const std::string &species_name(int species_id) const {
+    return species_names_[species_id];
+  }
+  int species_count() const { return species_names_.size(); }
   int transcripts(const std::string &transcript_name);
   int ribo_per_transcript(const std::string &transcript_name);
-  const std::map<std::string, int> &species() { return species_; }
-  const std::map<std::string, int> &transcripts() { return transcripts_; }
-  const std::map<std::string, int> &ribo_per_transcript() {
-    return ribo_per_transcript_;
-  }
-  void codon_map(const std::map<std::string, std::vector<std::string>> &codon_map) {
-    codon_map_ = codon_map;
-  }
+  /**
+   * Set the codon-to-anticodon map and assign each codon in the map a dense
+   * integer ID.
+   */
+  void codon_map(const std::map<std::string, std::vector<std::string>> &codon_map);
   const std::map<std::string, std::vector<std::string>> &codon_map() {
     return codon_map_;
   }
+  /**
+   * Look up the integer ID of a codon.
+   *
+   * @param codon three-letter codon
+   *
+   * @return ID of codon between 0 and codon_count() - 1
+   */
+  int codon_id(const std::string &codon);
+  /**
+   * Look up the integer ID of a codon by its code (see Sequence::Encode()).
+   *
+   * @return ID of codon, or -1 if the codon is not in the codon map
+   */
+  int codon_id(int code) const { return code_codon_ids_[code]; }
+  int codon_count() const { return codon_weights_.size(); }
+  /**
+   * Total number of charged tRNAs that can read a codon.
+   *
+   * @param codon_id integer ID of codon
+   */
+  int codon_weight(int codon_id) const { return codon_weights_[codon_id]; }
+  Random::Generator &rng() { return rng_; }
   void force_update_all() { force_update_all_ = true; }
   void unflag_force_update() { force_update_all_ = false; }
   bool check_force_update() { return force_update_all_; }
+  /**
+   * Write or restore all counts, tRNA pools, the polymers carrying each
+   * promoter, and the random number generator (see Model::SaveState()).
+   * Species must have been interned in the same order as in the saved
+   * tracker.
+   */
+  void SaveState(StateWriter &out) const;
+  void LoadState(StateReader &in);
   
   /**
    * Signal to fire when propensity needs to be updated.
    */
-  Signal<std::shared_ptr<Reaction>> propensity_signal_;
+  Signal<const std::shared_ptr<Reaction> &> propensity_signal_;
 
  private:
   /**
-   * Private constructor for singleton
+   * Name-to-ID map. Ordered by name so that output is sorted.
    */
-  SpeciesTracker() {}
+  std::map<std::string, int> species_ids_;
+  /**
+   * Names of species, indexed by ID.
+   */
+  std::vector<std::string> species_names_;
+  /**
+   * Species counts, indexed by ID.
+   */
+  std::vector<int> species_;
   /**
-   * Species counts.
+   * Transcript (gene) counts, indexed by ID.
    */
-  std::map<std::string, int> species_;
+  std::vector<int> transcripts_;
   /**
-   * Transcript (gene) counts.
+   * Number of ribosomes on each transcript (gene), indexed by ID.
    */
-  std::map<std::string, int> transcripts_;
+  std::vector<int> ribo_per_transcript_;
   /**
-   * Number of ribosomes on each transcript (gene).
+   * Whether each ID has been used as a species, a transcript, or for
+   * ribosome counts. Only IDs used as species or transcripts are reported in
+   * GatherCounts().
    */
-  std::map<std::string, int> ribo_per_transcript_;
+  std::vector<bool> is_species_;
+  std::vector<bool> is_transcript_;
+  std::vector<bool> has_ribo_;
+  /**
+   * IDs reported by GatherCounts(), sorted by name. Rebuilt when an ID is
+   * first used as a species or transcript.
+   */
+  std::vector<int> report_order_;
+  bool report_order_stale_ = true;
   /**
    * Promoter-to-polymer map.
    */
   std::map<std::string, Polymer::VecPtr> promoter_map_;
   /**
-   * Species-to-reaction map.
+   * Species-to-reaction map, indexed by species ID.
+   */
+  std::vector<Reaction::VecPtr> species_map_;
+  /**
+   * Codon-to-polymer map, indexed by codon ID. Each codon maps to the wrapper
+   * reactions of polymers with ribosomes currently on that codon.
+   */
+  std::vector<std::set<Reaction::Ptr>> codon_dependents_;
+  /**
+   * Codon-to-ID map.
+   */
+  std::map<std::string, int> codon_ids_;
+  /**
+   * Codon IDs indexed by codon code (see Sequence::Encode()), -1 for codons
+   * not in the codon map.
+   */
+  std::vector<int> code_codon_ids_;
+  /**
+   * IDs of the charged and uncharged species of each tRNA that reads a codon,
+   * indexed by codon ID, in the order of the codon map.
    */
-  std::map<std::string, Reaction::VecPtr> species_map_;
+  std::vector<std::vector<std::pair<int, int>>> codon_trnas_;
+  /**
+   * Charged-tRNA-to-codon map, indexed by species ID. Lists the IDs of all
+   * codons that each charged tRNA species can read.
+   */
+  std::vector<std::vector<int>> trna_codons_;
+  /**
+   * Number of charged tRNAs available to read each codon, indexed by codon ID.
+   */
+  std::vector<int> codon_weights_;
+  /**
+   * Reactions that need their propensities refreshed by Gillespie.
+   */
+  Reaction::VecPtr stale_reactions_;
   /**
    * codon-to-anticodon map.
    */ 
   std::map<std::string, std::vector<std::string>> codon_map_;
   /**
-  * Polymerase collision counts.
-  */
-  std::map<std::string, int> collisions;
+   * Polymerase collision counts since the last ResetCollision(), indexed by
+   * ID.
+   */
+  std::vector<int> collisions_;
   /**
   * Force gillespie to update all propensities. Currently this should only occur when tRNA pools change.
   */
   bool force_update_all_ = false;
+  /**
+   * Random number generator used by everything simulated with this tracker.
+   */
+  Random::Generator rng_;
 };
 
 #endif  // header guard
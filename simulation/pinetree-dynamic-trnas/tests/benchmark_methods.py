@@ -0,0 +1,56 @@
+# Compare the wall-clock time of the exact simulation methods ("direct" and
+# "next_reaction") on the test models. Run from the repository root:
+#
+#     python -m tests.benchmark_methods
+#
+import importlib
+import tempfile
+import time
+
+import pinetree as pt
+
+METHODS = ["direct", "next_reaction"]
+
+
+def many_transcripts(output, method="direct", copies=300):
+    # Many independent transcript copies, as registered by
+    # trnasimtools.common.add_transcripts
+    sim = pt.Model(cell_volume=8e-16)
+    sim.seed(34)
+    sim.add_ribosome(copy_number=500, speed=30, footprint=10)
+    for _ in range(copies):
+        transcript = pt.Transcript(name="transcript", length=605)
+        transcript.add_gene(name="proteinX", start=26, stop=325,
+                            rbs_start=(26 - 15), rbs_stop=26,
+                            rbs_strength=1e7)
+        transcript.add_gene(name="proteinY", start=341, stop=595,
+                            rbs_start=(341 - 15), rbs_stop=341,
+                            rbs_strength=1e7)
+        sim.register_transcript(transcript)
+    sim.simulate(time_limit=30, time_step=1, output=output + "_counts.tsv",
+                 method=method)
+
+
+def main():
+    models = {
+        "single_gene": importlib.import_module(
+            ".models.single_gene", "tests").execute,
+        "degrade": importlib.import_module(
+            ".models.degrade_test", "tests").execute,
+        "birth_death": importlib.import_module(
+            ".models.birth_death", "tests").execute,
+        "many_transcripts": many_transcripts,
+    }
+    with tempfile.TemporaryDirectory() as tempdir:
+        print("model\t" + "\t".join(METHODS))
+        for name, execute in models.items():
+            times = []
+            for method in METHODS:
+                start = time.perf_counter()
+                execute(f"{tempdir}/{name}_{method}", method=method)
+                times.append(time.perf_counter() - start)
+            print(name + "\t" + "\t".join(f"{t:.3f}" for t in times))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,17 @@
 # Test simulation
+import os
+import shutil
+import signal
+import threading
+import time
 import unittest
 import subprocess
 import tempfile
 import importlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
+import pinetree as pt
 
 class MainTest(unittest.TestCase):
 
@@ -13,10 +21,13 @@ class MainTest(unittest.TestCase):
     def tearDown(self):
         self.tempdir.cleanup()
 
-    def run_test(self, prefix):
+    def run_test(self, prefix, **kwargs):
         test_mod = importlib.import_module('.models.' + prefix, 'tests')
         out_prefix = self.tempdir.name + "/" + prefix
-        test_mod.execute(out_prefix)
+        test_mod.execute(out_prefix, **kwargs)
+        self.compare_output(prefix, out_prefix)
+
+    def compare_output(self, prefix, out_prefix):
         test = pd.read_csv(f"tests/output/{prefix}_counts.tsv", sep="\t")
         result = pd.read_csv(f"{out_prefix}_counts.tsv", sep="\t")
         result = result.drop(columns = "collisions") # column not present in original test output
@@ -25,6 +36,373 @@ class MainTest(unittest.TestCase):
     def test_single_gene(self):
         self.run_test('single_gene')
 
+    def test_single_gene_tree_selection(self):
+        self.run_test('single_gene', selection="tree")
+
+    def test_npz_output(self):
+        # The binary output holds the same rows as the text output
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        out_prefix = self.tempdir.name + "/single_gene"
+        test_mod.execute(out_prefix, output_format="npz")
+        test_mod.execute(out_prefix, output_format="tsv")
+        expected = pd.read_csv(f"{out_prefix}_counts.tsv", sep="\t")
+        with np.load(f"{out_prefix}_counts.npz") as data:
+            self.assertEqual(data["species"].dtype, np.int32)
+            result = pd.DataFrame({
+                "time": data["time"],
+                "species": data["species_names"][data["species"]],
+                "protein": data["protein"],
+                "transcript": data["transcript"],
+                "ribo_density": data["ribo_density"],
+                "collisions": data["collisions"],
+            })
+        self.assertEqual(list(result.columns), list(expected.columns))
+        self.assertEqual(list(result.species), list(expected.species))
+        for column in ["time", "protein", "transcript", "ribo_density",
+                       "collisions"]:
+            np.testing.assert_allclose(result[column], expected[column],
+                                       atol=1e-6)
+        with self.assertRaises(ValueError):
+            test_mod.execute(out_prefix, output_format="parquet")
+
+    def test_sparse_output(self):
+        # Sparse output omits unchanged rows but reads back as the full table
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        out_prefix = self.tempdir.name + "/single_gene"
+        test_mod.execute(out_prefix, output_format="npz", sparse=True)
+        expected = pt.read_counts("tests/output/single_gene_counts.tsv")
+        stored = pt.read_counts(f"{out_prefix}_counts.npz", dense=False)
+        self.assertLess(len(stored), len(expected) / 2)
+        result = pt.read_counts(f"{out_prefix}_counts.npz")
+        self.assertEqual(list(result.species), list(expected.species))
+        for column in ["time", "protein", "transcript", "ribo_density"]:
+            np.testing.assert_allclose(result[column], expected[column],
+                                       atol=1e-6)
+        with self.assertRaises(ValueError):
+            test_mod.execute(out_prefix, sparse=True)
+
+    def test_output_format_detection(self):
+        # The format follows the extension unless given, and read_counts()
+        # detects it from the contents
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        out_prefix = self.tempdir.name + "/single_gene"
+        test_mod.execute(out_prefix, output_format="npz")
+        expected = pt.read_counts(f"{out_prefix}_counts.npz")
+        sim = test_mod.build()
+        sim.simulate(time_limit=40, time_step=1, output=out_prefix + ".npz")
+        with open(out_prefix + ".npz", "rb") as stream:
+            self.assertEqual(stream.read(4), b"PK\x03\x04")
+        sim = test_mod.build()
+        sim.simulate(time_limit=40, time_step=1, output=out_prefix + ".bin",
+                     output_format="npz")
+        result = pt.read_counts(out_prefix + ".bin")
+        np.testing.assert_array_equal(result.protein, expected.protein)
+        with self.assertRaises(ValueError):
+            test_mod.build().simulate(time_limit=40, time_step=1,
+                                      output=out_prefix + ".npz",
+                                      output_format="tsv")
+        # Text written to an .npz file by earlier versions
+        shutil.copy("tests/output/single_gene_counts.tsv", out_prefix + ".npz")
+        result = pt.read_counts(out_prefix + ".npz")
+        self.assertEqual(list(result.columns[:5]), list(expected.columns[:5]))
+        self.assertEqual(len(result), len(expected))
+
+    def test_output_after_error(self):
+        # Counts up to an error (here, running out of reactants) are kept in
+        # every output format
+        def depletion(**kwargs):
+            sim = pt.Model(cell_volume=8e-16)
+            sim.seed(1)
+            sim.add_species("A", 20)
+            sim.add_reaction(rate_constant=1.0, reactants=["A"], products=[])
+            with self.assertRaises(RuntimeError) as context:
+                sim.simulate(time_limit=1000, time_step=1, **kwargs)
+            return context.exception
+        out_prefix = self.tempdir.name + "/depletion"
+        depletion(output=out_prefix + ".tsv")
+        expected = pt.read_counts(out_prefix + ".tsv")
+        self.assertGreater(len(expected), 0)
+        self.assertLess(expected.time.max(), 1000)
+        depletion(output=out_prefix + ".npz", output_format="npz")
+        result = pt.read_counts(out_prefix + ".npz")
+        self.assertEqual(list(result.species), list(expected.species))
+        np.testing.assert_allclose(result.time, expected.time, atol=1e-6)
+        np.testing.assert_array_equal(result.protein, expected.protein)
+        # In-memory results come with the error
+        partial = depletion(output=None).result
+        self.assertEqual(partial.species, ["A"])
+        np.testing.assert_allclose(partial.time, expected.time, atol=1e-6)
+        np.testing.assert_array_equal(partial.protein[0], expected.protein)
+
+    def test_in_memory_result(self):
+        # Counts returned with output=None match the text output
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        result = test_mod.execute(None)
+        expected = pd.read_csv("tests/output/single_gene_counts.tsv", sep="\t")
+        times = sorted(expected.time.unique())
+        np.testing.assert_allclose(result.time, times, atol=1e-6)
+        self.assertEqual(result.species, sorted(expected.species.unique()))
+        self.assertEqual(result.protein.shape,
+                         (len(result.species), len(result.time)))
+        for row, species in enumerate(result.species):
+            counts = expected[expected.species == species]
+            columns = np.searchsorted(times, counts.time)
+            np.testing.assert_array_equal(result.protein[row, columns],
+                                          counts.protein)
+            np.testing.assert_array_equal(result.transcript[row, columns],
+                                          counts.transcript)
+            np.testing.assert_allclose(result.ribo_density[row, columns],
+                                       counts.ribo_density, atol=1e-6)
+        # Arrays are views of the result's memory rather than copies
+        self.assertFalse(result.protein.flags.owndata)
+        protein = result.protein
+        self.assertTrue(np.shares_memory(protein, result.protein))
+        time = result.time
+        self.assertTrue(np.shares_memory(time, result.time))
+
+    def test_observers(self):
+        # Observers reduce the same counts that are written to the output
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        expected = pd.read_csv("tests/output/single_gene_counts.tsv", sep="\t")
+        stats = pt.RunningStats(["proteinX", "rnapol"], start=10, stop=30)
+        transcripts = pt.LastValue(quantity="transcript")
+        crossing = pt.ThresholdCrossing(["proteinY", "missing"], 2,
+                                        quantity="transcript")
+        result = test_mod.execute(None, observers=[stats, transcripts,
+                                                   crossing])
+        # No trajectory is kept when only observers are given
+        self.assertIsNone(result)
+        window = expected[(expected.time >= 10) & (expected.time <= 30)]
+        for species in ["proteinX", "rnapol"]:
+            counts = window[window.species == species].protein
+            self.assertEqual(stats.count[species], len(counts))
+            self.assertAlmostEqual(stats.mean[species], counts.mean())
+            self.assertAlmostEqual(stats.variance[species], counts.var())
+        final = expected[expected.time == expected.time.max()]
+        self.assertEqual(sorted(transcripts.species), sorted(final.species))
+        for _, row in final.iterrows():
+            self.assertEqual(transcripts.values[row.species], row.transcript)
+        proteinY = expected[(expected.species == "proteinY") &
+                            (expected.transcript >= 2)]
+        self.assertAlmostEqual(crossing.times["proteinY"],
+                               proteinY.time.min(), places=5)
+        self.assertTrue(np.isnan(crossing.times["missing"]))
+        with self.assertRaises(ValueError):
+            pt.LastValue(quantity="proteins")
+
+    def test_concurrent_models(self):
+        # Models must not share state, so replicates run on separate threads
+        # should each reproduce the single-threaded output
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        out_prefixes = [f"{self.tempdir.name}/single_gene_{i}"
+                        for i in range(4)]
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            list(executor.map(test_mod.execute, out_prefixes))
+        for out_prefix in out_prefixes:
+            self.compare_output('single_gene', out_prefix)
+
+    def test_rng_streams(self):
+        # The same seed and stream reproduce a trajectory; other streams differ
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        for rng in ['mt19937', 'xoshiro256++', 'pcg64']:
+            outputs = []
+            for i, stream in enumerate([1, 1, 2]):
+                out_prefix = f"{self.tempdir.name}/single_gene_{i}"
+                test_mod.execute(out_prefix, stream=stream, rng=rng)
+                with open(out_prefix + "_counts.tsv") as f:
+                    outputs.append(f.read())
+            self.assertEqual(outputs[0], outputs[1])
+            self.assertNotEqual(outputs[0], outputs[2])
+        with self.assertRaises(ValueError):
+            test_mod.execute(f"{self.tempdir.name}/single_gene", rng="mt")
+
+    def test_simulation_methods(self):
+        # Methods draw different random numbers (and tau-leaping is
+        # approximate), so compare steady state statistics
+        test_mod = importlib.import_module('.models.birth_death', 'tests')
+        for method in ['direct', 'tau_leap', 'next_reaction']:
+            out_prefix = f"{self.tempdir.name}/birth_death_{method}"
+            test_mod.execute(out_prefix, method=method, epsilon=0.01)
+            result = pd.read_csv(f"{out_prefix}_counts.tsv", sep="\t")
+            result = result[result.time > 10]
+            counts = result[result.species == "A"].protein
+            self.assertAlmostEqual(counts.mean() / (1000 / 1.5), 1, delta=0.05)
+            self.assertAlmostEqual(counts.var() / (1000 / 1.5), 1, delta=0.3)
+            # Every output time is recorded
+            self.assertEqual(len(counts), 190)
+        with self.assertRaises(ValueError):
+            test_mod.execute(f"{self.tempdir.name}/birth_death",
+                             method="tau_leap", epsilon=2)
+
+    def test_time_budget(self):
+        # Output is written up to the time of interruption
+        test_mod = importlib.import_module('.models.birth_death', 'tests')
+        out_prefix = f"{self.tempdir.name}/birth_death"
+        with self.assertRaises(pt.SimulationInterrupted):
+            test_mod.execute(out_prefix, time_budget=0)
+        result = pd.read_csv(f"{out_prefix}_counts.tsv", sep="\t")
+        self.assertGreater(len(result), 0)
+        self.assertLess(result.time.max(), 200)
+        # In-memory results up to the time of interruption come with the
+        # exception
+        with self.assertRaises(pt.SimulationInterrupted) as context:
+            test_mod.execute(None, time_budget=0)
+        partial = context.exception.result
+        self.assertGreater(len(partial.time), 0)
+        self.assertLess(partial.time.max(), 200)
+        self.assertEqual(partial.protein.shape,
+                         (len(partial.species), len(partial.time)))
+
+    def test_cancellation(self):
+        test_mod = importlib.import_module('.models.birth_death', 'tests')
+        out_prefix = f"{self.tempdir.name}/birth_death"
+        token = pt.CancellationToken()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(test_mod.execute, out_prefix,
+                                     time_limit=10**6, cancel=token)
+            time.sleep(0.1)
+            token.cancel()
+            with self.assertRaises(pt.SimulationInterrupted):
+                future.result(timeout=10)
+        self.assertTrue(token.cancelled)
+
+    @unittest.skipUnless(hasattr(signal, "SIGUSR1"), "requires SIGUSR1")
+    def test_signal_interrupt(self):
+        # Exceptions raised by signal handlers stop the simulation
+        class Stop(Exception):
+            pass
+
+        def handler(signum, frame):
+            raise Stop()
+
+        test_mod = importlib.import_module('.models.birth_death', 'tests')
+        previous = signal.signal(signal.SIGUSR1, handler)
+        timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGUSR1))
+        try:
+            timer.start()
+            with self.assertRaises(Stop):
+                test_mod.execute(f"{self.tempdir.name}/birth_death",
+                                 time_limit=10**6)
+        finally:
+            timer.cancel()
+            signal.signal(signal.SIGUSR1, previous)
+
+    def resume(self, prefix, time_limit, **kwargs):
+        # Simulate to half of time_limit, save, and continue in a new model
+        test_mod = importlib.import_module('.models.' + prefix, 'tests')
+        out_prefix = f"{self.tempdir.name}/{prefix}"
+        method = kwargs.pop("method", "direct")
+        first = test_mod.build(**kwargs)
+        first.simulate(time_limit=time_limit // 2, time_step=1,
+                       output=out_prefix + "_first.tsv", method=method)
+        first.save_state(out_prefix + ".state")
+        second = test_mod.build(**kwargs)
+        second.load_state(out_prefix + ".state")
+        second.simulate(time_limit=time_limit, time_step=1,
+                        output=out_prefix + "_second.tsv", method=method)
+        full = test_mod.build(**kwargs)
+        full.simulate(time_limit=time_limit, time_step=1,
+                      output=out_prefix + "_full.tsv", method=method)
+        with open(out_prefix + "_first.tsv") as f:
+            lines = f.readlines()
+        with open(out_prefix + "_second.tsv") as f:
+            lines += f.readlines()[1:]
+        with open(out_prefix + "_full.tsv") as f:
+            self.assertEqual(lines, f.readlines())
+
+    def test_save_state(self):
+        # A restored simulation continues exactly like an uninterrupted one
+        for method in ['direct', 'tau_leap', 'next_reaction']:
+            self.resume('single_gene', 40, method=method)
+        self.resume('single_gene', 40, selection="tree", rng="pcg64")
+        self.resume('degrade_test', 200, method="next_reaction")
+
+    def test_clone(self):
+        # Copies continue like the original, independently of each other
+        test_mod = importlib.import_module('.models.degrade_test', 'tests')
+        full = test_mod.build()
+        full = full.simulate(time_limit=200, time_step=1, output=None)
+        sim = test_mod.build()
+        first = sim.simulate(time_limit=100, time_step=1, output=None)
+        copies = [sim.clone(), sim.clone().clone()]
+        for model in [sim] + copies:
+            second = model.simulate(time_limit=200, time_step=1, output=None)
+            self.assertEqual(first.species, full.species)
+            self.assertEqual(second.species, full.species)
+            self.assertTrue(np.array_equal(
+                np.hstack([first.protein, second.protein]), full.protein))
+
+    def test_register_transcript_after_simulating(self):
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        sim = test_mod.build()
+        sim.simulate(time_limit=20, time_step=1, output=None)
+        variant = sim.clone()
+        transcript = pt.Transcript("gfp", 100)
+        transcript.add_gene(name="GFP", start=21, stop=80, rbs_start=11,
+                            rbs_stop=21, rbs_strength=1e9)
+        variant.register_transcript(transcript)
+        result = variant.simulate(time_limit=40, time_step=1, output=None)
+        self.assertGreater(result.protein[result.species.index("GFP"), -1], 0)
+        result = sim.simulate(time_limit=40, time_step=1, output=None)
+        self.assertNotIn("GFP", result.species)
+        # Such states can only be copied with clone()
+        path = self.tempdir.name + "/variant.state"
+        variant.save_state(path)
+        with self.assertRaises(ValueError):
+            test_mod.build().load_state(path)
+
+    def test_register_transcripts(self):
+        def gfp():
+            transcript = pt.Transcript("gfp", 100)
+            transcript.add_gene(name="GFP", start=21, stop=80, rbs_start=11,
+                                rbs_stop=21, rbs_strength=1e7)
+            transcript.add_seq(seq="ATGC" * 25)
+            return transcript
+
+        def build():
+            sim = pt.Model(cell_volume=8e-16)
+            sim.seed(34)
+            sim.add_ribosome(copy_number=100, speed=30, footprint=10)
+            return sim
+
+        loop = build()
+        for _ in range(50):
+            loop.register_transcript(gfp())
+        bulk = build()
+        template = gfp()
+        bulk.register_transcripts(template, 50)
+        template.add_gene(name="RFP", start=81, stop=95, rbs_start=71,
+                          rbs_stop=81, rbs_strength=1e7)
+        expected = loop.simulate(time_limit=20, time_step=1, output=None)
+        result = bulk.simulate(time_limit=20, time_step=1, output=None)
+        self.assertEqual(result.species, expected.species)
+        self.assertTrue(np.array_equal(result.protein, expected.protein))
+        self.assertTrue(np.array_equal(result.ribo_density,
+                                       expected.ribo_density))
+        with self.assertRaises(ValueError):
+            bulk.register_transcripts(gfp(), -1)
+
+    def test_load_state_errors(self):
+        test_mod = importlib.import_module('.models.single_gene', 'tests')
+        path = self.tempdir.name + "/single_gene.state"
+        sim = test_mod.build()
+        sim.simulate(time_limit=10, time_step=1, output=None)
+        sim.save_state(path)
+        with self.assertRaises(RuntimeError):
+            sim.load_state(path)
+        other = pt.Model(cell_volume=8e-16)
+        other.add_species("A", 1)
+        with self.assertRaises(ValueError):
+            other.load_state(path)
+        with self.assertRaises(ValueError):
+            test_mod.build(rng="pcg64").load_state(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        with open(path, "wb") as f:
+            f.write(data[:len(data) // 2])
+        with self.assertRaises(RuntimeError):
+            test_mod.build().load_state(path)
+
     # def test_three_genes(self):
     #     self.run_test('three_genes')
 
@@ -0,0 +1,21 @@
+import pinetree as pt
+
+
+def execute(output, time_limit=200, **kwargs):
+
+    sim = pt.Model(cell_volume=8e-16)
+    sim.seed(1)
+    sim.add_species("A", 0)
+    # At steady state, A is Poisson distributed with mean 1000 / 1.5
+    sim.add_reaction(rate_constant=1000.0, reactants=[], products=["A"])
+    sim.add_reaction(rate_constant=1.0, reactants=["A"], products=[])
+    sim.add_reaction(rate_constant=0.5, reactants=["A"], products=["B"])
+
+    if output is not None:
+        output = output + "_counts.tsv"
+    return sim.simulate(time_limit=time_limit, time_step=1, output=output,
+                        **kwargs)
+
+
+if __name__ == "__main__":
+    execute("birth_death")
@@ -1,7 +1,7 @@
 import pinetree as pt
 
 
-def execute(output):
+def build():
 
     sim = pt.Model(cell_volume=8e-16)
     sim.seed(34)
@@ -36,8 +36,14 @@ def execute(output):
                      rbs_start=(220 - 10), rbs_stop=220, rbs_strength=1e7)
 
     sim.register_genome(plasmid)
+    return sim
 
-    sim.simulate(time_limit=500, time_step=1, output=output + "counts.tsv")
+
+def execute(output, method="direct"):
+
+    sim = build()
+    sim.simulate(time_limit=500, time_step=1, output=output + "counts.tsv",
+                 method=method)
 
 
 if __name__ == "__main__":
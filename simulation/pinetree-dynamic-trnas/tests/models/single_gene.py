@@ -1,10 +1,10 @@
 import pinetree as pt
 
 
-def execute(output):
+def build(stream=0, **kwargs):
 
-    sim = pt.Model(cell_volume=8e-16)
-    sim.seed(34)
+    sim = pt.Model(cell_volume=8e-16, **kwargs)
+    sim.seed(34, stream)
     sim.add_polymerase(name="rnapol", copy_number=1, speed=40, footprint=10)
     sim.add_ribosome(copy_number=1, speed=30, footprint=10)
 
@@ -23,8 +23,18 @@ def execute(output):
                      rbs_start=(296 - 15), rbs_stop=296, rbs_strength=1e7)
 
     sim.register_genome(plasmid)
+    return sim
 
-    sim.simulate(time_limit=40, time_step=1, output=output + "_counts.tsv")
+
+def execute(output, stream=0, method="direct", output_format="tsv",
+            sparse=False, observers=(), **kwargs):
+
+    sim = build(stream, **kwargs)
+    if output is not None:
+        output = output + "_counts." + output_format
+    return sim.simulate(time_limit=40, time_step=1, output=output,
+                        method=method, output_format=output_format,
+                        sparse=sparse, observers=list(observers))
 
 
 if __name__ == "__main__":
@@ -1,9 +1,20 @@
+#include <chrono>
+#include <functional>
+#include <iostream>
+#include <map>
+#include <sstream>
+
 #include "./lib/catch.hpp"
 #include "choices.hpp"
+#include "event_signal.hpp"
 #include "feature.hpp"
+#include "gillespie.hpp"
 #include "model.hpp"
 #include "polymer.hpp"
+#include "propensity_tree.hpp"
+#include "reaction_queue.hpp"
 #include "reaction.hpp"
+#include "state.hpp"
 #include "tracker.hpp"
 
 TEST_CASE("Genome construction")
@@ -125,3 +136,473 @@ TEST_CASE("Attach a polymerase to a registered genome")
     CHECK(plasmid->num_attached() == 1);
     REQUIRE(plasmid->attached_pol_start(0) == promoter_start);
 }
+
+TEST_CASE("PropensityTree sampling")
+{
+    PropensityTree tree;
+    tree.Push(1.0);
+    tree.Push(0.0);
+    tree.Push(2.0);
+    tree.Push(3.0);
+    tree.Push(4.0);
+    REQUIRE(tree.size() == 5);
+    REQUIRE(tree.total() == 10.0);
+
+    //Find should behave like std::upper_bound over cumulative sums
+    REQUIRE(tree.Find(0.0) == 0);
+    REQUIRE(tree.Find(0.999) == 0);
+    REQUIRE(tree.Find(1.0) == 2);
+    REQUIRE(tree.Find(2.999) == 2);
+    REQUIRE(tree.Find(3.0) == 3);
+    REQUIRE(tree.Find(9.999) == 4);
+
+    //Setting a leaf should update all partial sums
+    tree.Set(2, 0.0);
+    REQUIRE(tree.total() == 8.0);
+    REQUIRE(tree.Find(1.0) == 3);
+
+    //Popping the last leaf removes its propensity from the total
+    tree.Pop();
+    REQUIRE(tree.size() == 4);
+    REQUIRE(tree.total() == 4.0);
+
+    tree.Rebuild(std::vector<double>{5.0, 5.0});
+    REQUIRE(tree.size() == 2);
+    REQUIRE(tree.total() == 10.0);
+    REQUIRE(tree.Find(5.0) == 1);
+}
+
+TEST_CASE("ReactionQueue ordering")
+{
+    ReactionQueue queue;
+    queue.Push(5.0);
+    queue.Push(2.0);
+    queue.Push(8.0);
+    queue.Push(1.0);
+    REQUIRE(queue.size() == 4);
+    REQUIRE(queue.top() == 3);
+
+    //Changing a time moves the reaction within the queue
+    queue.Set(3, 9.0);
+    REQUIRE(queue.top() == 1);
+    queue.Set(2, 0.5);
+    REQUIRE(queue.top() == 2);
+    REQUIRE(queue.get(2) == 0.5);
+
+    //Pop removes the reaction with the highest index, wherever it is
+    queue.Pop();
+    REQUIRE(queue.size() == 3);
+    REQUIRE(queue.top() == 2);
+    queue.Set(2, 10.0);
+    REQUIRE(queue.top() == 1);
+    queue.Set(1, queue.get(2));
+    queue.Pop();
+    REQUIRE(queue.top() == 0);
+    REQUIRE(queue.get(1) == 10.0);
+}
+
+TEST_CASE("SpeciesTracker flags polymers that depend on charged tRNAs")
+{
+    SpeciesTracker tracker;
+    tracker.Increment("TTT_charged", 10);
+    tracker.Increment("ATA_charged", 10);
+    tracker.codon_map({{"AAA", {"TTT"}}, {"TAT", {"ATA"}}});
+    std::vector<std::string> reactants = {"TTT_uncharged"};
+    std::vector<std::string> products = {"TTT_charged"};
+    auto reaction = std::make_shared<SpeciesReaction>(1.0, 1.0, reactants,
+                                                      products);
+    int codon = tracker.codon_id("AAA");
+    tracker.AddCodonDependency(codon, reaction);
+
+    //Only changes in the tRNA species being read should flag the polymer
+    tracker.Increment("ATA_charged", -1);
+    REQUIRE(tracker.stale_reactions().empty());
+    tracker.Increment("TTT_charged", -1);
+    REQUIRE(tracker.stale_reactions().size() == 1);
+    REQUIRE(tracker.stale_reactions()[0] == reaction);
+
+    tracker.ClearStale();
+    tracker.RemoveCodonDependency(codon, reaction);
+    tracker.Increment("TTT_charged", 1);
+    REQUIRE(tracker.stale_reactions().empty());
+}
+
+TEST_CASE("SpeciesTracker keeps charged tRNA totals per codon")
+{
+    SpeciesTracker tracker;
+    tracker.Increment("TTT_charged", 10);
+    tracker.Increment("TTC_charged", 5);
+    tracker.Increment("ATA_charged", 7);
+    tracker.codon_map({{"AAA", {"TTT", "TTC"}}, {"TAT", {"ATA"}}});
+    REQUIRE(tracker.codon_count() == 2);
+    REQUIRE(tracker.codon_weight(tracker.codon_id("AAA")) == 15);
+    REQUIRE(tracker.codon_weight(tracker.codon_id("TAT")) == 7);
+    tracker.Increment("TTC_charged", -2);
+    tracker.Increment("TTC_uncharged", 2);
+    REQUIRE(tracker.codon_weight(tracker.codon_id("AAA")) == 13);
+    REQUIRE(tracker.codon_weight(tracker.codon_id("TAT")) == 7);
+    REQUIRE_THROWS_AS(tracker.codon_id("GGG"), std::runtime_error);
+}
+
+TEST_CASE("SpeciesTracker interns species names")
+{
+    SpeciesTracker tracker;
+    int id = tracker.Intern("proteinX");
+    REQUIRE(tracker.Intern("proteinX") == id);
+    REQUIRE(tracker.Intern("proteinY") == id + 1);
+    REQUIRE(tracker.species_name(id) == "proteinX");
+    REQUIRE_THROWS_AS(tracker.species("proteinX"), std::runtime_error);
+    tracker.Increment(id, 3);
+    tracker.Increment("proteinX", 2);
+    REQUIRE(tracker.species(id) == 5);
+    REQUIRE(tracker.species("proteinX") == 5);
+    // Names that are interned but never counted are not reported
+    REQUIRE(tracker.GatherCounts(0).find("proteinY") == std::string::npos);
+    REQUIRE(tracker.GatherCounts(0) ==
+            "0.000000\tproteinX\t5.000000\t0.000000\t0.000000\t0.000000\n");
+}
+
+TEST_CASE("SpeciesTracker gathers counts sorted by name")
+{
+    SpeciesTracker tracker;
+    std::vector<SpeciesCounts> counts;
+    tracker.Increment("rnapol", 2);
+    tracker.InitializeCollision("rnapol");
+    tracker.GatherCounts(counts);
+    REQUIRE(counts.size() == 1);
+    // Species added later are reported in name order
+    tracker.Increment("proteinX", 4);
+    tracker.IncrementTranscript("geneA", 2);
+    tracker.IncrementRibo("geneA", 3);
+    tracker.IncrementCollision("rnapol");
+    tracker.GatherCounts(counts);
+    REQUIRE(counts.size() == 3);
+    REQUIRE(tracker.species_name(counts[0].species) == "geneA");
+    REQUIRE(tracker.species_name(counts[1].species) == "proteinX");
+    REQUIRE(tracker.species_name(counts[2].species) == "rnapol");
+    REQUIRE(counts[0].transcript == 2);
+    REQUIRE(counts[0].ribo_density == Approx(1.5));
+    REQUIRE(counts[1].protein == 4);
+    REQUIRE(counts[2].collisions == 1);
+    REQUIRE(tracker.GatherCounts(1.5) ==
+            "1.500000\tgeneA\t0.000000\t2.000000\t1.500000\t0.000000\n"
+            "1.500000\tproteinX\t4.000000\t0.000000\t0.000000\t0.000000\n"
+            "1.500000\trnapol\t2.000000\t0.000000\t0.000000\t1.000000\n");
+    tracker.ResetCollision();
+    tracker.GatherCounts(counts);
+    REQUIRE(counts[2].collisions == 0);
+}
+
+TEST_CASE("Random number engines and streams")
+{
+    for (std::string engine : {"mt19937", "xoshiro256++", "pcg64"}) {
+        Random::Generator first, second, other_stream;
+        first.engine(engine);
+        second.engine(engine);
+        other_stream.engine(engine);
+        first.seed(34, 1);
+        second.seed(34, 1);
+        other_stream.seed(34, 2);
+        bool all_equal = true;
+        bool any_different = false;
+        for (int i = 0; i < 100; i++) {
+            double x = first.random();
+            REQUIRE(x >= 0.0);
+            REQUIRE(x < 1.0);
+            all_equal = all_equal && (x == second.random());
+            any_different = any_different || (x != other_stream.random());
+        }
+        REQUIRE(all_equal);
+        REQUIRE(any_different);
+    }
+    //Stream 0 of mt19937 matches seeding std::mt19937 directly
+    Random::Generator rng;
+    rng.seed(34);
+    std::mt19937 gen(34);
+    std::uniform_real_distribution<> dis(0, 1);
+    REQUIRE(rng.random() == dis(gen));
+
+    //Known answers, checked against reference implementations (numpy's
+    //PCG64 for pcg64)
+    Random::Pcg64 pcg;
+    pcg.seed(34, 5);
+    REQUIRE(pcg() == 8862018089697240134ULL);
+    Random::Xoshiro256PlusPlus xoshiro;
+    xoshiro.seed(34);
+    REQUIRE(xoshiro() == 17357523169587549165ULL);
+    xoshiro.seed(34);
+    xoshiro.jump();
+    REQUIRE(xoshiro() == 10356398735124813500ULL);
+
+    //Poisson draws have the right mean and variance for both samplers
+    for (double mean : {3.0, 50.0}) {
+        double sum = 0;
+        double sum_squares = 0;
+        int n = 20000;
+        for (int i = 0; i < n; i++) {
+            int k = rng.Poisson(mean);
+            sum += k;
+            sum_squares += double(k) * k;
+        }
+        double sample_mean = sum / n;
+        double sample_var = sum_squares / n - sample_mean * sample_mean;
+        REQUIRE(std::abs(sample_mean / mean - 1) < 0.03);
+        REQUIRE(std::abs(sample_var / mean - 1) < 0.1);
+    }
+    REQUIRE(rng.Poisson(0) == 0);
+
+    REQUIRE_THROWS_AS(rng.engine("mt19938"), std::invalid_argument);
+    REQUIRE_THROWS_AS(rng.seed(34, -1), std::invalid_argument);
+}
+
+TEST_CASE("Gillespie keeps reaction indices consistent")
+{
+    SpeciesTracker tracker;
+    Gillespie gillespie;
+    gillespie.tracker(&tracker);
+    tracker.Increment("A", 1);
+    std::vector<std::string> reactants = {"A"};
+    std::vector<std::string> products = {};
+    Reaction::VecPtr reactions;
+    for (int i = 0; i < 4; i++) {
+        auto reaction = std::make_shared<SpeciesReaction>(1.0, 1.0, reactants,
+                                                          products, &tracker);
+        gillespie.LinkReaction(reaction);
+        reactions.push_back(reaction);
+    }
+    REQUIRE(reactions[0]->index() == 0);
+    REQUIRE(reactions[3]->index() == 3);
+    gillespie.DeleteReaction(1);
+    REQUIRE_NOTHROW(gillespie.CheckConsistency());
+    REQUIRE(reactions[0]->index() == 0);
+    REQUIRE(reactions[3]->index() == 1);
+    REQUIRE(reactions[2]->index() == 2);
+    //Deleting the last reaction leaves the others in place
+    gillespie.DeleteReaction(2);
+    REQUIRE(reactions[0]->index() == 0);
+    REQUIRE(reactions[3]->index() == 1);
+    REQUIRE_NOTHROW(gillespie.CheckConsistency());
+    REQUIRE_THROWS_AS(gillespie.DeleteReaction(2), std::range_error);
+
+    REQUIRE_THROWS_AS(gillespie.method("euler"), std::invalid_argument);
+    REQUIRE_THROWS_AS(gillespie.epsilon(0), std::invalid_argument);
+
+    //A reaction whose stored index is wrong is reported
+    reactions[3]->index(0);
+    REQUIRE_THROWS_AS(gillespie.CheckConsistency(), std::logic_error);
+}
+
+TEST_CASE("State files round trip and reject truncation")
+{
+    std::stringstream stream;
+    StateWriter out(stream);
+    out.Section("values");
+    out.Write(0.1);
+    out.Write<int32_t>(-7);
+    out.Write(std::string("rnapol"));
+    out.Write(std::vector<double>{1.5, 2.5});
+    auto polymer = std::make_shared<Transcript>("transcript", 100);
+    out.AddPolymer(nullptr);
+    out.AddPolymer(polymer);
+    out.WritePolymer(polymer);
+    out.WritePolymer(nullptr);
+    out.Close();
+    std::string data = stream.str();
+
+    std::stringstream copy(data);
+    StateReader in(copy);
+    in.Section("values");
+    REQUIRE(in.Read<double>() == 0.1);
+    REQUIRE(in.Read<int32_t>() == -7);
+    REQUIRE(in.ReadString() == "rnapol");
+    REQUIRE(in.ReadVector<double>() == std::vector<double>{1.5, 2.5});
+    in.AddPolymer(nullptr);
+    in.AddPolymer(polymer);
+    REQUIRE(in.ReadPolymer() == polymer);
+    REQUIRE(in.ReadPolymer() == nullptr);
+    REQUIRE_NOTHROW(in.Close());
+
+    std::stringstream truncated(data.substr(0, data.size() - 2));
+    StateReader short_in(truncated);
+    short_in.Section("values");
+    short_in.Read<double>();
+    short_in.Read<int32_t>();
+    short_in.ReadString();
+    short_in.ReadVector<double>();
+    short_in.AddPolymer(polymer);
+    //IDs must refer to added polymers
+    REQUIRE_THROWS_AS(short_in.ReadPolymer(), std::runtime_error);
+    REQUIRE_THROWS_AS(short_in.Close(), std::runtime_error);
+    std::stringstream other("not a state");
+    REQUIRE_THROWS_AS(StateReader{other}, std::runtime_error);
+}
+
+TEST_CASE("Transcript copies share sequence and element layout")
+{
+    auto transcript = std::make_shared<Transcript>("transcript", 30);
+    transcript->AddGene("proteinX", 10, 27, 1, 9, 1e7);
+    transcript->AddSequence(std::string(30, 'A'));
+    auto copy = transcript->Clone();
+    REQUIRE(copy->sequence() == transcript->sequence());
+    REQUIRE(copy->bindings() == transcript->bindings());
+    auto rbs = transcript->GetBindingIntervals()[0].value;
+    auto copy_rbs = copy->GetBindingIntervals()[0].value;
+    REQUIRE(copy_rbs != rbs);
+    REQUIRE(copy_rbs->name() == "__proteinX_rbs");
+    //Covering state and modified properties belong to each copy
+    copy_rbs->Cover();
+    copy_rbs->gene("proteinY");
+    REQUIRE(!rbs->IsCovered());
+    REQUIRE(rbs->gene() == "proteinX");
+    copy->AddGene("proteinZ", 10, 27, 1, 9, 1e7);
+    REQUIRE(copy->bindings().size() == 2);
+    REQUIRE(transcript->bindings().size() == 1);
+}
+
+TEST_CASE("SiteIndex finds site positions across words")
+{
+    std::vector<Interval<BindingSite::Ptr>> binding;
+    auto rbs = std::make_shared<BindingSite>(
+        "rbs", 60, 70, std::map<std::string, double>{{"__ribosome", 1.0}});
+    binding.emplace_back(60, 70, rbs);
+    std::vector<Interval<ReleaseSite::Ptr>> release;
+    auto stop = std::make_shared<ReleaseSite>(
+        "stop", 199, 200, std::map<std::string, double>{{"__ribosome", 1.0}});
+    release.emplace_back(199, 200, stop);
+    SiteIndex index(1, 300, binding, release);
+    REQUIRE(index.BindingStart(60, 60));
+    REQUIRE(index.BindingStart(1, 300));
+    REQUIRE(!index.BindingStart(61, 300));
+    REQUIRE(!index.BindingStart(59, 59));
+    REQUIRE(index.SiteStop(70, 70));
+    REQUIRE(index.SiteStop(71, 200));
+    REQUIRE(!index.SiteStop(71, 199));
+    REQUIRE(index.ReleaseOverlap(185, 199));
+    REQUIRE(index.ReleaseOverlap(200, 230));
+    REQUIRE(!index.ReleaseOverlap(1, 198));
+    REQUIRE(!index.ReleaseOverlap(201, 400));
+    //Positions outside the polymer hold no sites
+    REQUIRE(!index.SiteStop(-100, 0));
+    REQUIRE(!index.BindingStart(5, 4));
+}
+
+TEST_CASE("Mobile element kinds follow reserved names")
+{
+    REQUIRE(Polymerase("rnapol", 10, 30).kind() ==
+            MobileElement::Kind::kPolymerase);
+    REQUIRE(Polymerase("__ribosome", 10, 30).kind() ==
+            MobileElement::Kind::kRibosome);
+    REQUIRE(Rnase(10, 20).kind() == MobileElement::Kind::kRnase);
+    REQUIRE(Mask(10, 20, {}).kind() == MobileElement::Kind::kMask);
+    //Copies keep the kind and species ID
+    Polymerase pol("rnapol", 10, 30);
+    pol.species_id(3);
+    Polymerase copy(pol);
+    REQUIRE(copy.kind() == MobileElement::Kind::kPolymerase);
+    REQUIRE(copy.species_id() == 3);
+}
+
+TEST_CASE("Sequences encode the codon at each position")
+{
+    Sequence seq("ATGTAAxTG");
+    REQUIRE(seq.codon(0) == Sequence::Encode("ATG"));
+    REQUIRE(seq.codon(3) == Sequence::Encode("TAA"));
+    REQUIRE(Sequence::IsStop(seq.codon(3)));
+    REQUIRE(Sequence::IsStop(Sequence::Encode("TAG")));
+    REQUIRE(Sequence::IsStop(Sequence::Encode("TGA")));
+    REQUIRE(!Sequence::IsStop(seq.codon(0)));
+    //Positions that do not start three A, C, G, or T have no codon
+    REQUIRE(seq.codon(4) == Sequence::kNoCodon);
+    REQUIRE(seq.codon(7) == Sequence::kNoCodon);
+    REQUIRE(Sequence::Encode("AAAA") == Sequence::kNoCodon);
+    REQUIRE(Sequence::Encode("AAA") == 0);
+    REQUIRE(Sequence::Encode("TTT") == 63);
+}
+
+TEST_CASE("SpeciesTracker charges tRNAs by codon")
+{
+    SpeciesTracker tracker;
+    tracker.Increment("TTT_charged", 0);
+    tracker.Increment("TTT_uncharged", 0);
+    tracker.Increment("CTT_charged", 3);
+    tracker.Increment("CTT_uncharged", 0);
+    tracker.codon_map({{"AAA", {"TTT", "CTT"}}, {"GAA", {"CTT"}}});
+    int codon = tracker.codon_id(Sequence::Encode("AAA"));
+    REQUIRE(codon == tracker.codon_id("AAA"));
+    REQUIRE(tracker.codon_id(Sequence::Encode("CCC")) == -1);
+    REQUIRE(tracker.codon_id(Sequence::kNoCodon) == -1);
+    //Only charged tRNAs can be chosen
+    tracker.ConsumetRNA(codon);
+    REQUIRE(tracker.species("CTT_charged") == 2);
+    REQUIRE(tracker.species("CTT_uncharged") == 1);
+    REQUIRE(tracker.codon_weight(codon) == 2);
+    tracker.ConsumetRNA(tracker.codon_id("GAA"));
+    tracker.ConsumetRNA(codon);
+    REQUIRE_THROWS_AS(tracker.ConsumetRNA(codon), std::runtime_error);
+}
+
+namespace {
+struct Receiver {
+    long total = 0;
+    void Receive(const std::shared_ptr<int> &value) { total += *value; }
+    void Double(const std::shared_ptr<int> &value) { total += 2 * *value; }
+};
+}  // namespace
+
+TEST_CASE("Signals call connected members in order")
+{
+    Signal<const std::shared_ptr<int> &> signal;
+    Receiver receiver;
+    auto value = std::make_shared<int>(3);
+    int id = signal.ConnectMember<Receiver, &Receiver::Receive>(&receiver);
+    signal.ConnectMember<Receiver, &Receiver::Double>(&receiver);
+    signal.Emit(value);
+    REQUIRE(receiver.total == 9);
+    //Emitting a const reference does not copy the shared_ptr
+    REQUIRE(value.use_count() == 1);
+    signal.Disconnect(id);
+    signal.Emit(value);
+    REQUIRE(receiver.total == 15);
+    //Copies start without connections
+    auto copy = signal;
+    copy.Emit(value);
+    REQUIRE(receiver.total == 15);
+    signal.DisconnectAll();
+    signal.Emit(value);
+    REQUIRE(receiver.total == 15);
+}
+
+// Hidden benchmark, run with: pinetree_test "[benchmark]"
+TEST_CASE("Signal emit cost", "[.][benchmark]")
+{
+    const int events = 20000000;
+    auto value = std::make_shared<int>(1);
+    Receiver receiver;
+    //Signals used to keep std::functions in a map and copy each slot and
+    //argument on every emit
+    std::map<int, std::function<void(std::shared_ptr<int>)>> slots;
+    slots[1] = [&receiver](std::shared_ptr<int> value) {
+        receiver.Receive(value);
+    };
+    auto start = std::chrono::steady_clock::now();
+    for (int i = 0; i < events; i++) {
+        for (auto it : slots) {
+            it.second(value);
+        }
+    }
+    std::chrono::duration<double, std::nano> old_time =
+        std::chrono::steady_clock::now() - start;
+    Signal<const std::shared_ptr<int> &> signal;
+    signal.ConnectMember<Receiver, &Receiver::Receive>(&receiver);
+    start = std::chrono::steady_clock::now();
+    for (int i = 0; i < events; i++) {
+        signal.Emit(value);
+    }
+    std::chrono::duration<double, std::nano> new_time =
+        std::chrono::steady_clock::now() - start;
+    REQUIRE(receiver.total == 2L * events);
+    std::cout << "std::function map: " << old_time.count() / events
+              << " ns/event" << std::endl;
+    std::cout << "Signal:            " << new_time.count() / events
+              << " ns/event" << std::endl;
+}
@@ -4,6 +4,8 @@ import shutil
 import filecmp
 import pinetree as pt
 import yaml
+import numpy as np
+import pandas as pd
 from trnasimtools.serialize import SerializeTwoCodonSingleTranscript
 from trnasimtools.simulate import SimulateTwoCodonSingleTranscript
 
@@ -87,4 +89,36 @@ def test_transcript_off_by_one_bug():
     with open(f"{tmpdir}/{serializer.filename()}", "r") as stream:
         config = yaml.safe_load(stream)
         assert len(config["transcript_data"][0]["transcript_seq"]) == 350
-    shutil.rmtree(tmpdir)
\ No newline at end of file
+    shutil.rmtree(tmpdir)
+
+
+def test_in_memory_result():
+    """
+    Simulating without an output directory returns the counts that would have
+    been written to the output file.
+    """
+    tmpdir = tempfile.mkdtemp()
+    serializer = SerializeTwoCodonSingleTranscript(transcript_len=100,
+                                                   codon_comp=(0.1, 0.9),
+                                                   trna_proportion=TRNA_PROPORTIONS,
+                                                   transcript_copy_number=TS_COPY,
+                                                   ribosome_binding_rate=RBS_STRENGTH,
+                                                   ribosome_copy_number=RB_COPY,
+                                                   total_trna=TOTAL_TRNA,
+                                                   trna_charging_rates=TRNA_CHRG_RATES,
+                                                   time_limit=TIME_LIMIT,
+                                                   time_step=TIME_STEP)
+    serializer.serialize(tmpdir)
+    config = f"{tmpdir}/{serializer.filename()}"
+    simulator = SimulateTwoCodonSingleTranscript(config_file=config, seed=SEED)
+    simulator.simulate(tmpdir)
+    expected = pd.read_csv(f"{tmpdir}/{simulator.filename()}", sep="\t")
+    result = SimulateTwoCodonSingleTranscript(config_file=config, seed=SEED).simulate(None)
+    times = sorted(expected.time.unique())
+    np.testing.assert_allclose(result.time, times, atol=1e-6)
+    for species in ["proteinX", "TTT_charged", "ATA_uncharged"]:
+        row = result.species.index(species)
+        counts = expected[expected.species == species]
+        columns = np.searchsorted(times, counts.time)
+        assert list(result.protein[row, columns]) == list(counts.protein)
+    shutil.rmtree(tmpdir)
@@ -9,16 +9,12 @@ def add_transcripts(ribosome_params,
     ribosome_footprint = ribosome_params[1]
     # convert CDS length to nt and add 50 nt buffer (30 upstream, 20 downstream)
     transcript_len = transcript_data["transcript_len"] * 3 + 50
-    i = 0
-    # pinetree can only add one transcript at a time for some reason, so do this in a loop
-    while i < transcript_copy_number:
-        transcript = pt.Transcript("transcript", transcript_len)
-        transcript.add_gene(name=transcript_data["transcript_name"], start=31, stop=transcript_len - 20,
-                            rbs_start=(31 - ribosome_footprint), rbs_stop=31, 
-                            rbs_strength=ribosome_binding_rate)
-        transcript.add_seq(seq=transcript_data["transcript_seq"])
-        model.register_transcript(transcript)
-        i += 1
+    transcript = pt.Transcript("transcript", transcript_len)
+    transcript.add_gene(name=transcript_data["transcript_name"], start=31, stop=transcript_len - 20,
+                        rbs_start=(31 - ribosome_footprint), rbs_stop=31, 
+                        rbs_strength=ribosome_binding_rate)
+    transcript.add_seq(seq=transcript_data["transcript_seq"])
+    model.register_transcripts(transcript, transcript_copy_number)
 
 def add_two_trna_species(simulation_data,
                          total_trna,
@@ -43,13 +43,13 @@ class SimulateSingleCodonSingleTranscript():
     def filename(self):
         return self._format_filename()
 
-    def simulate(self, output_dir: str, time_limit: int, time_step: float):
+    def simulate(self, output_dir: Optional[str], time_limit: int, time_step: float):
         self.model.seed(self.seed)
         self._add_transcripts()
         self._add_trna()
         self._add_ribosomes()
-        outfile = self._format_filename()
-        self.model.simulate(time_limit=time_limit, time_step=time_step, output=f"{output_dir}/{outfile}")
+        output = None if output_dir is None else f"{output_dir}/{self._format_filename()}"
+        return self.model.simulate(time_limit=time_limit, time_step=time_step, output=output)
 
         
 class SimulateTwoCodonSingleTranscript():
@@ -111,7 +111,7 @@ class SimulateTwoCodonSingleTranscript():
     def filename(self):
         return self._format_filename()
 
-    def simulate(self, output_dir: str, time_limit: Optional[int] = None, time_step: Optional[float] = None):
+    def simulate(self, output_dir: Optional[str], time_limit: Optional[int] = None, time_step: Optional[float] = None):
         if time_limit is None:
             time_limit = self.simulation_data["time_limit"]
         if time_step is None:
@@ -120,8 +120,8 @@ class SimulateTwoCodonSingleTranscript():
         self._add_transcripts()
         self._add_trna()
         self._add_ribosomes()
-        outfile = self._format_filename()
-        self.model.simulate(time_limit=time_limit, time_step=time_step, output=f"{output_dir}/{outfile}")
+        output = None if output_dir is None else f"{output_dir}/{self._format_filename()}"
+        return self.model.simulate(time_limit=time_limit, time_step=time_step, output=output)
 
 
 class SimulateTwoCodonMultiTranscript():
@@ -189,7 +189,7 @@ class SimulateTwoCodonMultiTranscript():
     def filename(self):
         return self._format_filename()
 
-    def simulate(self, output_dir: str, time_limit: Optional[int] = None, time_step: Optional[float] = None):
+    def simulate(self, output_dir: Optional[str], time_limit: Optional[int] = None, time_step: Optional[float] = None):
         if time_limit is None:
             time_limit = self.simulation_data["time_limit"]
         if time_step is None:
@@ -198,5 +198,5 @@ class SimulateTwoCodonMultiTranscript():
         self._add_transcripts()
         self._add_trna()
         self._add_ribosomes()
-        outfile = self._format_filename()
-        self.model.simulate(time_limit=time_limit, time_step=time_step, output=f"{output_dir}/{outfile}")
+        output = None if output_dir is None else f"{output_dir}/{self._format_filename()}"
+        return self.model.simulate(time_limit=time_limit, time_step=time_step, output=output)